@@ -0,0 +1,25 @@
+# Integer arithmetic in counting and conditional loops
+
+def gcd(a, b):
+    while b != 0:
+        t = b
+        b = a % b
+        a = t
+    return a
+
+total = 0
+for i in range(1, 200):
+    total = total + i * i - i % 7
+print(str(total))
+
+n = 27
+steps = 0
+while n != 1:
+    if n % 2 == 0:
+        n = n >> 1
+    else:
+        n = 3 * n + 1
+    steps = steps + 1
+print(str(steps))
+
+print(str(gcd(1071, 462)))
@@ -0,0 +1,17 @@
+# Classes, constructors and method calls
+
+class Counter:
+    def __init__(self):
+        pass
+
+    def describe(self, value):
+        return "value %s" % value
+
+def make_label(index):
+    return "item-%s" % index
+
+counter = Counter()
+i = 0
+while i < 20:
+    print(counter.describe(make_label(i)))
+    i = i + 1
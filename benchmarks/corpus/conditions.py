@@ -0,0 +1,23 @@
+# Nested conditions, boolean operators and comparisons
+
+def classify(n):
+    if n < 0:
+        return "negative"
+    elif n == 0:
+        return "zero"
+    elif n < 10:
+        if n % 2 == 0:
+            return "small even"
+        return "small odd"
+    elif n < 100 and not n % 5 == 0:
+        return "medium"
+    elif n >= 100 or n == 50:
+        return "large"
+    return "round"
+
+for n in range(-2, 120, 7):
+    print("%s: %s" % (n, classify(n)))
+
+word = "batch"
+if word == "batch" and len(word) > 3:
+    print("matched")
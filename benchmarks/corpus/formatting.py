@@ -0,0 +1,27 @@
+# String building, formatting and slicing
+
+def banner(title):
+    return "== %s ==" % title
+
+def pad(text, width):
+    while len(text) < width:
+        text = text + " "
+    return text
+
+print("=" * 40)
+print(banner("report"))
+print("=" * 40)
+names = ("alpha", "beta", "gamma", "delta")
+for name in names:
+    print("[%s] %s" % (pad(name, 8), name[0:3]))
+
+text = "the quick brown fox jumps over the lazy dog"
+count = 0
+i = 0
+while i < len(text):
+    if text[i] == "o":
+        count = count + 1
+    i = i + 1
+print("o: %s" % count)
+print(text[-8:])
+print(text[::-1])
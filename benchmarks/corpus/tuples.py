@@ -0,0 +1,17 @@
+# Tuple literals, iteration and indexing
+
+colors = ("red", "green", "blue", "cyan", "magenta", "yellow")
+for color in colors:
+    print(color)
+
+pairs = (1, 2, 3, 4, 5, 6, 7, 8)
+total = 0
+for value in pairs:
+    total = total + value
+print(str(total))
+
+for size in (8, 16, 32):
+    print("size %s" % size)
+
+print(colors[2])
+print(str(len(colors)))
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+'''
+Benchmarks of pytoshell: compile a corpus of python programs and record how
+long the translation takes and how large the generated scripts are.
+
+    python benchmarks/run.py -o results.json
+    python benchmarks/run.py compare old.json new.json
+
+Batch scripts are also executed by the cmd.exe subset emulator, to count
+the commands they run and check their output against CPython's. Programs
+it can't run only get the static metrics.
+'''
+
+import argparse
+import datetime
+import gc
+import glob
+import io
+import json
+import os.path
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.abspath(os.path.dirname(__file__))
+CORPUS_DIR = os.path.join(BENCHMARKS_DIR, "corpus")
+
+# Measure the tree the benchmarks are in, not an installed pytoshell
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "src"))
+
+from pytoshell import emulator
+from pytoshell.compiler import Compiler, get_translator_class
+from pytoshell.translator.linker import Library
+from pytoshell.translator.peephole import count_commands
+
+FORMAT_VERSION = 1
+
+# Metrics of a program, all of them are better when lower
+METRICS = [
+    "translate_seconds",
+    "peak_memory_bytes",
+    "lines",
+    "bytes",
+    "routines",
+    "commands",
+    "executed_commands",
+    "label_scan_bytes",
+]
+
+# Metrics that vary from run to run, only changes over the threshold count
+NOISY_METRICS = ["translate_seconds", "peak_memory_bytes"]
+
+DEFAULT_THRESHOLD = 25.0
+
+def generate_large_module(function_count=200):
+    '''
+    Return the source of a module with many small functions calling each
+    other, like modules generated by other tools.
+    '''
+
+    lines = []
+    for i in range(function_count):
+        lines.append("def step%s(value, limit):" % i)
+        lines.append("    if value > limit:")
+        lines.append("        return value - limit")
+        lines.append("    while value < limit:")
+        lines.append("        value = value * 2 + %s" % (i % 7 + 1))
+        lines.append("    return value")
+        lines.append("")
+
+    lines.append("total = 0")
+    for i in range(function_count):
+        lines.append("total = total + step%s(%s, %s)" % (i, i, i * 3 + 1))
+    lines.append('print("total %s" % total)')
+    return "\n".join(lines) + "\n"
+
+def load_corpus():
+    '''
+    Return (name, source) of the programs to compile.
+    '''
+
+    programs = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.py"))):
+        with io.open(path, "r") as source_file:
+            programs.append((
+                os.path.splitext(os.path.basename(path))[0], source_file.read()))
+    programs.append(("large_module", generate_large_module()))
+    return programs
+
+def load_library(type_):
+    translator = get_translator_class(type_)()
+    path = os.path.join(translator.get_module_path(),
+                        "site.%s" % translator.file_extensions[0])
+    if not os.path.exists(path):
+        return None
+
+    with io.open(path, "r") as library_file:
+        return Library([line.strip() for line in library_file])
+
+def count_routines(library, lines):
+    # Runtime routines linked into the script, each starts with its label
+    if library is None:
+        return 0
+
+    return len([x for x in lines if x.startswith(":")
+        and library.get_routine(x[1:].split()[0]) is not None])
+
+def run_python(source):
+    process = subprocess.Popen(
+        [sys.executable, "-"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        universal_newlines=True)
+    return process.communicate(source)[0]
+
+def execute(type_, script, source):
+    '''
+    Return the execution metrics of script, and if its output matches the
+    output of source run by CPython.
+    '''
+
+    if type_ != "bat":
+        return {}
+
+    try:
+        result = emulator.run(script)
+    except emulator.EmulatorError as e:
+        return {"error": str(e), "output_matches": False}
+
+    return {
+        "executed_commands": result.commands,
+        "label_scan_bytes": result.label_scan_bytes,
+        "output_matches": result.output == run_python(source),
+    }
+
+def measure(compiler, library, name, source, repeat):
+    file_path = "%s.py" % name
+
+    # The first translation also loads the runtime library, it's left out
+    script = compiler.compile_source(source, file_path)
+
+    # Like timeit, collections would add noise to the timings
+    timings = []
+    is_gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            start = time.perf_counter()
+            compiler.compile_source(source, file_path)
+            timings.append(time.perf_counter() - start)
+    finally:
+        if is_gc_enabled:
+            gc.enable()
+
+    tracemalloc.start()
+    try:
+        compiler.compile_source(source, file_path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    lines = script.split("\n")
+    metrics = {
+        "translate_seconds": min(timings),
+        "peak_memory_bytes": peak,
+        "lines": len(lines),
+        "bytes": len(script.encode("utf-8")),
+        "routines": count_routines(library, lines),
+        "commands": count_commands(lines),
+    }
+    metrics.update(execute(compiler.type_, script, source))
+    return metrics
+
+def run(type_, repeat, names=None):
+    compiler = Compiler(type_)
+    library = load_library(type_)
+
+    programs = {}
+    for name, source in load_corpus():
+        if names and name not in names:
+            continue
+        programs[name] = measure(compiler, library, name, source, repeat)
+
+    return {
+        "version": FORMAT_VERSION,
+        "type": type_,
+        "repeat": repeat,
+        "created": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "programs": programs,
+    }
+
+def format_value(metric, value):
+    if value is None:
+        return "-"
+    if metric == "translate_seconds":
+        return "%.2fms" % (value * 1000)
+    return str(value)
+
+def print_results(results):
+    print("%-16s %s %7s" % (
+        "program", " ".join(["%18s" % x for x in METRICS]), "output"))
+    for name in sorted(results["programs"].keys()):
+        program = results["programs"][name]
+        output = "-"
+        if "output_matches" in program:
+            output = "ok" if program["output_matches"] else "WRONG"
+        print("%-16s %s %7s" % (name, " ".join([
+            "%18s" % format_value(x, program.get(x)) for x in METRICS]), output))
+        if "error" in program:
+            print("    %s" % program["error"])
+
+def compare(old_results, new_results, threshold):
+    '''
+    Print the changes of each metric between two runs, return the
+    regressions as (program, metric, old value, new value).
+
+    Metrics that don't depend on the machine regress on any increase, time
+    and memory only on an increase over threshold percent. A program whose
+    output matched CPython's and no longer does regresses too.
+    '''
+
+    if old_results.get("type") != new_results.get("type"):
+        print("warning: comparing %s scripts to %s scripts" % (
+            old_results.get("type"), new_results.get("type")))
+
+    regressions = []
+    print("%-16s %-18s %14s %14s %9s" % ("program", "metric", "old", "new", "change"))
+    for name in sorted(new_results["programs"].keys()):
+        old_program = old_results["programs"].get(name)
+        if old_program is None:
+            print("%-16s (new program)" % name)
+            continue
+
+        new_program = new_results["programs"][name]
+        if old_program.get("output_matches") and not new_program.get("output_matches"):
+            regressions.append((name, "output_matches", True, False))
+            print("%-16s %-18s %14s %14s %9s  REGRESSION" % (
+                name, "output_matches", True, False, "-"))
+
+        for metric in METRICS:
+            old_value = old_program.get(metric)
+            new_value = new_program.get(metric)
+            if old_value is None or new_value is None:
+                continue
+
+            limit = old_value
+            if metric in NOISY_METRICS:
+                limit = old_value * (1 + threshold / 100.0)
+
+            change = "-"
+            if old_value != 0:
+                change = "%+.1f%%" % ((new_value - old_value) * 100.0 / old_value)
+
+            is_regression = new_value > limit
+            if is_regression:
+                regressions.append((name, metric, old_value, new_value))
+
+            print("%-16s %-18s %14s %14s %9s%s" % (
+                name, metric, format_value(metric, old_value),
+                format_value(metric, new_value), change,
+                "  REGRESSION" if is_regression else ""))
+
+    for name in sorted(set(old_results["programs"].keys()) - set(new_results["programs"].keys())):
+        print("%-16s (missing)" % name)
+
+    return regressions
+
+def load_results(path):
+    with io.open(path, "r") as results_file:
+        results = json.load(results_file)
+
+    if results.get("version") != FORMAT_VERSION:
+        raise ValueError("%s: unsupported results version %s" % (
+            path, results.get("version")))
+    return results
+
+def main(argv):
+    description = "Benchmark pytoshell translation over a corpus of programs"
+    if len(argv) > 0 and argv[0] == "compare":
+        parser = argparse.ArgumentParser(
+            prog="run.py compare",
+            description="Compare two benchmark results, exit with 1 on regressions")
+        parser.add_argument("old", help="Results of the baseline run (JSON)")
+        parser.add_argument("new", help="Results of the run to check (JSON)")
+        parser.add_argument("--threshold",
+                            help="Percent time and memory could grow by before "
+                                 "it's a regression (default: %s)" % DEFAULT_THRESHOLD,
+                            type=float,
+                            default=DEFAULT_THRESHOLD)
+        args = parser.parse_args(argv[1:])
+
+        regressions = compare(load_results(args.old), load_results(args.new),
+                              args.threshold)
+        if len(regressions) > 0:
+            print("%s regressions" % len(regressions))
+            return 1
+        return 0
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-t", "--type",
+                        help="Type of shellscript to generate (default: bat)",
+                        default="bat")
+    parser.add_argument("-o", "--output",
+                        help="Write the results to this file (JSON)")
+    parser.add_argument("-r", "--repeat",
+                        help="Translations timed per program, the fastest counts",
+                        type=int,
+                        default=5)
+    parser.add_argument("names", metavar="name", nargs="*",
+                        help="Only run these programs")
+    args = parser.parse_args(argv)
+
+    results = run(args.type, max(args.repeat, 1), args.names)
+    print_results(results)
+    if args.output is not None:
+        with io.open(args.output, "w") as results_file:
+            results_file.write(json.dumps(results, indent=2, sort_keys=True))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -43,7 +43,10 @@ setup(
     package_dir = {"": source_dir},
     packages=packages,
     entry_points = {
-        'console_scripts': ['pytoshell=pytoshell.console:main'],
+        'console_scripts': [
+            'pytoshell=pytoshell.console:main',
+            'pytoshell-emulator=pytoshell.emulator:main',
+        ],
     },
     zip_safe=False, # Unpack the egg downloaded_file during installation.
     )
@@ -0,0 +1,192 @@
+import hashlib
+import io
+import json
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+class CompileCache(object):
+    '''
+    On-disk cache of generated scripts, addressed by the hash of everything
+    that could change the output: the source, the script type, the translator
+    options and the code and runtime library of the translator.
+
+    Entries are plain files, their modification time records the last use so
+    the least recently used entries get evicted once the cache grows over
+    max_size bytes.
+    '''
+
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+    # Translator class -> fingerprint, computed once per process
+    _fingerprints = {}
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        if directory is None:
+            directory = self.get_default_directory()
+
+        self._directory = directory
+        self._max_size = max_size
+        self._size = None
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @classmethod
+    def get_default_directory(cls):
+        base_dir = os.environ.get("XDG_CACHE_HOME")
+        if not base_dir:
+            base_dir = os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base_dir, "pytoshell")
+
+    @classmethod
+    def get_fingerprint(cls, translator):
+        aclass = type(translator)
+        if aclass in cls._fingerprints:
+            return cls._fingerprints[aclass]
+
+        hasher = hashlib.sha256()
+        hasher.update(sys.version.encode("utf-8"))
+
+        # Every module of the translator package takes part in the
+        # generated code, so any of them changing invalidates the cache.
+        code_dir = os.path.dirname(os.path.abspath(sys.modules[aclass.__module__].__file__))
+        paths = [os.path.join(code_dir, x) for x in os.listdir(code_dir) if x.endswith(".py")]
+
+        data_dir = translator.get_module_path()
+        if os.path.isdir(data_dir):
+            for root, dirs, files in os.walk(data_dir):
+                paths += [os.path.join(root, x) for x in files]
+
+        for path in sorted(paths):
+            hasher.update(os.path.basename(path).encode("utf-8"))
+            with io.open(path, "rb") as afile:
+                hasher.update(afile.read())
+
+        fingerprint = hasher.hexdigest()
+        cls._fingerprints[aclass] = fingerprint
+        return fingerprint
+
+    def make_key(self, source, type_, translator, options):
+        hasher = hashlib.sha256()
+        hasher.update(self.get_fingerprint(translator).encode("utf-8"))
+        hasher.update(json.dumps([type_, options], sort_keys=True).encode("utf-8"))
+        hasher.update(source)
+        return hasher.hexdigest()
+
+    def _get_entry_path(self, key):
+        return os.path.join(self._directory, key[:2], key)
+
+    def get_path(self, key):
+        path = self._get_entry_path(key)
+        try:
+            # Mark the entry as recently used
+            os.utime(path, None)
+        except OSError:
+            return None
+
+        return path
+
+    def get(self, key):
+        path = self.get_path(key)
+        if path is None:
+            return None
+
+        try:
+            with io.open(path, "r", newline="") as entry_file:
+                return entry_file.read()
+        except (IOError, OSError):
+            return None
+
+    def put(self, key, content):
+        self._put(key, lambda afile: afile.write(content.encode("utf-8")))
+
+    def put_file(self, key, path):
+        with io.open(path, "rb") as source_file:
+            self._put(key, lambda afile: shutil.copyfileobj(source_file, afile))
+
+    def _put(self, key, write_func):
+        path = self._get_entry_path(key)
+        entry_dir = os.path.dirname(path)
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+
+            # Write to a temporary file first, other workers may read the same
+            # entry at the same time.
+            fd, temp_path = tempfile.mkstemp(dir=entry_dir)
+            try:
+                with io.open(fd, "wb") as entry_file:
+                    write_func(entry_file)
+                os.replace(temp_path, path)
+            except BaseException:
+                # Don't leave a partial entry behind, it would count towards
+                # the size but no key could read it
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+        except (IOError, OSError):
+            return
+
+        if self._size is None:
+            self._size = self._compute_size()
+        else:
+            self._size += os.path.getsize(path)
+
+        if self._size > self._max_size:
+            self.evict()
+
+    def _list_entries(self):
+        entries = []
+        if not os.path.isdir(self._directory):
+            return entries
+
+        for root, dirs, files in os.walk(self._directory):
+            for afile in files:
+                path = os.path.join(root, afile)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    def _compute_size(self):
+        return sum([x[1] for x in self._list_entries()])
+
+    def evict(self):
+        entries = sorted(self._list_entries())
+        size = sum([x[1] for x in entries])
+
+        # Drop least recently used entries until we are well below the
+        # bound, so we don't evict again after the next few insertions.
+        limit = self._max_size * 3 // 4
+        for mtime, entry_size, path in entries:
+            if size <= limit:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+
+        self._size = size
+
+    def clear(self):
+        for mtime, entry_size, path in self._list_entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        self._size = 0
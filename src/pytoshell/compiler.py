@@ -0,0 +1,279 @@
+import ast
+import filecmp
+import io
+import logging
+import multiprocessing
+import os
+import os.path
+import shutil
+import tempfile
+import traceback
+from .translator.bash import Translator as BashTranslator
+from .translator.batch import Translator as BatchTranslator
+from .translator.inliner import Inliner
+from .translator.modules import collect_digests
+from .translator.sh import Translator as ShTranslator
+
+translator_classes = [ShTranslator, BashTranslator, BatchTranslator]
+
+def get_translator_class(type_):
+    for aclass in translator_classes:
+        if type_ in aclass.file_extensions:
+            return aclass
+
+    raise KeyError("Unsupported shellscript type: %s" % type_)
+
+class CompileResult(object):
+    def __init__(self, file_path, output_path, error=None, stats=None):
+        self.file_path = file_path
+        self.output_path = output_path
+        self.error = error
+        self.stats = stats
+
+    @property
+    def is_succeeded(self):
+        return self.error is None
+
+class Compiler(object):
+    '''
+    Translates python sources to one type of shellscript.
+
+    A compiler keeps its translator (and the runtime library the translator
+    loaded) alive, so compiling many files with one compiler only pays the
+    start up cost once.
+    '''
+
+    def __init__(self, type_, is_bootstrap=False, is_dump=False, cache=None,
+                 layout="source", layout_profile=None,
+                 inline_threshold=Inliner.DEFAULT_THRESHOLD, is_collecting_stats=False):
+        self._type = type_
+        self._translator = get_translator_class(type_)()
+        self._translator.is_bootstrap = is_bootstrap
+        self._translator.layout = layout
+        self._translator.layout_profile = layout_profile
+        self._translator.inline_threshold = inline_threshold
+        self._translator.is_collecting_stats = is_collecting_stats
+        self._is_dump = is_dump
+        self._cache = cache
+
+        # Everything that changes the generated script besides the source
+        self._options = {
+            "bootstrap": is_bootstrap,
+            "layout": layout,
+            "layout_profile": layout_profile,
+            "inline_threshold": inline_threshold,
+        }
+
+    @property
+    def type_(self):
+        return self._type
+
+    @property
+    def stats(self):
+        '''
+        RoutineStats of the last translated source, if collecting them.
+        '''
+
+        return self._translator.stats
+
+    def _is_cacheable(self):
+        # Scripts from the cache aren't translated, there would be nothing
+        # to dump or to collect stats from
+        return (self._cache is not None and not self._is_dump
+                and not self._translator.is_collecting_stats)
+
+    def generate_source(self, source, file_path="<unknown>"):
+        ast_tree = ast.parse(source, file_path)
+        self._translator.source_path = None if file_path == "<unknown>" else file_path
+
+        if self._is_dump:
+            print("=== AST TREE BEGIN ===\n%s\n=== AST TREE END ===\n" % ast.dump(ast_tree))
+
+        return self._translator.generate(ast_tree)
+
+    def compile_source(self, source, file_path="<unknown>"):
+        return "\n".join(self.generate_source(source, file_path))
+
+    def compile_file(self, file_path, output_path):
+        with io.open(file_path, "rb") as source_file:
+            source = source_file.read()
+
+        if self._is_cacheable():
+            options = self._options
+            if b"import" in source:
+                # The script is linked with the local modules it imports
+                options = dict(options, modules=sorted(collect_digests(
+                    ast.parse(source, file_path),
+                    [os.path.dirname(os.path.abspath(file_path))]).items()))
+            key = self._cache.make_key(source, self._type, self._translator, options)
+            entry_path = self._cache.get_path(key)
+            if entry_path is not None:
+                copy_if_changed(entry_path, output_path)
+                return
+
+        # Stream the script to disk instead of building it in memory
+        temp_path = create_temp_file(output_path)
+        try:
+            with io.open(temp_path, "w") as script_file:
+                write_lines(script_file, self.generate_source(source, file_path))
+
+            if self._is_cacheable():
+                self._cache.put_file(key, temp_path)
+
+            replace_if_changed(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def try_compile_file(self, file_path, output_path):
+        try:
+            self.compile_file(file_path, output_path)
+        except Exception as e:
+            error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            return CompileResult(file_path, output_path, error)
+
+        return CompileResult(file_path, output_path, stats=list(self.stats))
+
+def write_lines(stream, lines):
+    is_first = True
+    for line in lines:
+        if not is_first:
+            stream.write("\n")
+        stream.write(line)
+        is_first = False
+
+def create_temp_file(path):
+    output_dir = os.path.dirname(path)
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(
+        prefix=".%s." % os.path.basename(path), dir=output_dir or None)
+    os.close(fd)
+    return temp_path
+
+def replace_if_changed(temp_path, path):
+    # Rewriting an identical script would only bump its modification time and
+    # trigger needless rebuilds of whatever depends on it.
+    if os.path.isfile(path) and filecmp.cmp(temp_path, path, shallow=False):
+        os.remove(temp_path)
+        return False
+
+    if os.path.exists(path):
+        shutil.copymode(path, temp_path)
+    else:
+        os.chmod(temp_path, 0o666 & ~_get_umask())
+    os.replace(temp_path, path)
+    return True
+
+def copy_if_changed(source_path, path):
+    if os.path.isfile(path) and filecmp.cmp(source_path, path, shallow=False):
+        return False
+
+    temp_path = create_temp_file(path)
+    try:
+        shutil.copyfile(source_path, temp_path)
+        replace_if_changed(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return True
+
+def _get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def get_output_path(file_path, type_, output_dir=None, relative_to=None):
+    output_path = "%s.%s" % (os.path.splitext(file_path)[0], type_)
+    if output_dir is None:
+        return output_path
+
+    if relative_to is None:
+        output_path = os.path.basename(output_path)
+    else:
+        output_path = os.path.relpath(output_path, relative_to)
+
+    return os.path.join(output_dir, output_path)
+
+def collect_jobs(paths, type_, output_dir=None):
+    '''
+    Expand input files and directory trees to (file_path, output_path) pairs.
+
+    Sources found in a directory tree keep their relative layout below
+    output_dir, sources given directly are placed at the top of it. Without
+    an output_dir every script is written next to its source.
+
+    Raise ValueError if two sources would be written to the same script.
+    '''
+
+    jobs = []
+    for path in paths:
+        if not os.path.isdir(path):
+            jobs.append((path, get_output_path(path, type_, output_dir)))
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for afile in sorted(files):
+                if os.path.splitext(afile)[1] != ".py":
+                    continue
+
+                file_path = os.path.join(root, afile)
+                jobs.append((file_path, get_output_path(
+                    file_path, type_, output_dir, path)))
+
+    sources = {}
+    for file_path, output_path in jobs:
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in sources:
+            raise ValueError("%s and %s are both compiled to %s" % (
+                sources[key], file_path, output_path))
+        sources[key] = file_path
+
+    return jobs
+
+_worker_compiler = None
+
+def _init_worker(type_, options):
+    global _worker_compiler
+    _worker_compiler = Compiler(type_, **options)
+
+def _compile_job(job):
+    return _worker_compiler.try_compile_file(*job)
+
+def compile_files(jobs, type_, processes=1, **options):
+    '''
+    Compile all (file_path, output_path) pairs and return a CompileResult for
+    each of them, in the same order.
+
+    processes is the size of the worker pool, 0 means one worker per CPU.
+    options are passed to the Compiler of every worker. Failures are reported
+    through the results and never abort the run.
+    '''
+
+    logger = logging.getLogger(__name__)
+
+    if processes <= 0:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+
+    if processes <= 1:
+        compiler = Compiler(type_, **options)
+        results = [compiler.try_compile_file(*job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(
+            processes, initializer=_init_worker, initargs=(type_, options))
+        try:
+            chunksize = max(1, len(jobs) // (processes * 4))
+            results = list(pool.imap(_compile_job, jobs, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+
+    for result in results:
+        if not result.is_succeeded:
+            logger.error("Failed to compile %s : %s", result.file_path, result.error)
+
+    return results
@@ -1,17 +1,15 @@
-
 #!/usr/bin/env python
 
 import argparse
-import re
+import json
 import sys
-import six
 import os.path
-import ast
-import io
 import logging
-import weakref
-from .translator.batch import Translator as BatchTranslator
-from .translator.sh import Translator as ShTranslator
+from .cache import CompileCache
+from .compiler import Compiler, collect_jobs, compile_files
+from .translator.inliner import Inliner
+from .translator.layout import load_profile
+from .translator.stats import RoutineStats, format_stats
 
 class Application(object):
     def __init__(self, argv):
@@ -19,9 +17,11 @@ class Application(object):
 
         parser = argparse.ArgumentParser(description=description)
         parser.add_argument("-t", "--type",
-            help="Generate to which type of shellscript (sh, bat)",
+            help="Generate to which type of shellscript (sh, bash, bat)",
             required=True)
-        parser.add_argument("-o", "--output", help="Output file path")
+        parser.add_argument("-o", "--output",
+                            help="Output file path, or output directory when "
+                                 "compiling several files or a directory")
         parser.add_argument("-b", "--bootstrap",
                             help="Bootstrap mode, don't import __init__ module",
                             action='store_true',
@@ -30,71 +30,129 @@ class Application(object):
                             help='Dump AST Tree',
                             action='store_true',
                             default=False)
-        parser.add_argument("file_path", help="Input file path")
+        parser.add_argument("-j", "--jobs",
+                            help="Number of worker processes used to compile "
+                                 "several files, 0 means one per CPU",
+                            type=int,
+                            default=1)
+        parser.add_argument("--layout",
+                            help="Order of functions and runtime routines in the "
+                                 "generated script: as in the source, or hot "
+                                 "callees right after their callers",
+                            choices=["source", "hot"],
+                            default="source")
+        parser.add_argument("--layout-profile",
+                            help="Call counts of a previous run (JSON), used "
+                                 "instead of the static estimate by --layout=hot")
+        parser.add_argument("--inline-threshold",
+                            help="Inline calls of functions up to this many "
+                                 "statement and expression nodes, 0 disables "
+                                 "inlining (default: %s)" % Inliner.DEFAULT_THRESHOLD,
+                            type=int,
+                            default=Inliner.DEFAULT_THRESHOLD)
+        parser.add_argument("--stats",
+                            help="Print the static cost of each function and "
+                                 "the module body of the generated scripts",
+                            action='store_true',
+                            default=False)
+        parser.add_argument("--stats-format",
+                            help="Format of the --stats report (default: text)",
+                            choices=["text", "json"],
+                            default="text")
+        parser.add_argument("--no-cache",
+                            help="Always translate, don't use the compile cache",
+                            action='store_true',
+                            default=False)
+        parser.add_argument("--cache-dir",
+                            help="Compile cache directory (default: %s)" % (
+                                CompileCache.get_default_directory()))
+        parser.add_argument("--cache-size",
+                            help="Compile cache size bound in MiB (default: %s)" % (
+                                CompileCache.DEFAULT_MAX_SIZE // (1024 * 1024)),
+                            type=int,
+                            default=CompileCache.DEFAULT_MAX_SIZE // (1024 * 1024))
+        parser.add_argument("file_paths", metavar="file_path", nargs="+",
+                            help="Input file paths or directories")
 
         self.__args = parser.parse_args(argv)
 
+        self.__is_batch = (len(self.__args.file_paths) > 1
+                           or os.path.isdir(self.__args.file_paths[0]))
+
         # If user does not specific output path, we default it to input file
         # path
-        if self.__args.output is None:
+        if (not self.__is_batch) and (self.__args.output is None):
             self.__args.output ="%s.%s" %(
-                os.path.splitext(self.__args.file_path)[0], self.__args.type)
+                os.path.splitext(self.__args.file_paths[0])[0], self.__args.type)
 
         self._logger = logging.getLogger(__name__)
 
-    def _mark_ast_tree(self, node):
-        if 'body' not in node.__dict__:
+    def _create_cache(self):
+        if self.__args.no_cache:
+            return None
+
+        return CompileCache(self.__args.cache_dir,
+                            self.__args.cache_size * 1024 * 1024)
+
+    def _print_stats(self, results):
+        if self.__args.stats_format == "json":
+            report = {"files": []}
+            for file_path, stats in results:
+                report["files"].append({
+                    "file_path": file_path,
+                    "routines": [x.to_dict() for x in stats],
+                    "total": RoutineStats.sum("(total)", stats).to_dict(),
+                })
+            print(json.dumps(report, indent=2))
             return
 
-        prev_sibling = None
-        next_sibling = None
-
-        node.__dict__["_children"] = node.body
-
-        for i in range(len(node.body)):
-            member = node.body[i]
-            if i < (len(node.body) - 1):
-                next_sibling = weakref.ref(node.body[i+1])
-            else:
-                next_sibling = None
-
-            if isinstance(member, ast.AST):
-                member.__dict__["_parent"] = weakref.ref(node)
-                member.__dict__["_prev_sibling"] = prev_sibling
-                member.__dict__["_next_sibling"] = next_sibling
-                member.__dict__["_children"] = []
-                self._mark_ast_tree(member)
-
-            prev_sibling = weakref.ref(member)
-
-    def mark_ast_tree(self, node):
-        node.__dict__["_parent"] = None
-        node.__dict__["_prev_sibling"] = None
-        node.__dict__["_next_sibling"] = None
-        node.__dict__["_children"] = []
-        self._mark_ast_tree(node)
+        for file_path, stats in results:
+            print("\n".join(format_stats(file_path, stats)))
 
     def exec_(self):
-        # Register translators
-        translator_classes = [ShTranslator, BatchTranslator]
-        translators = {}
-        for aclass in translator_classes:
-            for aext in aclass.file_extensions:
-                translators[aext] = aclass()
-                translators[aext].is_bootstrap = self.__args.bootstrap
-
-        translator = translators[self.__args.type]
-
-        with io.open(self.__args.file_path) as source_file:
-            ast_tree = ast.parse(source_file.read())
-            self.mark_ast_tree(ast_tree)
-
-            if self.__args.dump:
-                print("=== AST TREE BEGIN ===\n%s\n=== AST TREE END ===\n" % ast.dump(ast_tree))
-            script_content = translator.translate(ast_tree)
-
-        with io.open(self.__args.output, "w") as script_file:
-            script_file.write(script_content)
+        options = {
+            "is_bootstrap": self.__args.bootstrap,
+            "cache": self._create_cache(),
+            "layout": self.__args.layout,
+            "layout_profile": None,
+            "inline_threshold": self.__args.inline_threshold,
+            "is_collecting_stats": self.__args.stats,
+        }
+
+        if self.__args.layout_profile is not None:
+            options["layout_profile"] = load_profile(self.__args.layout_profile)
+
+        if not self.__is_batch:
+            compiler = Compiler(self.__args.type,
+                                is_dump=self.__args.dump,
+                                **options)
+            compiler.compile_file(self.__args.file_paths[0], self.__args.output)
+            if self.__args.stats:
+                self._print_stats([(self.__args.file_paths[0], compiler.stats)])
+            return 0
+
+        try:
+            jobs = collect_jobs(self.__args.file_paths,
+                                self.__args.type,
+                                self.__args.output)
+        except ValueError as e:
+            self._logger.error("%s", e)
+            return 1
+
+        results = compile_files(jobs,
+                                self.__args.type,
+                                self.__args.jobs,
+                                **options)
+
+        if self.__args.stats:
+            self._print_stats([(x.file_path, x.stats) for x in results
+                if x.is_succeeded])
+
+        failed_count = len([x for x in results if not x.is_succeeded])
+        if failed_count > 0:
+            self._logger.error("%s of %s files failed to compile",
+                               failed_count, len(results))
+            return 1
 
         return 0
 
@@ -0,0 +1,117 @@
+# Functions of the sh library bash does better, they replace the ones of
+# the same name in data/sh/site.sh.
+#
+# A tuple is the offset of its length in PYTSH, its elements follow it, their
+# type tags are at the same offsets in PYTSHT. Offsets are taken from
+# PYTSRTEMP_TUPLE_END and never reused, the slots of a tuple are unset when
+# it's freed, so the arrays only keep the tuples some variant owns.
+# Attributes of instances are kept in PYTSD keyed "(Instance)_(Name)", their
+# type tags in PYTSDT.
+declare -a PYTSH PYTSHT
+declare -A PYTSD PYTSDT
+PYTSRTEMP_TUPLE_END=0
+
+PYTSFtuple___new__() {
+    local PYTSRTEMP_OFFSET=$PYTSRTEMP_TUPLE_END PYTSRTEMP_INDEX
+    PYTSRTEMP_TUPLE_END=$(( PYTSRTEMP_TUPLE_END + $# / 2 + 1 ))
+    PYTSH[PYTSRTEMP_OFFSET]=$(( $# / 2 )) PYTSHT[PYTSRTEMP_OFFSET]=int
+    PYTSRTEMP_INDEX=$(( PYTSRTEMP_OFFSET + 1 ))
+    while (( $# > 0 )); do
+        if [[ $2 == tuple ]]; then
+            # Elements of a tuple are copied with it
+            PYTSFtuple___copy__ "$1"
+            PYTSH[PYTSRTEMP_INDEX]=$PYTSR
+        else
+            PYTSH[PYTSRTEMP_INDEX]=$1
+        fi
+        PYTSHT[PYTSRTEMP_INDEX]=$2
+        PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + 1 ))
+        shift 2
+    done
+    PYTSR=$PYTSRTEMP_OFFSET PYTSTR=tuple
+}
+
+PYTSFtuple___copy__() {
+    local PYTSRTEMP_INDEX
+    local -a PYTSRTEMP_ELEMENTS=()
+    for (( PYTSRTEMP_INDEX = $1 + 1; PYTSRTEMP_INDEX <= $1 + PYTSH[$1]; PYTSRTEMP_INDEX++ )); do
+        PYTSRTEMP_ELEMENTS+=("${PYTSH[PYTSRTEMP_INDEX]}" "${PYTSHT[PYTSRTEMP_INDEX]}")
+    done
+    PYTSFtuple___new__ "${PYTSRTEMP_ELEMENTS[@]}"
+}
+
+# Unset the slots of the tuple, the ones of nested tuples too. PYTSR is left
+# alone, it could be the value being returned.
+PYTSFtuple___del__() {
+    local PYTSRTEMP_INDEX PYTSRTEMP_LAST=$(( $1 + PYTSH[$1] ))
+    for (( PYTSRTEMP_INDEX = $1 + 1; PYTSRTEMP_INDEX <= PYTSRTEMP_LAST; PYTSRTEMP_INDEX++ )); do
+        if [[ ${PYTSHT[PYTSRTEMP_INDEX]} == tuple ]]; then
+            PYTSFtuple___del__ "${PYTSH[PYTSRTEMP_INDEX]}"
+        fi
+        unset "PYTSH[PYTSRTEMP_INDEX]" "PYTSHT[PYTSRTEMP_INDEX]"
+    done
+    unset "PYTSH[$1]" "PYTSHT[$1]"
+}
+
+PYTSFtuple___len__() {
+    PYTSR=${PYTSH[$1]} PYTSTR=int
+}
+
+PYTSFtuple___getitem__() {
+    PYTSRTEMP_INDEX=$3
+    if (( PYTSRTEMP_INDEX < 0 )); then
+        PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + PYTSH[$1] ))
+    fi
+    PYTSR= PYTSTR=
+    if (( PYTSRTEMP_INDEX < 0 || PYTSRTEMP_INDEX >= PYTSH[$1] )); then
+        return
+    fi
+
+    PYTSRTEMP_INDEX=$(( $1 + 1 + PYTSRTEMP_INDEX ))
+    PYTSR=${PYTSH[PYTSRTEMP_INDEX]} PYTSTR=${PYTSHT[PYTSRTEMP_INDEX]}
+}
+
+PYTSFtuple___bool__() {
+    PYTSR=$(( PYTSH[$1] > 0 )) PYTSTR=bool
+}
+
+# $3 characters of $1 from the offset $2, neither is negative
+PYTSFsubstring() {
+    PYTSR=${1:$2:$3} PYTSTR=str
+}
+
+# String formatting, "%s", "%d" and "%i" are replaced by str() of the values
+# (the elements of a tuple or the value itself), "%%" by "%"
+PYTSFstr___mod__() {
+    PYTSRTEMP_FORMAT=$1
+    PYTSRTEMP_RESULT=
+    if [[ $4 == tuple ]]; then
+        PYTSRTEMP_VALUES=("${PYTSH[@]:$3 + 1:PYTSH[$3]}")
+        PYTSRTEMP_TYPES=("${PYTSHT[@]:$3 + 1:PYTSH[$3]}")
+    else
+        PYTSRTEMP_VALUES=("$3")
+        PYTSRTEMP_TYPES=("$4")
+    fi
+
+    PYTSRTEMP_INDEX=0
+    while [[ $PYTSRTEMP_FORMAT == *%* ]]; do
+        PYTSRTEMP_RESULT+=${PYTSRTEMP_FORMAT%%\%*}
+        PYTSRTEMP_FORMAT=${PYTSRTEMP_FORMAT#*%}
+        case $PYTSRTEMP_FORMAT in
+        [sdi]*)
+            PYTSR=${PYTSRTEMP_VALUES[PYTSRTEMP_INDEX]}
+            PYTSTR=${PYTSRTEMP_TYPES[PYTSRTEMP_INDEX]}
+            PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + 1 ))
+            if [[ $PYTSTR != str ]]; then
+                "PYTSF${PYTSTR}___str__" "$PYTSR" "$PYTSTR"
+            fi
+            PYTSRTEMP_RESULT+=$PYTSR
+            ;;
+        *)
+            PYTSRTEMP_RESULT+=%
+            ;;
+        esac
+        PYTSRTEMP_FORMAT=${PYTSRTEMP_FORMAT#?}
+    done
+    PYTSR=$PYTSRTEMP_RESULT$PYTSRTEMP_FORMAT PYTSTR=str
+}
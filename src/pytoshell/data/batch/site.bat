@@ -1,16 +1,59 @@
 :: The basic library included all routines that needs by pytoshell
 
+:: A tuple variant holds its length, its elements are in the variants named
+:: after it "(Name)[0]", "(Name)[1]" ... and their type tags in "(Name)[0]-T"
+:: ... Elements of nested tuples are named the same way: "(Name)[0][1]".
 :PYTSVtuple.__getitem__
-setlocal
-    set "@PYTSRTEMP_VALUE=!%1!"
-    set "@PYTSRTEMP_INDEX=!%2!"
-    :: Clear the return variant first
-    set "@PYTSR=" & set "@PYTSR-T="
-    for /f "tokens=%@PYTSRTEMP_INDEX%" %%a in (%@PYTSRTEMP_VALUE%) do (
-        set "@PYTSR=!%%a!"
-        set "@PYTSR-T=!%%a-T!"
-    )
-endlocal & set "@PYTSR=%@PYTSR%" & set "@PYTSR-T=%@PYTSR-T%"
+set /a "@PYTSRTEMP_INDEX=!%2!"
+if !@PYTSRTEMP_INDEX! LSS 0 set /a "@PYTSRTEMP_INDEX+=!%1!"
+:: Clear the return variant first
+set "@PYTSR=" & set "@PYTSR-T="
+if !@PYTSRTEMP_INDEX! LSS 0 exit /b %ERRORLEVEL%
+if !@PYTSRTEMP_INDEX! GEQ !%1! exit /b %ERRORLEVEL%
+for %%i in (!@PYTSRTEMP_INDEX!) do (
+    set "@PYTSR=!%1[%%i]!" & set "@PYTSR-T=!%1[%%i]-T!"
+    if "!%1[%%i]-T!"=="tuple" call :PYTSVtuple.__copy__ @PYTSR %1[%%i]
+)
+exit /b %ERRORLEVEL%
+
+:PYTSVtuple.__len__
+set "@PYTSR=!%1!" & set "@PYTSR-T=int"
+exit /b %ERRORLEVEL%
+
+:PYTSVtuple.__bool__
+set "@PYTSR=1" & set "@PYTSR-T=bool"
+if !%1! EQU 0 set "@PYTSR=0"
+exit /b %ERRORLEVEL%
+
+:: Copy the tuple %2 to the variant %1, with the elements of nested tuples.
+:: "for /l" reads its bounds once, the recursive calls could change them.
+:PYTSVtuple.__copy__
+set "%1=!%2!" & set "%1-T=tuple"
+set /a "@PYTSRTEMP_LAST=!%2! - 1"
+for /l %%i in (0,1,%@PYTSRTEMP_LAST%) do (
+    set "%1[%%i]=!%2[%%i]!" & set "%1[%%i]-T=!%2[%%i]-T!"
+    if "!%2[%%i]-T!"=="tuple" call :PYTSVtuple.__copy__ %1[%%i] %2[%%i]
+)
+exit /b %ERRORLEVEL%
+
+:: Elements of a tuple returned by a function must outlive its endlocal, they
+:: are packed to the commands setting them in @PYTSR-P, which is expanded on
+:: the line of endlocal: "endlocal & ...%@PYTSR-P%". Separators and quotes
+:: come from delayed expansion, so they are kept as text until then.
+:PYTSVtuple.__pack__
+set "@PYTSR-P="
+set "@PYTSRTEMP_AMP=&"
+set "@PYTSRTEMP_QUOTE=""
+call :PYTSVtuple.__pack_elements__ @PYTSR
+exit /b %ERRORLEVEL%
+
+:PYTSVtuple.__pack_elements__
+set /a "@PYTSRTEMP_LAST=!%1! - 1"
+for /l %%i in (0,1,%@PYTSRTEMP_LAST%) do (
+    set "@PYTSR-P=!@PYTSR-P! !@PYTSRTEMP_AMP! set !@PYTSRTEMP_QUOTE!%1[%%i]=!%1[%%i]!!@PYTSRTEMP_QUOTE!"
+    set "@PYTSR-P=!@PYTSR-P! !@PYTSRTEMP_AMP! set !@PYTSRTEMP_QUOTE!%1[%%i]-T=!%1[%%i]-T!!@PYTSRTEMP_QUOTE!"
+    if "!%1[%%i]-T!"=="tuple" call :PYTSVtuple.__pack_elements__ %1[%%i]
+)
 exit /b %ERRORLEVEL%
 
 :PYTSVlen
@@ -33,6 +76,31 @@ set "@PYTSR-T=!%1-T!"
 call :PYTSV%@PYTSR-T%.__bool__ %1
 exit /b %ERRORLEVEL%
 
+:: Compare %1 to %3 by the "if" operator %2 (EQU, NEQ, LSS ...), bool and int
+:: are compared as numbers, values of different types are never equal
+:PYTSVcompare
+setlocal
+    set "@PYTSR=0"
+    set "@PYTSRTEMP_LEFT=!%1-T!"
+    set "@PYTSRTEMP_RIGHT=!%3-T!"
+    if "%@PYTSRTEMP_LEFT%"=="bool" set "@PYTSRTEMP_LEFT=int"
+    if "%@PYTSRTEMP_RIGHT%"=="bool" set "@PYTSRTEMP_RIGHT=int"
+    if NOT "%@PYTSRTEMP_LEFT%"=="%@PYTSRTEMP_RIGHT%" (
+        if "%2"=="NEQ" set "@PYTSR=1"
+        goto :LABEL_PYTSVcompare0
+    )
+
+    if "%@PYTSRTEMP_LEFT%"=="int" (
+        if !%1! %2 !%3! set "@PYTSR=1"
+    ) else (
+        if "!%1!" %2 "!%3!" set "@PYTSR=1"
+    )
+
+    :LABEL_PYTSVcompare0
+    set "@PYTSR-T=bool"
+endlocal & set "@PYTSR=%@PYTSR%" & set "@PYTSR-T=%@PYTSR-T%"
+exit /b %ERRORLEVEL%
+
 :PYTSVprint
 set "@PYTSRTEMP_VALUE=!%1!"
 if NOT "%@PYTSRTEMP_VALUE%"=="" (echo %@PYTSRTEMP_VALUE%)
@@ -125,7 +193,17 @@ setlocal
     set "@PYTSR-T=str"
 endlocal & set "@PYTSR=%@PYTSR%" & set "@PYTSR-T=%@PYTSR-T%"
 exit /b %ERRORLEVEL%
+:: None is an empty value tagged "NoneType", "==" compares it in
+:: :PYTSVcompare like other values
+:PYTSVNoneType.__bool__
+set "@PYTSR=0" & set "@PYTSR-T=bool"
+exit /b %ERRORLEVEL%
+
+:PYTSVNoneType.__str__
+set "@PYTSR=None" & set "@PYTSR-T=str"
+exit /b %ERRORLEVEL%
 
+:: A slice is "lower upper step", "None" for a missing bound or step
 :PYTSVstr.__getitem__
 setlocal
     set "@PYTSRTEMP_ARG1=!%1!"
@@ -142,22 +220,64 @@ setlocal
         set "@PYTSRTEMP_UPPER=%%b"
         set "@PYTSRTEMP_STEP=%%c"
     )
-
+    set "@PYTSR="
+    if "%@PYTSRTEMP_STEP%" == "None" set "@PYTSRTEMP_STEP=1"
+    if NOT "%@PYTSRTEMP_STEP%" == "1" goto LABEL_PYTSVstr.__getitem__1
+
+    :: cmd.exe substrings count negative offsets from the end like python, only
+    :: a negative lower bound with a positive upper one needs the length
+    if "%@PYTSRTEMP_LOWER%" == "None" set "@PYTSRTEMP_LOWER=0"
+    if "%@PYTSRTEMP_UPPER%" == "None" (
+        set "@PYTSR=!@PYTSRTEMP_ARG1:~%@PYTSRTEMP_LOWER%!"
+        goto LABEL_PYTSVstr.__getitem__EXIT
+    )
+    if %@PYTSRTEMP_UPPER% LSS 0 (
+        set "@PYTSR=!@PYTSRTEMP_ARG1:~%@PYTSRTEMP_LOWER%,%@PYTSRTEMP_UPPER%!"
+        goto LABEL_PYTSVstr.__getitem__EXIT
+    )
+    if %@PYTSRTEMP_LOWER% LSS 0 (
+        call :PYTSVstr.__len__ @PYTSRTEMP_ARG1
+        set /a "@PYTSRTEMP_LOWER+=@PYTSR"
+        if !@PYTSRTEMP_LOWER! LSS 0 set "@PYTSRTEMP_LOWER=0"
+        set "@PYTSR="
+    )
     set /a "@PYTSRTEMP_COUNT=@PYTSRTEMP_UPPER-@PYTSRTEMP_LOWER"
-
-    if "%@PYTSRTEMP_STEP%" == "1" (
+    if %@PYTSRTEMP_COUNT% GTR 0 (
         set "@PYTSR=!@PYTSRTEMP_ARG1:~%@PYTSRTEMP_LOWER%,%@PYTSRTEMP_COUNT%!"
-        goto LABEL_PYTSVstr.__getitem__EXIT
     )
+    goto LABEL_PYTSVstr.__getitem__EXIT
 
-    set "@PYTSR="
-
+    :: Stepped slices, bounds are clamped like slice.indices() does then one
+    :: "for /l" collects the characters
     :LABEL_PYTSVstr.__getitem__1
-    if %@PYTSRTEMP_LOWER% GEQ %@PYTSRTEMP_UPPER% (goto LABEL_PYTSVstr.__getitem__EXIT)
-
-    set "@PYTSR=%@PYTSR%!@PYTSRTEMP_ARG1:~%@PYTSRTEMP_LOWER%,1!"
-    set /a "@PYTSRTEMP_LOWER += @PYTSRTEMP_STEP"
-    goto LABEL_PYTSVstr.__getitem__1
+    call :PYTSVstr.__len__ @PYTSRTEMP_ARG1
+    set "@PYTSRTEMP_LENGTH=%@PYTSR%"
+    set "@PYTSR="
+    if %@PYTSRTEMP_STEP% LSS 0 goto LABEL_PYTSVstr.__getitem__3
+
+    if "%@PYTSRTEMP_LOWER%" == "None" set "@PYTSRTEMP_LOWER=0"
+    if "%@PYTSRTEMP_UPPER%" == "None" set "@PYTSRTEMP_UPPER=%@PYTSRTEMP_LENGTH%"
+    if %@PYTSRTEMP_LOWER% LSS 0 set /a "@PYTSRTEMP_LOWER+=@PYTSRTEMP_LENGTH"
+    if %@PYTSRTEMP_LOWER% LSS 0 set "@PYTSRTEMP_LOWER=0"
+    if %@PYTSRTEMP_UPPER% LSS 0 set /a "@PYTSRTEMP_UPPER+=@PYTSRTEMP_LENGTH"
+    if %@PYTSRTEMP_UPPER% GTR %@PYTSRTEMP_LENGTH% set "@PYTSRTEMP_UPPER=%@PYTSRTEMP_LENGTH%"
+    set /a "@PYTSRTEMP_UPPER-=1"
+    goto LABEL_PYTSVstr.__getitem__4
+
+    :LABEL_PYTSVstr.__getitem__3
+    if "%@PYTSRTEMP_LOWER%" == "None" set "@PYTSRTEMP_LOWER=%@PYTSRTEMP_LENGTH%"
+    if "%@PYTSRTEMP_UPPER%" == "None" set /a "@PYTSRTEMP_UPPER=-@PYTSRTEMP_LENGTH-1"
+    if %@PYTSRTEMP_LOWER% LSS 0 set /a "@PYTSRTEMP_LOWER+=@PYTSRTEMP_LENGTH"
+    if %@PYTSRTEMP_LOWER% GEQ %@PYTSRTEMP_LENGTH% set /a "@PYTSRTEMP_LOWER=@PYTSRTEMP_LENGTH-1"
+    if %@PYTSRTEMP_UPPER% LSS 0 set /a "@PYTSRTEMP_UPPER+=@PYTSRTEMP_LENGTH"
+    if %@PYTSRTEMP_UPPER% LSS -1 set "@PYTSRTEMP_UPPER=-1"
+    set /a "@PYTSRTEMP_UPPER+=1"
+
+    :LABEL_PYTSVstr.__getitem__4
+    for /l %%i in (%@PYTSRTEMP_LOWER%,%@PYTSRTEMP_STEP%,%@PYTSRTEMP_UPPER%) do (
+        set "@PYTSR=!@PYTSR!!@PYTSRTEMP_ARG1:~%%i,1!"
+    )
+    goto LABEL_PYTSVstr.__getitem__EXIT
 
     :LABEL_PYTSVstr.__getitem__2
 
@@ -191,18 +311,32 @@ setlocal
 endlocal & set "@PYTSR=%@PYTSR%" & set "@PYTSR-T=%@PYTSR-T%"
 exit /b %ERRORLEVEL%
 
+:: Binary search of the length: "#" makes the length of the probed value one
+:: more than the string's, a character at offset %%n means it's longer than n
+:: (cmd.exe variants hold 8191 characters at most)
 :PYTSVstr.__len__
-set "@PYTSRTEMP_VALUE=!%1!"
+set "@PYTSRTEMP_VALUE=#!%1!"
 set "@PYTSR=0"
 set "@PYTSR-T=int"
+for %%n in (4096 2048 1024 512 256 128 64 32 16 8 4 2 1) do (
+    if "!@PYTSRTEMP_VALUE:~%%n,1!" NEQ "" (
+        set /a "@PYTSR+=%%n"
+        set "@PYTSRTEMP_VALUE=!@PYTSRTEMP_VALUE:~%%n!"
+    )
+)
+set "@PYTSRTEMP_VALUE="
+exit /b %ERRORLEVEL%
 
-:LABEL_PYTSVstr.__len__0
-    if "%@PYTSRTEMP_VALUE%"=="" (goto :LABEL_PYTSVstr.__len__1)
-    set /a "@PYTSR +=1"
-    set "@PYTSRTEMP_VALUE=%@PYTSRTEMP_VALUE:~1%" ::Remove the first character
-goto LABEL_PYTSVstr.__len__0
-
-:LABEL_PYTSVstr.__len__1
+:: len() of the str variant %1, kept in %1-L until %1 is set again (the
+:: generated script clears it then)
+:PYTSVlen.cached
+set "@PYTSR-T=int"
+if defined %1-L (
+    set "@PYTSR=!%1-L!"
+    exit /b %ERRORLEVEL%
+)
+call :PYTSVstr.__len__ %1
+set "%1-L=%@PYTSR%"
 exit /b %ERRORLEVEL%
 
 :PYTSVstr.__add__
@@ -210,20 +344,22 @@ set "@PYTSR=!%1!!%2!"
 set "@PYTSR-T=!%1-T!"
 exit /b %ERRORLEVEL%
 
+:: Repeated doubling, the operand is appended for each set bit of the count
+:: while doubling it, about 2 * log2(count) sets
 :PYTSVstr.__mul__
 setlocal
     set "@PYTSR="
     set "@PYTSR-T=!%1-T!"
     set "@PYTSRTEMP_VALUE=!%1!"
-    set "@PYTSRTEMP_I=!%2!"
-
-    :LABEL_PYTSVstr.__mul__0
-        if %@PYTSRTEMP_I% LEQ 0 (goto LABEL_PYTSVstr.__mul__1)
-        set /a "@PYTSRTEMP_I-=1"
-        set "@PYTSR=%@PYTSR%%@PYTSRTEMP_VALUE%"
-    goto :LABEL_PYTSVstr.__mul__0
-
-    :LABEL_PYTSVstr.__mul__1
+    set /a "@PYTSRTEMP_I=!%2!"
+
+    :: 13 bits, a variant holds 8191 characters at most. The doubled value is
+    :: only needed while there are bits left.
+    for /l %%b in (1,1,13) do if !@PYTSRTEMP_I! GTR 0 (
+        set /a "@PYTSRTEMP_BIT=@PYTSRTEMP_I & 1, @PYTSRTEMP_I>>=1"
+        if !@PYTSRTEMP_BIT! EQU 1 set "@PYTSR=!@PYTSR!!@PYTSRTEMP_VALUE!"
+        if !@PYTSRTEMP_I! GTR 0 set "@PYTSRTEMP_VALUE=!@PYTSRTEMP_VALUE!!@PYTSRTEMP_VALUE!"
+    )
 endlocal & set "@PYTSR=%@PYTSR%" & set "@PYTSR-T=%@PYTSR-T%"
 exit /b %ERRORLEVEL%
 
@@ -239,13 +375,12 @@ setlocal
     :LABEL_PYTSVstr.__mod__parse_tuple
         set "@PYTSRTEMP_STR=!%1!"
         set "@PYTSRTEMP_STR-T=!%1-T!"
-        set "@PYTSRTEMP_RIGHT_STR=!%2!"
-        set /a "@PYTSRTEMP_I=0"
+        set "@PYTSRTEMP_LENGTH=!%2!"
+        set /a "@PYTSRTEMP_I=-1"
         :LABEL_PYTSVstr.__mod__parse_tuple0
             set /a "@PYTSRTEMP_I+=1"
-            call :PYTSVtuple.__getitem__ @PYTSRTEMP_RIGHT_STR @PYTSRTEMP_I
-            if "%@PYTSR%"=="" goto LABEL_PYTSVstr.__mod__parse_tuple1
-            call :PYTSVstr.__mod__ @PYTSRTEMP_STR @PYTSR
+            if %@PYTSRTEMP_I% GEQ %@PYTSRTEMP_LENGTH% goto LABEL_PYTSVstr.__mod__parse_tuple1
+            call :PYTSVstr.__mod__ @PYTSRTEMP_STR %2[%@PYTSRTEMP_I%]
             set "@PYTSRTEMP_STR=%@PYTSR%" & set "@PYTSRTEMP_STR-T=%@PYTSR-T%"
         goto LABEL_PYTSVstr.__mod__parse_tuple0
 
@@ -302,7 +437,7 @@ endlocal & set "@PYTSR=%@PYTSR%" & set "@PYTSR-T=%@PYTSR-T%"
 exit /b %ERRORLEVEL%
 
 :PYTSVint.__str__
-set "@PYTSR-T=str"
+set "@PYTSR=!%1!" & set "@PYTSR-T=str"
 exit /b %ERRORLEVEL%
 
 :PYTSVint.__add__
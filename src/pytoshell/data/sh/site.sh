@@ -0,0 +1,525 @@
+# The basic library included all routines that needs by pytoshell
+#
+# Each argument is passed as two words: its value and its type tag. Results
+# are returned in PYTSR (value) and PYTSTR (type tag). Nothing here forks: no
+# command substitution, no subshell and no external command.
+
+# Builtins dispatching to the method of the type of their argument
+PYTSFlen() {
+    "PYTSF${2}___len__" "$@"
+}
+
+PYTSFstr() {
+    "PYTSF${2}___str__" "$@"
+}
+
+PYTSFint() {
+    "PYTSF${2}___int__" "$@"
+}
+
+PYTSFbool() {
+    "PYTSF${2}___bool__" "$@"
+}
+
+PYTSFtype() {
+    PYTSR=$2 PYTSTR=type
+}
+
+# Values are converted by str() and separated by a space like python does
+PYTSFprint() {
+    PYTSRTEMP_LINE=
+    PYTSRTEMP_SEPARATOR=
+    while [ $# -gt 0 ]; do
+        if [ "$2" = str ]; then
+            PYTSR=$1
+        else
+            "PYTSF${2}___str__" "$1" "$2"
+        fi
+        PYTSRTEMP_LINE=$PYTSRTEMP_LINE$PYTSRTEMP_SEPARATOR$PYTSR
+        PYTSRTEMP_SEPARATOR=' '
+        shift 2
+    done
+    printf '%s\n' "$PYTSRTEMP_LINE"
+    PYTSR= PYTSTR=NoneType
+}
+
+# A range is "start stop step"
+PYTSFrange() {
+    if [ $# -le 2 ]; then
+        PYTSR="0 $1 1"
+    elif [ $# -le 4 ]; then
+        PYTSR="$1 $3 1"
+    else
+        PYTSR="$1 $3 $5"
+    fi
+    PYTSTR=range
+}
+
+PYTSFrange___len__() {
+    set -- $1
+    if [ "$3" -gt 0 ]; then
+        PYTSR=$(( ($2 - $1 + $3 - 1) / $3 ))
+    else
+        PYTSR=$(( ($1 - $2 - $3 - 1) / (0 - $3) ))
+    fi
+    if [ "$PYTSR" -lt 0 ]; then
+        PYTSR=0
+    fi
+    PYTSTR=int
+}
+
+PYTSFrange___getitem__() {
+    PYTSRTEMP_INDEX=$3
+    PYTSFrange___len__ "$1"
+    if [ "$PYTSRTEMP_INDEX" -lt 0 ]; then
+        PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + PYTSR ))
+    fi
+    set -- $1
+    PYTSR=$(( $1 + $3 * PYTSRTEMP_INDEX )) PYTSTR=int
+}
+
+PYTSFrange___bool__() {
+    PYTSFrange___len__ "$1"
+    if [ "$PYTSR" -gt 0 ]; then
+        PYTSR=1
+    fi
+    PYTSTR=bool
+}
+
+# Compare $1 to $4 by the operator $3 (EQU, NEQ, LSS ...), bool and int are
+# compared as numbers, values of different types are never equal
+PYTSFcompare() {
+    PYTSRTEMP_LEFT=$2
+    PYTSRTEMP_RIGHT=$5
+    if [ "$PYTSRTEMP_LEFT" = bool ]; then
+        PYTSRTEMP_LEFT=int
+    fi
+    if [ "$PYTSRTEMP_RIGHT" = bool ]; then
+        PYTSRTEMP_RIGHT=int
+    fi
+
+    PYTSR=0 PYTSTR=bool
+    if [ "$PYTSRTEMP_LEFT" != "$PYTSRTEMP_RIGHT" ]; then
+        if [ "$3" = NEQ ]; then
+            PYTSR=1
+        fi
+        return
+    fi
+
+    if [ "$PYTSRTEMP_LEFT" = int ]; then
+        PYTSRTEMP_ORDER=$(( ($1 > $4) - ($1 < $4) ))
+    elif [ "$1" = "$4" ]; then
+        PYTSRTEMP_ORDER=0
+    else
+        PYTSFstr_order "$1" "$4"
+    fi
+
+    case $3 in
+    EQU) PYTSR=$(( PYTSRTEMP_ORDER == 0 )) ;;
+    NEQ) PYTSR=$(( PYTSRTEMP_ORDER != 0 )) ;;
+    LSS) PYTSR=$(( PYTSRTEMP_ORDER < 0 )) ;;
+    LEQ) PYTSR=$(( PYTSRTEMP_ORDER <= 0 )) ;;
+    GTR) PYTSR=$(( PYTSRTEMP_ORDER > 0 )) ;;
+    GEQ) PYTSR=$(( PYTSRTEMP_ORDER >= 0 )) ;;
+    esac
+}
+
+# Order of the different strings $1 and $2 in PYTSRTEMP_ORDER (-1 or 1). The
+# first different characters are ranked by their offset in a table of the
+# printable ASCII characters, sh has no builtin to compare strings.
+PYTSFstr_order() {
+    PYTSRTEMP_CHARS=' !"#$%&'\''()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\]^_`abcdefghijklmnopqrstuvwxyz{|}~'
+    PYTSRTEMP_LEFT=$1
+    PYTSRTEMP_RIGHT=$2
+    while :; do
+        if [ -z "$PYTSRTEMP_LEFT" ]; then
+            PYTSRTEMP_ORDER=-1
+            return
+        fi
+        if [ -z "$PYTSRTEMP_RIGHT" ]; then
+            PYTSRTEMP_ORDER=1
+            return
+        fi
+
+        PYTSRTEMP_LEFT_REST=${PYTSRTEMP_LEFT#?}
+        PYTSRTEMP_RIGHT_REST=${PYTSRTEMP_RIGHT#?}
+        PYTSRTEMP_LEFT_CHAR=${PYTSRTEMP_LEFT%"$PYTSRTEMP_LEFT_REST"}
+        PYTSRTEMP_RIGHT_CHAR=${PYTSRTEMP_RIGHT%"$PYTSRTEMP_RIGHT_REST"}
+        if [ "$PYTSRTEMP_LEFT_CHAR" != "$PYTSRTEMP_RIGHT_CHAR" ]; then
+            PYTSRTEMP_LEFT=${PYTSRTEMP_CHARS%%"$PYTSRTEMP_LEFT_CHAR"*}
+            PYTSRTEMP_RIGHT=${PYTSRTEMP_CHARS%%"$PYTSRTEMP_RIGHT_CHAR"*}
+            if [ ${#PYTSRTEMP_LEFT} -lt ${#PYTSRTEMP_RIGHT} ]; then
+                PYTSRTEMP_ORDER=-1
+            else
+                PYTSRTEMP_ORDER=1
+            fi
+            return
+        fi
+        PYTSRTEMP_LEFT=$PYTSRTEMP_LEFT_REST
+        PYTSRTEMP_RIGHT=$PYTSRTEMP_RIGHT_REST
+    done
+}
+
+# A pattern of $1 "?" in PYTSRTEMP_PATTERN, built by repeated doubling
+PYTSFpattern() {
+    PYTSRTEMP_PATTERN=
+    PYTSRTEMP_COUNT=$1
+    PYTSRTEMP_PART='?'
+    while [ "$PYTSRTEMP_COUNT" -gt 0 ]; do
+        if [ $(( PYTSRTEMP_COUNT & 1 )) -eq 1 ]; then
+            PYTSRTEMP_PATTERN=$PYTSRTEMP_PATTERN$PYTSRTEMP_PART
+        fi
+        PYTSRTEMP_COUNT=$(( PYTSRTEMP_COUNT >> 1 ))
+        PYTSRTEMP_PART=$PYTSRTEMP_PART$PYTSRTEMP_PART
+    done
+}
+
+# $3 characters of $1 from the offset $2, neither is negative
+PYTSFsubstring() {
+    PYTSFpattern "$2"
+    PYTSR=${1#$PYTSRTEMP_PATTERN} PYTSTR=str
+    if [ $(( $2 + $3 )) -ge ${#1} ]; then
+        return
+    fi
+
+    PYTSFpattern "$3"
+    PYTSRTEMP_REST=${PYTSR#$PYTSRTEMP_PATTERN}
+    PYTSR=${PYTSR%"$PYTSRTEMP_REST"}
+}
+
+# A tuple is the list of the variants holding its elements, named
+# PYTSH(Id)_(Index) so no two tuples share them. A variant owns the tuple it
+# holds: tuples are copied when they're assigned, their elements are unset
+# when the variant is set again or goes out of scope.
+PYTSFtuple___new__() {
+    local PYTSRTEMP_NAME PYTSRTEMP_NAMES= PYTSRTEMP_PREFIX PYTSRTEMP_INDEX=0
+    PYTSRTEMP_TUPLE_ID=$(( ${PYTSRTEMP_TUPLE_ID:-0} + 1 ))
+    PYTSRTEMP_PREFIX=PYTSH${PYTSRTEMP_TUPLE_ID}_
+    while [ $# -gt 0 ]; do
+        PYTSRTEMP_NAME=$PYTSRTEMP_PREFIX$PYTSRTEMP_INDEX
+        if [ "$2" = tuple ]; then
+            # Elements of a tuple are copied with it
+            PYTSFtuple___copy__ "$1"
+            eval "$PYTSRTEMP_NAME=\$PYTSR PYTST${PYTSRTEMP_NAME#PYTS}=tuple"
+        else
+            eval "$PYTSRTEMP_NAME=\$1 PYTST${PYTSRTEMP_NAME#PYTS}=\$2"
+        fi
+        PYTSRTEMP_NAMES="$PYTSRTEMP_NAMES $PYTSRTEMP_NAME"
+        PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + 1 ))
+        shift 2
+    done
+    PYTSR=${PYTSRTEMP_NAMES# } PYTSTR=tuple
+}
+
+# The elements are passed to __new__, the locals of a __new__ copying a
+# nested tuple aren't touched
+PYTSFtuple___copy__() {
+    PYTSRTEMP_COPY_NAMES=$1
+    set --
+    for PYTSRTEMP_COPY_NAME in $PYTSRTEMP_COPY_NAMES; do
+        eval "set -- \"\$@\" \"\$$PYTSRTEMP_COPY_NAME\" \"\$PYTST${PYTSRTEMP_COPY_NAME#PYTS}\""
+    done
+    PYTSFtuple___new__ "$@"
+}
+
+# Unset the elements of the tuple, the ones of nested tuples too. PYTSR is
+# left alone, it could be the value being returned.
+PYTSFtuple___del__() {
+    for PYTSRTEMP_NAME in $1; do
+        eval "PYTSRTEMP_ELEMENT=\$$PYTSRTEMP_NAME PYTSTRTEMP_ELEMENT=\$PYTST${PYTSRTEMP_NAME#PYTS}"
+        unset "$PYTSRTEMP_NAME" "PYTST${PYTSRTEMP_NAME#PYTS}"
+        if [ "$PYTSTRTEMP_ELEMENT" = tuple ]; then
+            PYTSFtuple___del__ "$PYTSRTEMP_ELEMENT"
+        fi
+    done
+}
+
+PYTSFtuple___len__() {
+    set -- $1
+    PYTSR=$# PYTSTR=int
+}
+
+PYTSFtuple___getitem__() {
+    PYTSRTEMP_INDEX=$3
+    set -- $1
+    if [ "$PYTSRTEMP_INDEX" -lt 0 ]; then
+        PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + $# ))
+    fi
+    PYTSR= PYTSTR=
+    if [ "$PYTSRTEMP_INDEX" -lt 0 ] || [ "$PYTSRTEMP_INDEX" -ge $# ]; then
+        return
+    fi
+
+    shift "$PYTSRTEMP_INDEX"
+    eval "PYTSR=\$$1 PYTSTR=\$PYTST${1#PYTS}"
+}
+
+PYTSFtuple___bool__() {
+    PYTSR=0 PYTSTR=bool
+    if [ -n "$1" ]; then
+        PYTSR=1
+    fi
+}
+
+PYTSFbool___bool__() {
+    PYTSR=$1 PYTSTR=bool
+}
+
+PYTSFbool___int__() {
+    PYTSR=$1 PYTSTR=int
+}
+
+PYTSFbool___str__() {
+    PYTSR=True PYTSTR=str
+    if [ "$1" -eq 0 ]; then
+        PYTSR=False
+    fi
+}
+
+PYTSFNoneType___bool__() {
+    PYTSR=0 PYTSTR=bool
+}
+
+PYTSFNoneType___str__() {
+    PYTSR=None PYTSTR=str
+}
+
+# A slice is "lower upper step", "None" for a missing bound or step
+PYTSFstr___getitem__() {
+    if [ "$4" != slice ]; then
+        PYTSRTEMP_INDEX=$3
+        if [ "$PYTSRTEMP_INDEX" -lt 0 ]; then
+            PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + ${#1} ))
+        fi
+        PYTSFsubstring "$1" "$PYTSRTEMP_INDEX" 1
+        return
+    fi
+
+    set -- "$1" $3
+    PYTSRTEMP_STEP=$4
+    if [ "$PYTSRTEMP_STEP" = None ]; then
+        PYTSRTEMP_STEP=1
+    fi
+
+    # Bounds are clamped like slice.indices() does
+    if [ "$PYTSRTEMP_STEP" -gt 0 ]; then
+        PYTSRTEMP_LOWER=0
+        PYTSRTEMP_UPPER=${#1}
+    else
+        PYTSRTEMP_LOWER=$(( ${#1} - 1 ))
+        PYTSRTEMP_UPPER=-1
+    fi
+    if [ "$2" != None ]; then
+        PYTSRTEMP_LOWER=$2
+        PYTSFstr_clamp "$1" "$PYTSRTEMP_LOWER"
+        PYTSRTEMP_LOWER=$PYTSRTEMP_INDEX
+    fi
+    if [ "$3" != None ]; then
+        PYTSFstr_clamp "$1" "$3"
+        PYTSRTEMP_UPPER=$PYTSRTEMP_INDEX
+    fi
+
+    if [ "$PYTSRTEMP_STEP" -eq 1 ]; then
+        PYTSR= PYTSTR=str
+        if [ "$PYTSRTEMP_UPPER" -gt "$PYTSRTEMP_LOWER" ]; then
+            PYTSFsubstring "$1" "$PYTSRTEMP_LOWER" $(( PYTSRTEMP_UPPER - PYTSRTEMP_LOWER ))
+        fi
+        return
+    fi
+
+    # One pass over the characters, picking the ones on the step
+    PYTSR= PYTSTR=str
+    PYTSRTEMP_VALUE=$1
+    PYTSRTEMP_INDEX=0
+    while [ -n "$PYTSRTEMP_VALUE" ]; do
+        PYTSRTEMP_REST=${PYTSRTEMP_VALUE#?}
+        if [ "$PYTSRTEMP_STEP" -gt 0 ]; then
+            if [ "$PYTSRTEMP_INDEX" -ge "$PYTSRTEMP_LOWER" ] \
+                    && [ "$PYTSRTEMP_INDEX" -lt "$PYTSRTEMP_UPPER" ] \
+                    && [ $(( (PYTSRTEMP_INDEX - PYTSRTEMP_LOWER) % PYTSRTEMP_STEP )) -eq 0 ]; then
+                PYTSR=$PYTSR${PYTSRTEMP_VALUE%"$PYTSRTEMP_REST"}
+            fi
+        elif [ "$PYTSRTEMP_INDEX" -le "$PYTSRTEMP_LOWER" ] \
+                && [ "$PYTSRTEMP_INDEX" -gt "$PYTSRTEMP_UPPER" ] \
+                && [ $(( (PYTSRTEMP_LOWER - PYTSRTEMP_INDEX) % PYTSRTEMP_STEP )) -eq 0 ]; then
+            PYTSR=${PYTSRTEMP_VALUE%"$PYTSRTEMP_REST"}$PYTSR
+        fi
+        PYTSRTEMP_VALUE=$PYTSRTEMP_REST
+        PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + 1 ))
+    done
+}
+
+# Slice bound $2 of the string $1 in PYTSRTEMP_INDEX, counted from the start
+# and clamped to -1 ... length
+PYTSFstr_clamp() {
+    PYTSRTEMP_INDEX=$2
+    if [ "$PYTSRTEMP_INDEX" -lt 0 ]; then
+        PYTSRTEMP_INDEX=$(( PYTSRTEMP_INDEX + ${#1} ))
+        if [ "$PYTSRTEMP_INDEX" -lt 0 ]; then
+            PYTSRTEMP_INDEX=-1
+            if [ "$PYTSRTEMP_STEP" -gt 0 ]; then
+                PYTSRTEMP_INDEX=0
+            fi
+        fi
+    elif [ "$PYTSRTEMP_INDEX" -gt ${#1} ]; then
+        PYTSRTEMP_INDEX=${#1}
+    fi
+    if [ "$PYTSRTEMP_STEP" -lt 0 ] && [ "$PYTSRTEMP_INDEX" -ge ${#1} ]; then
+        PYTSRTEMP_INDEX=$(( ${#1} - 1 ))
+    fi
+}
+
+PYTSFstr___len__() {
+    PYTSR=${#1} PYTSTR=int
+}
+
+PYTSFstr___bool__() {
+    PYTSR=0 PYTSTR=bool
+    if [ -n "$1" ]; then
+        PYTSR=1
+    fi
+}
+
+# Leading zeros are dropped, $(( )) would read the digits as octal
+PYTSFstr___int__() {
+    PYTSRTEMP_VALUE=$1
+    PYTSRTEMP_SIGN=
+    case $PYTSRTEMP_VALUE in
+    -*) PYTSRTEMP_SIGN=- PYTSRTEMP_VALUE=${PYTSRTEMP_VALUE#-} ;;
+    +*) PYTSRTEMP_VALUE=${PYTSRTEMP_VALUE#+} ;;
+    esac
+    while :; do
+        case $PYTSRTEMP_VALUE in
+        0?*) PYTSRTEMP_VALUE=${PYTSRTEMP_VALUE#0} ;;
+        *) break ;;
+        esac
+    done
+    PYTSR=$(( $PYTSRTEMP_SIGN$PYTSRTEMP_VALUE )) PYTSTR=int
+}
+
+PYTSFstr___str__() {
+    PYTSR=$1 PYTSTR=str
+}
+
+PYTSFstr___add__() {
+    PYTSR=$1$3 PYTSTR=str
+}
+
+# Repeated doubling, the operand is appended for each set bit of the count
+PYTSFstr___mul__() {
+    PYTSR= PYTSTR=str
+    PYTSRTEMP_VALUE=$1
+    PYTSRTEMP_COUNT=$3
+    while [ "$PYTSRTEMP_COUNT" -gt 0 ]; do
+        if [ $(( PYTSRTEMP_COUNT & 1 )) -eq 1 ]; then
+            PYTSR=$PYTSR$PYTSRTEMP_VALUE
+        fi
+        PYTSRTEMP_COUNT=$(( PYTSRTEMP_COUNT >> 1 ))
+        if [ "$PYTSRTEMP_COUNT" -gt 0 ]; then
+            PYTSRTEMP_VALUE=$PYTSRTEMP_VALUE$PYTSRTEMP_VALUE
+        fi
+    done
+}
+
+# String formatting, "%s", "%d" and "%i" are replaced by str() of the values
+# (the elements of a tuple or the value itself), "%%" by "%"
+PYTSFstr___mod__() {
+    PYTSRTEMP_FORMAT=$1
+    PYTSRTEMP_RESULT=
+    if [ "$4" = tuple ]; then
+        set -- $3
+    else
+        PYTSRTEMP_ARGUMENT=$3 PYTSTRTEMP_ARGUMENT=$4
+        set -- PYTSRTEMP_ARGUMENT
+    fi
+
+    while :; do
+        case $PYTSRTEMP_FORMAT in
+        *%*) ;;
+        *) break ;;
+        esac
+        PYTSRTEMP_RESULT=$PYTSRTEMP_RESULT${PYTSRTEMP_FORMAT%%\%*}
+        PYTSRTEMP_FORMAT=${PYTSRTEMP_FORMAT#*%}
+        case $PYTSRTEMP_FORMAT in
+        [sdi]*)
+            eval "PYTSR=\$$1 PYTSTR=\$PYTST${1#PYTS}"
+            shift
+            if [ "$PYTSTR" != str ]; then
+                "PYTSF${PYTSTR}___str__" "$PYTSR" "$PYTSTR"
+            fi
+            PYTSRTEMP_RESULT=$PYTSRTEMP_RESULT$PYTSR
+            ;;
+        *)
+            PYTSRTEMP_RESULT=$PYTSRTEMP_RESULT%
+            ;;
+        esac
+        PYTSRTEMP_FORMAT=${PYTSRTEMP_FORMAT#?}
+    done
+    PYTSR=$PYTSRTEMP_RESULT$PYTSRTEMP_FORMAT PYTSTR=str
+}
+
+PYTSFint___bool__() {
+    PYTSR=0 PYTSTR=bool
+    if [ "$1" -ne 0 ]; then
+        PYTSR=1
+    fi
+}
+
+PYTSFint___int__() {
+    PYTSR=$1 PYTSTR=int
+}
+
+PYTSFint___str__() {
+    PYTSR=$1 PYTSTR=str
+}
+
+PYTSFint___add__() {
+    PYTSR=$(( $1 + $3 )) PYTSTR=int
+}
+
+PYTSFint___sub__() {
+    PYTSR=$(( $1 - $3 )) PYTSTR=int
+}
+
+PYTSFint___mul__() {
+    if [ "$4" = str ]; then
+        PYTSFstr___mul__ "$3" "$4" "$1" "$2"
+        return
+    fi
+    PYTSR=$(( $1 * $3 )) PYTSTR=int
+}
+
+PYTSFint___truediv__() {
+    PYTSR=$(( $1 / $3 )) PYTSTR=int
+}
+
+PYTSFint___mod__() {
+    PYTSR=$(( $1 % $3 )) PYTSTR=int
+}
+
+PYTSFint___lshift__() {
+    PYTSR=$(( $1 << $3 )) PYTSTR=int
+}
+
+PYTSFint___rshift__() {
+    PYTSR=$(( $1 >> $3 )) PYTSTR=int
+}
+
+PYTSFint___or__() {
+    PYTSR=$(( $1 | $3 )) PYTSTR=int
+}
+
+PYTSFint___and__() {
+    PYTSR=$(( $1 & $3 )) PYTSTR=int
+}
+
+PYTSFint___xor__() {
+    PYTSR=$(( $1 ^ $3 )) PYTSTR=int
+}
+
+# Instances are named PYTSO(Id), their attributes are variants named after
+# them
+PYTSFobject___new__() {
+    PYTSRTEMP_OBJECT_ID=$(( ${PYTSRTEMP_OBJECT_ID:-0} + 1 ))
+    PYTSR=PYTSO$PYTSRTEMP_OBJECT_ID PYTSTR=$1
+}
@@ -0,0 +1,1070 @@
+#!/usr/bin/env python
+
+import argparse
+import collections
+import io
+import json
+import re
+import sys
+
+class EmulatorError(Exception):
+    '''
+    A command the emulator doesn't support, or an error cmd.exe would report.
+    '''
+
+class _Goto(Exception):
+    def __init__(self, label):
+        super().__init__(label)
+        self.label = label
+
+class _Exit(Exception):
+    def __init__(self, code, is_batch_exit=True):
+        super().__init__(code)
+        self.code = code
+        self.is_batch_exit = is_batch_exit
+
+# Commands of a parsed line
+
+class Sequence(object):
+    def __init__(self):
+        # List of (operator, command), the first operator is always None
+        self.items = []
+
+class Block(object):
+    def __init__(self, sequence):
+        self.sequence = sequence
+
+class Simple(object):
+    def __init__(self, text):
+        self.text = text
+
+class If(object):
+    def __init__(self, negate, case_insensitive, kind, operands, then_, else_):
+        self.negate = negate
+        self.case_insensitive = case_insensitive
+        self.kind = kind
+        self.operands = operands
+        self.then_ = then_
+        self.else_ = else_
+
+class For(object):
+    def __init__(self, switch, options, variant, set_text, body):
+        self.switch = switch
+        self.options = options
+        self.variant = variant
+        self.set_text = set_text
+        self.body = body
+
+class _Parser(object):
+    '''
+    Parse a logical line (a line and the lines a parenthesized block spans)
+    after percent expansion.
+    '''
+
+    _COMPARE_OPERATORS = ("EQU", "NEQ", "LSS", "LEQ", "GTR", "GEQ")
+
+    def __init__(self, text):
+        self._text = text
+        self._pos = 0
+
+    @property
+    def is_finished(self):
+        return self._pos >= len(self._text)
+
+    def _peek(self, count=1):
+        return self._text[self._pos:self._pos + count]
+
+    def _skip_spaces(self, with_newlines=False):
+        spaces = " \t\r" if not with_newlines else " \t\r\n"
+        while self._pos < len(self._text) and self._text[self._pos] in spaces:
+            self._pos += 1
+
+    def _read_word(self):
+        self._skip_spaces()
+        start = self._pos
+        while (self._pos < len(self._text)
+                and self._text[self._pos] not in " \t\r\n&|()"):
+            self._pos += 1
+        return self._text[start:self._pos]
+
+    def _peek_word(self):
+        pos = self._pos
+        word = self._read_word()
+        self._pos = pos
+        return word
+
+    def _read_token(self):
+        # Read an IF operand, quotes protect spaces and "==" inside them
+        self._skip_spaces()
+        start = self._pos
+        in_quote = False
+        while self._pos < len(self._text):
+            c = self._text[self._pos]
+            if c == '"':
+                in_quote = not in_quote
+            elif not in_quote:
+                if c in " \t\r\n":
+                    break
+                if self._text.startswith("==", self._pos):
+                    break
+            self._pos += 1
+        return self._text[start:self._pos]
+
+    def parse_sequence(self, depth=0):
+        sequence = Sequence()
+        operator = None
+        while True:
+            self._skip_spaces(with_newlines=True)
+            if self.is_finished or (depth > 0 and self._peek() == ")"):
+                break
+
+            command = self._parse_command(depth)
+            sequence.items.append((operator, command))
+
+            self._skip_spaces()
+            if self._peek(2) in ("&&", "||"):
+                operator = self._peek(2)
+                self._pos += 2
+            elif self._peek() == "&":
+                operator = "&"
+                self._pos += 1
+            elif self._peek() == "\n":
+                operator = "&"
+                self._pos += 1
+            else:
+                break
+        return sequence
+
+    def _parse_body(self, depth, is_then=False):
+        # IF and FOR take the rest of the line as their command, commands
+        # chained after a parenthesized block too. Only "else" ends the
+        # block of a then branch.
+        sequence = Sequence()
+        operator = None
+        while True:
+            self._skip_spaces()
+            if (self.is_finished or self._peek() == "\n"
+                    or (depth > 0 and self._peek() == ")")):
+                break
+            command = self._parse_command(depth)
+            sequence.items.append((operator, command))
+            self._skip_spaces()
+            if (is_then and len(sequence.items) == 1 and isinstance(command, Block)
+                    and self._peek_word().lower() == "else"):
+                return command
+            if self._peek(2) in ("&&", "||"):
+                operator = self._peek(2)
+                self._pos += 2
+            elif self._peek() == "&":
+                operator = "&"
+                self._pos += 1
+            else:
+                break
+        return Block(sequence)
+
+    def _parse_command(self, depth):
+        self._skip_spaces()
+        while self._peek() == "@":
+            self._pos += 1
+
+        if self._peek() == "(":
+            self._pos += 1
+            sequence = self.parse_sequence(depth + 1)
+            self._skip_spaces(with_newlines=True)
+            if self._peek() != ")":
+                raise EmulatorError("Unbalanced parentheses")
+            self._pos += 1
+            self._skip_redirection()
+            return Block(sequence)
+
+        word = self._peek_word().lower()
+        if word == "if":
+            return self._parse_if(depth)
+        if word == "for":
+            return self._parse_for(depth)
+        if word.startswith("::") or word == "rem":
+            self._skip_line()
+            return Simple("rem")
+        return self._parse_simple(depth)
+
+    def _skip_line(self):
+        while self._pos < len(self._text) and self._text[self._pos] != "\n":
+            self._pos += 1
+
+    def _skip_redirection(self):
+        match = re.match(r"\s*\d?>>?\s*(&\d|[^\s&|()]+)", self._text[self._pos:])
+        if match:
+            self._pos += match.end()
+
+    def _parse_simple(self, depth):
+        start = self._pos
+        in_quote = False
+        chars = []
+        while self._pos < len(self._text):
+            c = self._text[self._pos]
+            if c == "^" and not in_quote and self._pos + 1 < len(self._text):
+                chars.append(c)
+                chars.append(self._text[self._pos + 1])
+                self._pos += 2
+                continue
+            if c == '"':
+                in_quote = not in_quote
+            elif not in_quote:
+                if c in "&|\n":
+                    break
+                if c == ")" and depth > 0:
+                    break
+            chars.append(c)
+            self._pos += 1
+        return Simple("".join(chars).lstrip())
+
+    def _parse_if(self, depth):
+        self._read_word()
+        negate = False
+        case_insensitive = False
+        while True:
+            word = self._peek_word().lower()
+            if word == "/i":
+                case_insensitive = True
+                self._read_word()
+            elif word == "not":
+                negate = True
+                self._read_word()
+            else:
+                break
+
+        word = self._peek_word().lower()
+        if word in ("defined", "errorlevel", "exist"):
+            self._read_word()
+            kind = word
+            operands = [self._read_word()]
+        else:
+            left = self._read_token()
+            self._skip_spaces()
+            if self._peek(2) == "==":
+                self._pos += 2
+                kind = "=="
+            else:
+                kind = self._read_word().upper()
+                if kind not in self._COMPARE_OPERATORS:
+                    raise EmulatorError("Unsupported if operator: %s" % kind)
+            right = self._read_token()
+            operands = [left, right]
+
+        then_ = self._parse_body(depth, True)
+        else_ = None
+        pos = self._pos
+        self._skip_spaces()
+        if self._peek_word().lower() == "else":
+            self._read_word()
+            else_ = self._parse_body(depth)
+        else:
+            self._pos = pos
+        return If(negate, case_insensitive, kind, operands, then_, else_)
+
+    def _parse_for(self, depth):
+        self._read_word()
+        switch = None
+        options = ""
+        self._skip_spaces()
+        if self._peek() == "/":
+            switch = self._read_word().lower()
+            self._skip_spaces()
+            if self._peek() == '"':
+                end = self._text.index('"', self._pos + 1)
+                options = self._text[self._pos + 1:end]
+                self._pos = end + 1
+        variant = self._read_word()
+        if self._read_word().lower() != "in":
+            raise EmulatorError("Malformed for command")
+        self._skip_spaces()
+        if self._peek() != "(":
+            raise EmulatorError("Malformed for command")
+        level = 0
+        in_quote = False
+        start = self._pos + 1
+        while True:
+            c = self._text[self._pos]
+            if c == '"':
+                in_quote = not in_quote
+            elif not in_quote and c == "(":
+                level += 1
+            elif not in_quote and c == ")":
+                level -= 1
+                if level == 0:
+                    break
+            self._pos += 1
+        set_text = self._text[start:self._pos]
+        self._pos += 1
+        if self._read_word().lower() != "do":
+            raise EmulatorError("Malformed for command")
+        body = self._parse_body(depth)
+        return For(switch, options, variant.lstrip("%"), set_text, body)
+
+def _unbalanced(text):
+    level = 0
+    in_quote = False
+    for c in text:
+        if c == '"':
+            in_quote = not in_quote
+        elif c == "\n":
+            in_quote = False
+        elif not in_quote:
+            if c == "(":
+                level += 1
+            elif c == ")" and level > 0:
+                level -= 1
+    return level > 0
+
+class _Frame(object):
+    def __init__(self, label, args):
+        self.label = label
+        self.args = list(args)
+        self.shift = 0
+        self.setlocal_depth = 0
+
+    def arg(self, index):
+        index += self.shift
+        if index == 0:
+            return self.label
+        if index < len(self.args) + 1:
+            return self.args[index - 1]
+        return ""
+
+class _Environment(object):
+    def __init__(self):
+        self._values = {}
+
+    def get(self, name, default=None):
+        item = self._values.get(name.upper())
+        if item is None:
+            return default
+        return item
+
+    def set(self, name, value):
+        if value == "":
+            self._values.pop(name.upper(), None)
+        else:
+            self._values[name.upper()] = value
+
+    def copy(self):
+        other = _Environment()
+        other._values = dict(self._values)
+        return other
+
+    def __len__(self):
+        return len(self._values)
+
+class _Expression(object):
+    '''
+    A "set /a" expression, with cmd.exe's 32 bits integers.
+    '''
+
+    _TOKEN_RE = re.compile(
+        r"\s*(?:(?P<number>0[xX][0-9a-fA-F]+|\d+)"
+        r"|(?P<operator><<=|>>=|<<|>>|[*/%+\-&^|]=|[()!~*/%+\-&^|=,])"
+        r"|(?P<name>[^\s()!~*/%+\-&^|=,<>]+))")
+
+    _BINARY = [
+        ("|",), ("^",), ("&",), ("<<", ">>"), ("+", "-"), ("*", "/", "%"),
+    ]
+
+    def __init__(self, emulator, text):
+        self._emulator = emulator
+        self._tokens = []
+        pos = 0
+        text = text.replace('"', "")
+        while pos < len(text):
+            if text[pos:].strip() == "":
+                break
+            match = self._TOKEN_RE.match(text, pos)
+            if match is None or match.end() == pos:
+                raise EmulatorError("Invalid expression: %s" % text)
+            for kind in ("number", "operator", "name"):
+                if match.group(kind) is not None:
+                    self._tokens.append((kind, match.group(kind)))
+                    break
+            pos = match.end()
+        self._index = 0
+
+    @classmethod
+    def wrap(cls, value):
+        value &= 0xFFFFFFFF
+        if value & 0x80000000:
+            value -= 0x100000000
+        return value
+
+    @classmethod
+    def parse_number(cls, text):
+        match = re.match(r"\s*([+-]?)(0[xX][0-9a-fA-F]+|0[0-7]*|[1-9]\d*)", text)
+        if match is None:
+            return 0
+        digits = match.group(2)
+        if digits.lower().startswith("0x"):
+            value = int(digits, 16)
+        elif digits.startswith("0") and len(digits) > 1:
+            value = int(digits, 8)
+        else:
+            value = int(digits)
+        if match.group(1) == "-":
+            value = -value
+        return cls.wrap(value)
+
+    def _peek(self):
+        if self._index < len(self._tokens):
+            return self._tokens[self._index]
+        return (None, None)
+
+    def _next(self):
+        token = self._peek()
+        self._index += 1
+        return token
+
+    def evaluate(self):
+        value = 0
+        while self._index < len(self._tokens):
+            value = self._assignment()
+            if self._peek() == ("operator", ","):
+                self._next()
+            elif self._index < len(self._tokens):
+                raise EmulatorError("Missing operator")
+        return value
+
+    def _assignment(self):
+        kind, text = self._peek()
+        if kind == "name" and self._index + 1 < len(self._tokens):
+            next_kind, next_text = self._tokens[self._index + 1]
+            if next_kind == "operator" and next_text.endswith("=") and next_text != "==":
+                self._index += 2
+                value = self._assignment()
+                if next_text != "=":
+                    value = self._apply(
+                        next_text[:-1], self._variant_value(text), value)
+                value = self.wrap(value)
+                self._emulator._set_variant(text, str(value))
+                return value
+        return self._binary(0)
+
+    def _apply(self, operator, left, right):
+        if operator == "+":
+            return self.wrap(left + right)
+        if operator == "-":
+            return self.wrap(left - right)
+        if operator == "*":
+            return self.wrap(left * right)
+        if operator in ("/", "%"):
+            if right == 0:
+                raise EmulatorError("Divide by zero error.")
+            quotient = abs(left) // abs(right)
+            if (left < 0) != (right < 0):
+                quotient = -quotient
+            if operator == "/":
+                return self.wrap(quotient)
+            return self.wrap(left - quotient * right)
+        if operator == "<<":
+            return self.wrap(left << (right & 31))
+        if operator == ">>":
+            return left >> (right & 31)
+        if operator == "&":
+            return left & right
+        if operator == "|":
+            return left | right
+        if operator == "^":
+            return left ^ right
+        raise EmulatorError("Unknown operator %s" % operator)
+
+    def _binary(self, level):
+        if level >= len(self._BINARY):
+            return self._unary()
+        value = self._binary(level + 1)
+        while True:
+            kind, text = self._peek()
+            if kind == "operator" and text in self._BINARY[level]:
+                self._next()
+                value = self._apply(text, value, self._binary(level + 1))
+            else:
+                return value
+
+    def _unary(self):
+        kind, text = self._next()
+        if kind == "operator":
+            if text == "(":
+                value = self._assignment()
+                while self._peek() == ("operator", ","):
+                    self._next()
+                    value = self._assignment()
+                if self._next() != ("operator", ")"):
+                    raise EmulatorError("Unbalanced parentheses")
+                return value
+            if text == "-":
+                return self.wrap(-self._unary())
+            if text == "+":
+                return self._unary()
+            if text == "~":
+                return self.wrap(~self._unary())
+            if text == "!":
+                return int(self._unary() == 0)
+        elif kind == "number":
+            return self.parse_number(text)
+        elif kind == "name":
+            return self._variant_value(text)
+        raise EmulatorError("Missing operand")
+
+    def _variant_value(self, name):
+        return self.parse_number(self._emulator._get_variant(name, ""))
+
+class Result(object):
+    '''
+    Output and execution profile of a run.
+
+    label_scan_bytes sums the distances cmd.exe reads through the script to
+    find the targets of goto and call, calls counts the calls of each label.
+    '''
+
+    def __init__(self):
+        self.stdout = []
+        self.exit_code = 0
+        self.commands = 0
+        self.label_scan_bytes = 0
+        self.label_scans = 0
+        self.calls = collections.Counter()
+        self.gotos = collections.Counter()
+        self.peak_environment = 0
+        self.errors = []
+
+    @property
+    def output(self):
+        return "".join(self.stdout)
+
+    def to_dict(self):
+        return {
+            "exit_code": self.exit_code,
+            "commands": self.commands,
+            "label_scans": self.label_scans,
+            "label_scan_bytes": self.label_scan_bytes,
+            "peak_environment": self.peak_environment,
+            "calls": dict(self.calls),
+            "gotos": dict(self.gotos),
+            "errors": self.errors,
+        }
+
+class Emulator(object):
+    '''
+    Execute a batch script with the subset of cmd.exe generated scripts and
+    site.bat use: set, set /a, setlocal/endlocal, delayed expansion, call
+    :label, goto, if, for (plain, /l and /f over strings), shift, echo and
+    exit /b.
+
+    Lines are expanded and parsed when they are reached, like cmd.exe does,
+    so "%...%" is expanded once per line (or parenthesized block) and
+    "!...!" when a command runs. In strict mode an unsupported command
+    raises EmulatorError, otherwise it's recorded in the result.
+    '''
+
+    DEFAULT_MAX_COMMANDS = 10000000
+
+    def __init__(self, script, strict=True, max_commands=DEFAULT_MAX_COMMANDS):
+        self._lines = script.replace("\r\n", "\n").split("\n")
+        self._offsets = []
+        offset = 0
+        for line in self._lines:
+            self._offsets.append(offset)
+            offset += len(line.encode("utf-8")) + 2
+        self._size = offset
+        self._labels = {}
+        for index, line in enumerate(self._lines):
+            name = self._label_name(line)
+            if name is not None:
+                self._labels.setdefault(name.lower(), []).append(index)
+
+        self._strict = strict
+        self._max_commands = max_commands
+        self._env = _Environment()
+        self._env_stack = []
+        self._delayed = False
+        self._echo = True
+        self._errorlevel = 0
+        self._frames = []
+        self._result = None
+
+    @classmethod
+    def _label_name(cls, line):
+        line = line.lstrip(" \t@")
+        if not line.startswith(":") or line.startswith("::"):
+            return None
+        match = re.match(r":([^\s:+;,=]+)", line)
+        if match is None:
+            return None
+        return match.group(1)
+
+    def run(self, args=(), environment=None):
+        self._result = Result()
+        if environment is not None:
+            for name, value in environment.items():
+                self._env.set(name, value)
+        frame = _Frame("script", args)
+        self._frames.append(frame)
+        try:
+            self._run_frame(0)
+        except _Exit as e:
+            self._errorlevel = e.code
+        self._result.exit_code = self._errorlevel
+        return self._result
+
+    def _error(self, message):
+        self._result.errors.append(message)
+        if self._strict:
+            raise EmulatorError(message)
+
+    def _get_variant(self, name, default=""):
+        if name.upper() == "ERRORLEVEL" and self._env.get(name) is None:
+            return str(self._errorlevel)
+        return self._env.get(name, default)
+
+    def _set_variant(self, name, value):
+        self._env.set(name, value)
+        if len(self._env) > self._result.peak_environment:
+            self._result.peak_environment = len(self._env)
+
+    # Phase 1: percent expansion, performed when a line is read
+    def _expand_percent(self, text):
+        frame = self._frames[-1]
+        chars = []
+        i = 0
+        length = len(text)
+        while i < length:
+            c = text[i]
+            if c != "%":
+                chars.append(c)
+                i += 1
+                continue
+            if i + 1 >= length:
+                i += 1
+                continue
+            c1 = text[i + 1]
+            if c1 == "%":
+                chars.append("%")
+                i += 2
+            elif c1.isdigit():
+                chars.append(frame.arg(int(c1)))
+                i += 2
+            elif c1 == "*":
+                chars.append(" ".join(frame.args))
+                i += 2
+            elif c1 == "~" and i + 2 < length and text[i + 2].isdigit():
+                chars.append(frame.arg(int(text[i + 2])).strip('"'))
+                i += 3
+            else:
+                end = text.find("%", i + 1)
+                if end < 0 or "\n" in text[i + 1:end]:
+                    i += 1
+                    continue
+                chars.append(self._expand_name(text[i + 1:end]))
+                i = end + 1
+        return "".join(chars)
+
+    # Phase 5: delayed expansion, performed when a command executes
+    def _expand_delayed(self, text):
+        if not self._delayed or "!" not in text:
+            return text
+        chars = []
+        i = 0
+        length = len(text)
+        while i < length:
+            c = text[i]
+            if c == "^" and i + 1 < length:
+                chars.append(text[i + 1])
+                i += 2
+                continue
+            if c != "!":
+                chars.append(c)
+                i += 1
+                continue
+            end = text.find("!", i + 1)
+            if end < 0:
+                i += 1
+                continue
+            chars.append(self._expand_name(text[i + 1:end]))
+            i = end + 1
+        return "".join(chars)
+
+    def _expand_name(self, expression):
+        name = expression
+        modifier = None
+        if ":" in expression:
+            name, modifier = expression.split(":", 1)
+        value = self._get_variant(name, "")
+        if modifier is None:
+            return value
+        if modifier.startswith("~"):
+            parts = modifier[1:].split(",")
+            try:
+                start = _Expression.parse_number(parts[0]) if parts[0] else 0
+                count = None
+                if len(parts) > 1:
+                    count = _Expression.parse_number(parts[1])
+            except ValueError:
+                return ""
+            size = len(value)
+            if start < 0:
+                start = max(0, size + start)
+            if start > size:
+                return ""
+            if count is None:
+                return value[start:]
+            end = start + count if count >= 0 else size + count
+            if end <= start:
+                return ""
+            return value[start:end]
+        if "=" in modifier:
+            old, new = modifier.split("=", 1)
+            if old.startswith("*"):
+                index = value.lower().find(old[1:].lower())
+                if index < 0:
+                    return value
+                return new + value[index + len(old) - 1:]
+            if old == "":
+                return value
+            return re.sub(re.escape(old), lambda m: new, value, flags=re.I)
+        return value
+
+    def _substitute_for(self, text, for_variants):
+        if not for_variants or "%" not in text:
+            return text
+        def replace(match):
+            modifier, name = match.group(1), match.group(2)
+            if name not in for_variants:
+                return match.group(0)
+            value = for_variants[name]
+            if modifier:
+                value = value.strip('"')
+            return value
+        return re.sub(r"%(~?)([A-Za-z])", replace, text)
+
+    def _read_logical_line(self, index):
+        text = self._expand_percent(self._lines[index])
+        index += 1
+        while _unbalanced(text) and index < len(self._lines):
+            text += "\n" + self._expand_percent(self._lines[index])
+            index += 1
+        return text, index
+
+    def _find_label(self, name, current):
+        candidates = self._labels.get(name.lower())
+        if not candidates:
+            return None
+        # cmd.exe searches forward from the current line and wraps around
+        position = self._offsets[current] if current < len(self._offsets) else self._size
+        for index in candidates:
+            if index >= current:
+                self._result.label_scan_bytes += self._offsets[index] - position
+                self._result.label_scans += 1
+                return index
+        index = candidates[0]
+        self._result.label_scan_bytes += self._size - position + self._offsets[index]
+        self._result.label_scans += 1
+        return index
+
+    def _run_frame(self, index):
+        while index < len(self._lines):
+            line = self._lines[index]
+            stripped = line.strip()
+            if (stripped == "" or stripped.startswith(":")
+                    or stripped.lower().startswith("rem ")
+                    or stripped.lower() == "rem"):
+                index += 1
+                continue
+
+            text, next_index = self._read_logical_line(index)
+            sequence = _Parser(text).parse_sequence()
+            try:
+                self._execute_sequence(sequence, {}, next_index)
+            except _Goto as e:
+                target = self._find_label(e.label, next_index)
+                if target is None:
+                    if e.label.lower() == "eof":
+                        return
+                    self._error("The system cannot find the batch label specified - %s" % e.label)
+                    return
+                index = target + 1
+                continue
+            index = next_index
+
+    def _execute_sequence(self, sequence, for_variants, next_index):
+        succeeded = True
+        for operator, command in sequence.items:
+            if operator == "&&" and not succeeded:
+                continue
+            if operator == "||" and succeeded:
+                continue
+            self._execute(command, for_variants, next_index)
+            succeeded = self._errorlevel == 0
+
+    def _count(self):
+        self._result.commands += 1
+        if self._result.commands > self._max_commands:
+            raise EmulatorError("Command limit exceeded")
+
+    def _execute(self, command, for_variants, next_index):
+        if isinstance(command, Block):
+            self._execute_sequence(command.sequence, for_variants, next_index)
+        elif isinstance(command, If):
+            self._count()
+            if self._test(command, for_variants):
+                self._execute(command.then_, for_variants, next_index)
+            elif command.else_ is not None:
+                self._execute(command.else_, for_variants, next_index)
+        elif isinstance(command, For):
+            self._count()
+            self._execute_for(command, for_variants, next_index)
+        else:
+            text = self._substitute_for(command.text, for_variants)
+            text = self._expand_delayed(text)
+            self._execute_simple(text, next_index)
+
+    def _expand_operand(self, text, for_variants):
+        return self._expand_delayed(self._substitute_for(text, for_variants))
+
+    def _test(self, command, for_variants):
+        operands = [self._expand_operand(x, for_variants) for x in command.operands]
+        if command.kind == "defined":
+            result = self._get_variant(operands[0], None) is not None
+        elif command.kind == "errorlevel":
+            result = self._errorlevel >= _Expression.parse_number(operands[0])
+        elif command.kind == "exist":
+            result = False
+        else:
+            left, right = operands
+            if command.case_insensitive:
+                left, right = left.lower(), right.lower()
+            if command.kind == "==":
+                result = left == right
+            else:
+                number_re = r"^[+-]?(0[xX][0-9a-fA-F]+|0[0-7]*|[1-9]\d*)$"
+                if re.match(number_re, left) and re.match(number_re, right):
+                    left = _Expression.parse_number(left)
+                    right = _Expression.parse_number(right)
+                result = {
+                    "EQU": lambda a, b: a == b,
+                    "NEQ": lambda a, b: a != b,
+                    "LSS": lambda a, b: a < b,
+                    "LEQ": lambda a, b: a <= b,
+                    "GTR": lambda a, b: a > b,
+                    "GEQ": lambda a, b: a >= b,
+                }[command.kind](left, right)
+        return result != command.negate
+
+    def _execute_for(self, command, for_variants, next_index):
+        set_text = self._expand_operand(command.set_text, for_variants)
+        variant = command.variant
+
+        def run_body(values):
+            variants = dict(for_variants)
+            variants.update(values)
+            self._execute(command.body, variants, next_index)
+
+        if command.switch == "/l":
+            parts = [x for x in re.split(r"[\s,]+", set_text.strip()) if x]
+            start, step, end = [_Expression.parse_number(x) for x in (parts + ["0", "0", "0"])[:3]]
+            value = start
+            while (step > 0 and value <= end) or (step < 0 and value >= end):
+                run_body({variant: str(value)})
+                value += step
+            if step == 0 and start <= end:
+                raise EmulatorError("Endless for /l loop")
+        elif command.switch == "/f":
+            options = self._expand_operand(command.options, for_variants)
+            tokens = [1]
+            delims = " \t"
+            for match in re.finditer(r"(tokens|delims)=([^ ]*)", options):
+                if match.group(1) == "tokens":
+                    tokens = []
+                    for part in match.group(2).split(","):
+                        if "-" in part:
+                            low, high = part.split("-")
+                            tokens += list(range(int(low), int(high) + 1))
+                        elif part:
+                            tokens.append(int(part))
+                else:
+                    delims = match.group(2)
+            text = set_text.strip()
+            if not (text.startswith('"') and text.endswith('"')):
+                self._error("for /f over files is not supported: %s" % text)
+                return
+            for line in text[1:-1].split("\n"):
+                if delims:
+                    fields = [x for x in re.split("[%s]+" % re.escape(delims), line) if x]
+                else:
+                    fields = [line]
+                if not fields or fields[0].startswith(";"):
+                    continue
+                values = {}
+                found = False
+                for i, token in enumerate(tokens):
+                    name = chr(ord(variant) + i)
+                    if token - 1 < len(fields):
+                        values[name] = fields[token - 1]
+                        found = True
+                    else:
+                        values[name] = ""
+                if found:
+                    run_body(values)
+        else:
+            for item in re.findall(r'"[^"]*"|[^\s,;=]+', set_text):
+                run_body({variant: item})
+
+    def _execute_simple(self, text, next_index):
+        if ">" in text:
+            text = self._strip_redirection(text)
+        # Trailing spaces are part of the command, echo prints them
+        text = text.lstrip()
+        if text.strip() == "":
+            return
+        if text.startswith(":"):
+            return
+
+        self._count()
+        match = re.match(r"(\S+)\s*(.*)$", text, re.S)
+        name = match.group(1).lower()
+        rest = match.group(2)
+
+        if name == "rem" or name.startswith("::"):
+            return
+        if name == "set":
+            self._execute_set(rest)
+        elif name in ("setlocal", "endlocal"):
+            if name == "setlocal":
+                self._env_stack.append((self._env.copy(), self._delayed))
+                self._frames[-1].setlocal_depth += 1
+                option = rest.strip().lower()
+                if option == "enabledelayedexpansion":
+                    self._delayed = True
+                elif option == "disabledelayedexpansion":
+                    self._delayed = False
+            else:
+                self._endlocal()
+        elif name == "call":
+            self._execute_call(self._expand_percent(rest), next_index)
+        elif name == "goto":
+            label = rest.split()[0] if rest.split() else ""
+            label = label.lstrip(":")
+            self._result.gotos[label] += 1
+            raise _Goto(label)
+        elif name == "exit":
+            parts = rest.split()
+            is_batch_exit = len(parts) > 0 and parts[0].lower() == "/b"
+            if is_batch_exit:
+                parts = parts[1:]
+            code = _Expression.parse_number(parts[0]) if parts else self._errorlevel
+            self._errorlevel = code
+            raise _Exit(code, is_batch_exit)
+        elif name == "shift":
+            self._frames[-1].shift += 1
+        elif name.startswith("echo"):
+            self._execute_echo(text[4:])
+        else:
+            self._error("Unsupported command: %s" % text)
+
+    @classmethod
+    def _strip_redirection(cls, text):
+        parts = re.split(r'("[^"]*")', text)
+        for i in range(0, len(parts), 2):
+            parts[i] = re.sub(r'\s*\d?>>?\s*(&\d|NUL\b)', "", parts[i], flags=re.I)
+        return "".join(parts)
+
+    def _endlocal(self):
+        frame = self._frames[-1]
+        if frame.setlocal_depth <= 0:
+            return
+        frame.setlocal_depth -= 1
+        self._env, self._delayed = self._env_stack.pop()
+
+    def _execute_echo(self, rest):
+        if rest.startswith(".") or rest.startswith("("):
+            self._result.stdout.append(rest[1:] + "\n")
+            return
+        rest = rest[1:] if rest[:1] in (" ", "\t") else rest
+        if rest.strip().lower() in ("off", "on"):
+            self._echo = rest.strip().lower() == "on"
+            return
+        if rest.strip() == "":
+            self._result.stdout.append("ECHO is %s.\n" % ("on" if self._echo else "off"))
+            return
+        self._result.stdout.append(rest + "\n")
+
+    def _execute_set(self, rest):
+        rest = rest.strip()
+        if rest.lower().startswith("/a"):
+            expression = rest[2:].strip()
+            _Expression(self, expression).evaluate()
+            self._errorlevel = 0
+            return
+        if rest.startswith('"'):
+            end = rest.rfind('"')
+            rest = rest[1:end] if end > 0 else rest[1:]
+        if "=" not in rest:
+            self._error("Unsupported set command: set %s" % rest)
+            return
+        name, value = rest.split("=", 1)
+        self._set_variant(name, value)
+
+    def _execute_call(self, rest, next_index):
+        rest = rest.strip()
+        if not rest.startswith(":"):
+            self._error("Only calls to labels are supported: call %s" % rest)
+            return
+        parts = re.findall(r'"[^"]*"|[^\s,;=]+', rest)
+        label = parts[0][1:]
+        args = parts[1:]
+        target = self._find_label(label, next_index)
+        if target is None:
+            self._errorlevel = 1
+            self._error("The system cannot find the batch label specified - %s" % label)
+            return
+        self._result.calls[":" + self._label_name(self._lines[target])] += 1
+        frame = _Frame(":" + label, args)
+        self._frames.append(frame)
+        try:
+            self._run_frame(target + 1)
+        except _Exit as e:
+            if not e.is_batch_exit:
+                raise
+            self._errorlevel = e.code
+        finally:
+            while frame.setlocal_depth > 0:
+                self._endlocal()
+            self._frames.pop()
+
+def run(script, args=(), strict=True):
+    return Emulator(script, strict=strict).run(args)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    parser = argparse.ArgumentParser(
+        description="Execute a generated batch script with the cmd.exe subset emulator")
+    parser.add_argument("-p", "--profile",
+                        help="Write the execution profile to a JSON file, "
+                             "usable by --layout-profile of pytoshell")
+    parser.add_argument("--no-strict",
+                        help="Report unsupported commands instead of failing",
+                        action="store_true",
+                        default=False)
+    parser.add_argument("file_path", help="Batch script path")
+    parser.add_argument("args", nargs="*", help="Script arguments")
+    args = parser.parse_args(argv)
+
+    with io.open(args.file_path) as script_file:
+        script = script_file.read()
+    # Each call of the script nests a few python frames
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+    result = run(script, args.args, strict=not args.no_strict)
+    sys.stdout.write(result.output)
+    if args.profile is not None:
+        with io.open(args.profile, "w") as profile_file:
+            profile_file.write(json.dumps(result.to_dict(), indent=2, sort_keys=True))
+    return result.exit_code
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -6,6 +6,10 @@ class Translator(ast.NodeVisitor):
     def __init__(self):
         super().__init__()
         self._is_bootstrap=False
+        self._layout = "source"
+        self._layout_profile = None
+        self._is_collecting_stats = False
+        self._source_path = None
 
     @property
     def is_bootstrap(self):
@@ -15,8 +19,57 @@ class Translator(ast.NodeVisitor):
     def is_bootstrap(self, value):
         self._is_bootstrap = value
 
+    @property
+    def layout(self):
+        return self._layout
+
+    @layout.setter
+    def layout(self, value):
+        self._layout = value
+
+    @property
+    def layout_profile(self):
+        return self._layout_profile
+
+    @layout_profile.setter
+    def layout_profile(self, value):
+        self._layout_profile = value
+
+    @property
+    def is_collecting_stats(self):
+        return self._is_collecting_stats
+
+    @is_collecting_stats.setter
+    def is_collecting_stats(self, value):
+        self._is_collecting_stats = value
+
+    @property
+    def source_path(self):
+        '''
+        Path of the source being translated, local modules it imports are
+        looked up beside it. None if it isn't a file.
+        '''
+
+        return self._source_path
+
+    @source_path.setter
+    def source_path(self, value):
+        self._source_path = value
+
+    @property
+    def stats(self):
+        '''
+        RoutineStats of each routine of the last generated script, empty
+        unless is_collecting_stats is set.
+        '''
+
+        return []
+
     def get_module_path(self):
         return _get_data_path(self._module_dir)
 
+    def generate(self, node):
+        raise NotImplementedError("You must implement generate()!")
+
     def translate(self, node):
-        raise NotImplemented("You must implement generate()!")
+        return "\n".join(self.generate(node))
@@ -0,0 +1,138 @@
+import ast
+import os.path
+from . import sh
+
+class Translator(sh.Translator):
+    '''
+    Translate to a bash (4.0 or later) script.
+
+    Like the sh translator, but tuples are runs of an indexed array and the
+    attributes of instances are kept in an associative array, with their type
+    tags in parallel arrays, so indexing, len() and attribute access read an
+    array element instead of calling the runtime or eval. The slots of a
+    tuple are unset when the variant owning it lets it go.
+    '''
+
+    file_extensions = ['bash']
+    _module_dir = os.path.splitext(os.path.basename(__file__))[0]
+
+    SHEBANG = "#!/bin/bash"
+
+    _library_modules = ["sh", "bash"]
+
+    _library = None
+
+    # A tuple is the offset of its length in these arrays, its elements and
+    # their type tags follow the length. The offset of the next tuple is in
+    # TUPLE_END.
+    TUPLE_VALUES = "PYTSH"
+    TUPLE_TYPES = "PYTSHT"
+    TUPLE_END = "PYTSRTEMP_TUPLE_END"
+
+    # Attributes of instances and their type tags, keyed "(Instance)_(Name)"
+    ATTRIBUTE_VALUES = "PYTSD"
+    ATTRIBUTE_TYPES = "PYTSDT"
+
+    @classmethod
+    def _format_int_test(cls, left, operator, right):
+        return "(( %s %s %s ))" % (left, sh._ARITHMETIC_OPERATORS[operator], right)
+
+    @classmethod
+    def _format_str_test(cls, left, operator, right):
+        return "[[ %s %s %s ]]" % (left, sh._ARITHMETIC_OPERATORS[operator], right)
+
+    def _parse_Tuple(self, node, source, variant):
+        # Slots are taken from the end, the tuple owns the tuples in it
+        elements = [(str(len(node.elts)), "int")]
+        for element in node.elts:
+            elements.append(self._get_owned_operand(element, source))
+
+        offset_variant = source.create_temp_varaint()
+        offset_variant = sh.Variant(offset_variant.name, offset_variant.tag, False)
+        source.add_initialize("%s=$%s %s=$((%s + %s))" % (
+            offset_variant.id_, self.TUPLE_END, self.TUPLE_END, self.TUPLE_END, len(elements)))
+        assignments = []
+        for i, (value, type_) in enumerate(elements):
+            offset = offset_variant.expression
+            if i > 0:
+                offset += " + %s" % i
+            assignments.append("%s[%s]=%s %s[%s]=%s" % (
+                self.TUPLE_VALUES, offset, value, self.TUPLE_TYPES, offset, type_))
+        source.add_initialize(" ".join(assignments))
+        source.add_initialize(self._cg.set_variant(variant, offset_variant.value, "tuple"))
+
+    def _get_tuple_offset(self, tuple_variant, index):
+        # Arithmetic expression of the offset of element index (an
+        # arithmetic expression too) of the tuple
+        expression = tuple_variant.expression
+        if index.isdigit():
+            return "%s + %s" % (expression, int(index) + 1)
+        return "%s + 1 + (%s < 0 ? %s[%s] + %s : %s)" % (
+            expression, index, self.TUPLE_VALUES, expression, index, index)
+
+    def _get_tuple_element(self, offset):
+        return ('"${%s[%s]}"' % (self.TUPLE_VALUES, offset),
+                '"${%s[%s]}"' % (self.TUPLE_TYPES, offset))
+
+    def _add_tuple_element(self, source, tuple_variant, index, variant):
+        source.add_initialize(self._cg.set_variant(variant, *self._get_tuple_element(
+            self._get_tuple_offset(tuple_variant, str(index)))))
+
+    def _get_length(self, node, type_, source):
+        if type_ == "tuple":
+            return '"${%s[%s]}"' % (
+                self.TUPLE_VALUES, self._get_value_variant(node, source).expression)
+        return super()._get_length(node, type_, source)
+
+    def _is_int_index(self, node):
+        return self._is_int(node) or (
+            isinstance(node, ast.Constant) and type(node.value) is int)
+
+    def _get_item(self, node, source):
+        type_ = self._types.get_type(node.value)
+        index = node.slice
+        if type_ == "str" and self._is_int_index(index):
+            # Offsets counted from the end are negative, like python
+            value_variant = self._get_value_variant(node.value, source)
+            return ('"%s"' % value_variant.get_ref(
+                ":(%s):1" % self._get_int_expression(index, source)), "str")
+        elif type_ == "tuple" and self._is_int_index(index):
+            tuple_variant = self._get_value_variant(node.value, source)
+            return self._get_tuple_element(self._get_tuple_offset(
+                tuple_variant, self._get_int_expression(index, source)))
+
+        return super()._get_item(node, source)
+
+    def _get_attribute_key(self, object_variant, name):
+        return "%s_%s" % (object_variant.get_ref(), name)
+
+    def _add_attribute_store(self, source, object_variant, name, value_variant, type_):
+        key = self._get_attribute_key(object_variant, name)
+        source.add_initialize("%s[%s]=%s %s[%s]=%s" % (
+            self.ATTRIBUTE_VALUES, key, value_variant.value,
+            self.ATTRIBUTE_TYPES, key, type_))
+
+    def _add_attribute_load(self, source, object_variant, name, variant):
+        key = self._get_attribute_key(object_variant, name)
+        source.add_initialize(self._cg.set_variant(
+            variant, '"${%s[%s]}"' % (self.ATTRIBUTE_VALUES, key),
+            '"${%s[%s]}"' % (self.ATTRIBUTE_TYPES, key)))
+
+    def _parse_tuple_for(self, node, source, target_variant):
+        # Offsets of the elements are counted, the end is read once
+        tuple_variant = self._get_value_variant(node.iter, source)
+        index_variant = source.create_temp_varaint()
+        end_variant = source.create_temp_varaint()
+        source.add_initialize("%s=$((%s)) %s=$((%s))" % (
+            index_variant.id_, self._get_tuple_offset(tuple_variant, "0"),
+            end_variant.id_, "%s + %s[%s]" % (
+                tuple_variant.expression, self.TUPLE_VALUES, tuple_variant.expression)))
+        source.add_initialize("while %s; do" % self._format_int_test(
+            index_variant.id_, "LEQ", end_variant.id_))
+        body_source = sh.Source(self._cg)
+        self._add_element_store(node, body_source, target_variant, [self._cg.set_variant(
+            target_variant, *self._get_tuple_element(index_variant.id_))])
+        body_source.add_initialize("%s=$((%s + 1))" % (index_variant.id_, index_variant.id_))
+        body_source.append(self._parse_node(node.body))
+        self._add_block(source, body_source)
+        source.add_initialize("done")
@@ -1,8 +1,23 @@
 import ast
 import six
+import itertools
+import logging
 import os.path
-import weakref
 from . import base
+from .linker import Library, Routine
+from .layout import HotLayout
+from .folding import ConstantFolder
+from .escape import EscapeAnalysis
+from .inliner import Inliner
+from .typeinfer import TypeInference
+from .tree import NodeIndex
+from .modules import (
+    ModuleCache, ModuleUnit, NamespaceRewriter, find_module, get_digest,
+    get_import_bindings, get_imported_names, get_module_names, read_source)
+from .regalloc import TempAllocator
+from .peephole import Peephole
+from .stats import collect_routine_stats
+from .cmdsyntax import get_label, is_label
 from .. import _get_data_path
 
 class LocalContext(object):
@@ -47,26 +62,33 @@ class Object(object):
 
     @classmethod
     def _escape_name(cls, name):
-        chars = []
-
+        # Keep the type info suffix as is
+        suffix = ""
         if name.endswith("-T"):
             name = name[:-2]
+            suffix = "-T"
+
+        # Most names (and all temporary ones) have nothing to escape
+        if name == name.lower():
+            return name + suffix
 
+        chars = []
         for c in name:
             if c.isupper():
                 chars.append("#")
             chars.append(c)
-        return ''.join(chars)
+        return ''.join(chars) + suffix
 
     @classmethod
     def _unescape_name(cls, name):
         chars = []
-        for i in range(len(name)):
-            c = name[i]
+        is_upper = False
+        for c in name:
             if c == "#":
-                i += 1
-                c = name[i].upper()
-            chars.append(c)
+                is_upper = True
+                continue
+            chars.append(c.upper() if is_upper else c)
+            is_upper = False
         return "".join(chars)
 
 class Function(Object):
@@ -86,8 +108,22 @@ class Label(Object):
         return ":" + super().id_
 
 class Variant(Object):
-    def __init__(self, name, tag=Object.TAG_NORMAL):
+    def __init__(self, name, tag=Object.TAG_NORMAL, is_typed=True,
+                 is_length_cached=False):
         super().__init__(name, tag)
+        # Variants of a statically known type don't keep a type tag
+        self._is_typed = is_typed
+        # The length of the value could be cached in "(Name)-L", setting the
+        # variant clears it
+        self._is_length_cached = is_length_cached
+
+    @property
+    def is_typed(self):
+        return self._is_typed
+
+    @property
+    def is_length_cached(self):
+        return self._is_length_cached
 
     @property
     def value(self):
@@ -117,13 +153,38 @@ class ArgumentVariant(Variant):
     def value(self):
         return "%%%s%%" % super().value
 
+class ParameterVariant(Variant):
+    '''
+    A parameter read from the variant the caller passed, "%1" expands to
+    its name.
+    '''
+
+    def __init__(self, index, suffix=""):
+        super().__init__(index)
+        self._suffix = suffix
+
+    @property
+    def id_(self):
+        return "%%%s%s" % (self.name, self._suffix)
+
+    @property
+    def value(self):
+        return "!%s!" % self.id_
+
+    @property
+    def type_info(self):
+        return ParameterVariant(self.name, self._suffix + "-T")
+
 class RetVariant(Variant):
     def __init__(self):
         super().__init__("", Object.TAG_RET)
 
 class CommandGenerator(object):
-    def __init__(self):
+    def __init__(self, label_prefix=""):
         self._variant_id = 0
+        # Labels of an imported module are prefixed by its name, they don't
+        # clash with the ones of other modules linked into the same script
+        self._label_prefix = label_prefix
 
     def _new_variant_id(self):
         self._variant_id += 1
@@ -133,7 +194,7 @@ class CommandGenerator(object):
         return Variant(self._new_variant_id(), Object.TAG_RAW)
 
     def _new_label(self):
-        return Label(self._new_variant_id())
+        return Label("%s%s" % (self._label_prefix, self._new_variant_id()))
 
     @classmethod
     def _list_safe_append(cls, alist, value):
@@ -161,13 +222,15 @@ class CommandGenerator(object):
             value_type_info_value = ""
         else:
             value_value = value
-            if isinstance(value_value, six.string_types):
+            if isinstance(value_value, six.string_types) and not is_raw:
                 value_value = value_value.replace("%", "%%")
             value_type_info_value = type_
 
         command = 'set "%s=%s"' % (variant_id, value_value)
-        if not variant is None:
+        if (not variant is None) and variant.is_typed:
             command += ' & set "%s=%s"' % (variant_type_id, value_type_info_value)
+        if (not variant is None) and variant.is_length_cached:
+            command += ' & set "%s-L="' % variant_id
 
         return command
 
@@ -179,6 +242,13 @@ class CommandGenerator(object):
     def calcuate_expr(cls, expression, variant=RetVariant()):
         return 'set /a "%s=%s" > NUL' % (variant.id_, expression)
 
+    @classmethod
+    def calcuate_int(cls, expression, variant):
+        command = cls.calcuate_expr(expression, variant)
+        if variant.is_typed:
+            command = cls.exec_all(command, 'set "%s=int"' % variant.type_info.id_)
+        return command
+
     @classmethod
     def raw_return_(cls, value=None):
         if value is None:
@@ -186,7 +256,12 @@ class CommandGenerator(object):
         return "exit /b %s" % value
 
     @classmethod
-    def return_(cls, value=None):
+    def return_(cls, value=None, has_context=True, is_tuple=False):
+        '''
+        Return from a function, is_tuple tells whether the value is a tuple,
+        None if it's only known when it runs.
+        '''
+
         lines = []
 
         if value is None:
@@ -195,7 +270,15 @@ class CommandGenerator(object):
         if value.tag != Object.TAG_RET:
             cls._list_safe_append(lines, cls.set_variant(RetVariant(), value))
 
-        cls._list_safe_append(lines, cls.exec_all(cls.end_context(), "exit /b %ERRORLEVEL%"))
+        if has_context:
+            if is_tuple is None:
+                lines.append(cls.if_('"!@PYTSR-T!"=="tuple"', cls.pack_tuple()))
+            elif is_tuple:
+                lines.append(cls.pack_tuple())
+            cls._list_safe_append(lines, cls.exec_all(
+                cls.end_context(is_tuple is not False), "exit /b %ERRORLEVEL%"))
+        else:
+            cls._list_safe_append(lines, cls.raw_return_("%ERRORLEVEL%"))
 
         return lines
 
@@ -204,8 +287,21 @@ class CommandGenerator(object):
         return "setlocal EnableDelayedExpansion"
 
     @classmethod
-    def end_context(cls):
-        return cls.exec_all('endlocal', 'set "@PYTSR=%@PYTSR%"', 'set "@PYTSR-T=%@PYTSR-T%"')
+    def end_context(cls, is_tuple_kept=False):
+        command = cls.exec_all('endlocal', 'set "@PYTSR=%@PYTSR%"', 'set "@PYTSR-T=%@PYTSR-T%"')
+        if is_tuple_kept:
+            # Expands to the commands setting the elements :PYTSVtuple.__pack__
+            # packed, nothing if it wasn't called
+            command += "%@PYTSR-P%"
+        return command
+
+    @classmethod
+    def copy_tuple(cls, variant, value):
+        return "call :PYTSVtuple.__copy__ %s %s" % (variant.id_, value.id_)
+
+    @classmethod
+    def pack_tuple(cls):
+        return "call :PYTSVtuple.__pack__"
 
     @classmethod
     def comment(cls, text):
@@ -243,6 +339,10 @@ class CommandGenerator(object):
     def goto(cls, label):
         return "goto %s" % label.id_
 
+    @classmethod
+    def if_(cls, condition, command):
+        return "if %s %s" % (condition, command)
+
     @classmethod
     def bool_(cls, variant):
         return "call :PYTSVbool %s" % (variant.id_)
@@ -278,35 +378,157 @@ class CommandGenerator(object):
 
         return lines
 
+# Binary operator node class -> (expression operator, method name)
+OPERATORS = {
+    ast.Add: ("+", "__add__"),
+    ast.Sub: ("-", "__sub__"),
+    ast.Mult: ("*", "__mul__"),
+    ast.Div: ("/", "__truediv__"),
+    ast.Mod: ("%", "__mod__"),
+    ast.LShift: ("<<", "__lshift__"),
+    ast.RShift: (">>", "__rshift__"),
+    ast.BitOr: ("|", "__or__"),
+    ast.BitAnd: ("&", "__and__"),
+    ast.BitXor: ("^", "__xor__"),
+}
+
+# Compare operator node class -> ("if" operator, negated "if" operator)
+COMPARE_OPERATORS = {
+    ast.Eq: ("EQU", "NEQ"),
+    ast.NotEq: ("NEQ", "EQU"),
+    ast.Lt: ("LSS", "GEQ"),
+    ast.LtE: ("LEQ", "GTR"),
+    ast.Gt: ("GTR", "LEQ"),
+    ast.GtE: ("GEQ", "LSS"),
+    ast.Is: ("EQU", "NEQ"),
+    ast.IsNot: ("NEQ", "EQU"),
+}
+
+# Unary operator node class -> "set /a" operator
+UNARY_OPERATORS = {
+    ast.USub: "-",
+    ast.UAdd: "+",
+    ast.Invert: "~",
+}
+
 class Constants(object):
     RET = RetVariant()
     ARGUMENT_COUNT = ArgumentVariant("count")
 
+class Rope(object):
+    '''
+    Sequence of lines built from chunks.
+
+    Appending or prepending a line, a list of lines or another rope takes
+    constant time, other ropes are linked by reference. So a rope must not
+    be changed after it was added to another one.
+    '''
+
+    # Thousands of ropes are alive during a translation, keep them small
+    __slots__ = ("_head", "_tail")
+
+    def __init__(self):
+        # Prepended chunks are kept in reversed order, both lists are
+        # created on first use.
+        self._head = None
+        self._tail = None
+
+    @classmethod
+    def _to_chunk(cls, value):
+        if not isinstance(value, Rope):
+            return value
+
+        # Link the line list of a plain appended rope directly, so we don't
+        # keep a level of nesting for every source of the expression tree.
+        if value._head is None:
+            return value._tail
+        if value._tail is None and len(value._head) == 1:
+            return value._head[0]
+        return value
+
+    def append(self, value):
+        value = self._to_chunk(value)
+        if value is None:
+            return
+
+        if self._tail is None:
+            self._tail = [value]
+        else:
+            self._tail.append(value)
+
+    def prepend(self, value):
+        value = self._to_chunk(value)
+        if value is None:
+            return
+
+        if self._head is None:
+            self._head = [value]
+        else:
+            self._head.append(value)
+
+    def __iadd__(self, value):
+        self.append(value)
+        return self
+
+    @classmethod
+    def _iter_chunks(cls, rope, stack):
+        if rope._tail is not None:
+            stack.append(iter(rope._tail))
+        if rope._head is not None:
+            stack.append(reversed(rope._head))
+
+    def __iter__(self):
+        # Walk the chunk tree without recursion, nested ropes could be as
+        # deep as the expressions they were generated from.
+        stack = []
+        self._iter_chunks(self, stack)
+        while len(stack) > 0:
+            for chunk in stack[-1]:
+                if isinstance(chunk, six.string_types):
+                    yield chunk
+                elif isinstance(chunk, Rope):
+                    self._iter_chunks(chunk, stack)
+                    break
+                else:
+                    stack.append(iter(chunk))
+                    break
+            else:
+                stack.pop()
+
+    def __bool__(self):
+        for line in self:
+            return True
+        return False
+
 class Source(object):
     def __init__(self, command_generator):
-        self.front = []
-        self.back = []
-        self.temp_finalize = []
+        self.front = Rope()
+        self.back = Rope()
+        self.temp_finalize = Rope()
         self.definitions = []
         self._cg = command_generator
 
     def create_temp_varaint(self):
         variant = self._cg._new_raw_variant()
-        self.temp_finalize.insert(0, self._cg.unset_variant(variant))
+        self.temp_finalize.prepend(self._cg.unset_variant(variant))
         return variant
 
     def append(self, other_source):
-        self.front += other_source.front
-        self.back = other_source.back + self.back
-        self.temp_finalize = other_source.temp_finalize + self.temp_finalize
+        self.front.append(other_source.front)
+        self.back.prepend(other_source.back)
+        self.temp_finalize.prepend(other_source.temp_finalize)
         self.definitions += other_source.definitions
 
     def _temp_clearup_enter(self):
         pass
 
     def _temp_clearup_exit(self, exc_type, exc_val, exc_tb):
-        self.front += self.temp_finalize
-        self.temp_finalize.clear()
+        self.front.append(self.temp_finalize)
+        self.temp_finalize = Rope()
+
+    def __iter__(self):
+        yield from self.front
+        yield from self.back
 
     def _jump_block_enter(self):
         pass
@@ -329,10 +551,10 @@ class Source(object):
         return LocalContext(self._temp_clearup_enter, self._temp_clearup_exit)
 
     def add_initialize(self, line):
-        self._cg._list_safe_append(self.front, line)
+        self.front.append(line)
 
     def add_finalize(self, line):
-        self._cg._list_safe_append(self.back, line)
+        self.back.append(line)
 
     def add_definition(self, source):
         if not isinstance(source, Source):
@@ -366,11 +588,82 @@ class Translator(base.Translator):
     file_extensions = ['bat']
     _module_dir = os.path.splitext(os.path.basename(__file__))[0]
 
+    # Runtime library parsed from site.bat, shared by all translators of this
+    # process
+    _library = None
+
+    # (translator class, node class) -> _parse_xxx method
+    _handlers = {}
+
     def __init__(self):
+        super().__init__()
+        self._ret_variant = RetVariant()
+        self._inline_threshold = Inliner.DEFAULT_THRESHOLD
+        # Imported modules are translated once per session, not per file
+        self._modules = ModuleCache()
+        self._reset()
+
+    @property
+    def inline_threshold(self):
+        return self._inline_threshold
+
+    @inline_threshold.setter
+    def inline_threshold(self, value):
+        self._inline_threshold = value
+
+    def _reset(self):
+        # Each translation starts from a clean state, so a translator could be
+        # reused for many files and still generate the same script for the
+        # same source.
         self._stack = NameStack()
         self._break_stack = Stack()
         self._cg = CommandGenerator()
-        self._ret_variant = RetVariant()
+        self._types = TypeInference()
+        # Parents of the nodes of the tree being translated
+        self._nodes = None
+        # Whether the program builds tuples, values of unknown type are
+        # checked for them when copied
+        self._has_tuples = False
+        # Functions called without setlocal, whether the one being parsed
+        # has a scope and its parameters (name -> ParameterVariant)
+        self._scopeless_functions = set()
+        self._has_context = True
+        self._parameters = {}
+        # Routine label -> prefix of its temporaries, for routines without
+        # a scope of their own
+        self._temp_prefixes = {}
+        # Names whose len() is cached
+        self._length_names = set()
+        # Routine label -> peak count of live temporaries, "" is the main
+        # program
+        self._temp_peaks = {}
+        # Routine label -> (removed lines, removed commands)
+        self._peephole_stats = {}
+        self._stats = []
+        # Directories local modules are looked up in
+        self._module_directories = []
+
+    def _get_library(self):
+        if Translator._library is None:
+            site_module_file = open(os.path.join(self.get_module_path(), "site.bat"), "r")
+            with site_module_file:
+                Translator._library = Library(
+                    [line.strip() for line in site_module_file])
+
+        return Translator._library
+
+    @classmethod
+    def _get_handler(cls, node_type):
+        # Handlers are methods named after the node class, looked up once per
+        # node class.
+        key = (cls, node_type)
+        handler = cls._handlers.get(key)
+        if handler is None:
+            handler = getattr(cls, "_parse_%s" % node_type.__name__, None)
+            if handler is None:
+                raise NotImplementedError(node_type.__name__)
+            cls._handlers[key] = handler
+        return handler
 
     def _parse_node(self, node, variant=None):
         source = Source(self._cg)
@@ -378,161 +671,625 @@ class Translator(base.Translator):
         if variant is None:
             variant = self._ret_variant
 
-        if isinstance(node, ast.Num):
-            source.add_initialize(self._cg.set_variant(variant, node.n, "int"))
-        elif isinstance(node, ast.Str):
-            source.add_initialize(self._cg.set_variant(variant, node.s, "str"))
-        elif isinstance(node, ast.Name):
-            source.add_initialize(self._cg.set_variant(variant, Variant(node.id)))
-        elif isinstance(node, ast.Tuple):
-            elements = []
-            for new_value in node.elts:
-                temp_variant = source.create_temp_varaint()
-                sub_source = self._parse_node(new_value, temp_variant)
-                source.append(sub_source)
-                elements.append(temp_variant.id_)
+        self._get_handler(type(node))(self, node, source, variant)
+        return source
 
-            source.add_initialize(self._cg.set_variant(
-                variant, '"%s"' %" ".join(elements), "tuple"))
-        elif isinstance(node, ast.Call):
-            arguments = []
+    def _parse_Constant(self, node, source, variant):
+        value = node.value
+        # bool is a subclass of int, check it first
+        if isinstance(value, bool):
+            source.add_initialize(self._cg.set_variant(variant, int(value), "bool"))
+        elif isinstance(value, int):
+            source.add_initialize(self._cg.set_variant(variant, value, "int"))
+        elif isinstance(value, six.string_types):
+            source.add_initialize(self._cg.set_variant(variant, value, "str"))
+        elif isinstance(value, range):
+            # Folded range() call, stored the way :PYTSVrange builds it
+            source.add_initialize(self._cg.set_variant(variant, "%s %s %s" % (
+                value.start, value.stop, value.step), "range"))
+        elif value is None:
+            # Tagged, an empty value with an empty tag is an unset variant
+            source.add_initialize(self._cg.set_variant(variant, "", "NoneType"))
+        else:
+            raise NotImplementedError("%s constant" % type(value).__name__)
 
-            if isinstance(node.func, ast.Attribute):
-                temp_variant = source.create_temp_varaint()
-                source.append(self._parse_node(node.func.value, temp_variant))
-                object_variant = temp_variant
-                function_name = "%%%s%%.%s" % (object_variant.type_info.id_.lower(), node.func.attr)
-                arguments.append(object_variant.id_)
+    def _get_name_variant(self, name):
+        # The variant a name is read from
+        variant = self._parameters.get(name)
+        if variant is None:
+            variant = Variant(name)
+        return variant
+
+    def _get_target_variant(self, node):
+        # The variant an assigned name node is set to
+        return Variant(node.id, is_typed=self._types.is_typed(node),
+                       is_length_cached=node.id in self._length_names)
+
+    @classmethod
+    def _get_element_variant(cls, variant, index):
+        # The variant holding the element index of the tuple in variant
+        if isinstance(variant, ParameterVariant):
+            return ParameterVariant(variant.name, "%s[%s]" % (variant._suffix, index))
+        return Variant("%s[%s]" % (variant.name, index), variant.tag)
+
+    def _copy_variant(self, source, variant, value_variant, type_):
+        # Elements of a tuple are copied with it, values of a type unknown
+        # while compiling are checked when they run
+        if type_ == "tuple":
+            source.add_initialize(self._cg.copy_tuple(variant, value_variant))
+        elif type_ is None and self._has_tuples:
+            source.add_initialize(self._cg.exec_all(
+                self._cg.set_variant(variant, value_variant),
+                self._cg.if_('"%s"=="tuple"' % value_variant.type_info.value,
+                             self._cg.copy_tuple(variant, value_variant))))
+        else:
+            source.add_initialize(self._cg.set_variant(variant, value_variant))
+
+    def _parse_Name(self, node, source, variant):
+        type_ = self._types.get_type(node)
+        if type_ is None or type_ == "tuple":
+            self._copy_variant(source, variant, self._get_name_variant(node.id), type_)
+        else:
+            source.add_initialize(self._cg.set_variant(
+                variant, self._get_name_variant(node.id).value, type_, is_raw=True))
+
+    def _parse_Tuple(self, node, source, variant):
+        # The variant holds the count of the elements, they are set to the
+        # variants named after it. The tuple is built apart and copied if its
+        # elements read the variant or call functions, which could read it
+        # or return tuples in the return variant.
+        tuple_variant = variant
+        if variant.tag == Object.TAG_RET or any([
+                isinstance(x, ast.Call) or (isinstance(x, ast.Name) and x.id == variant.name)
+                for x in ast.walk(node)]):
+            tuple_variant = source.create_temp_varaint()
+
+        for i, element in enumerate(node.elts):
+            source.append(self._parse_node(
+                element, self._get_element_variant(tuple_variant, i)))
+        source.add_initialize(self._cg.set_variant(tuple_variant, len(node.elts), "tuple"))
+
+        if tuple_variant is not variant:
+            source.add_initialize(self._cg.copy_tuple(variant, tuple_variant))
+
+    def _is_length_call(self, node):
+        # len() of a variable known to be a str
+        return (isinstance(node.func, ast.Name) and node.func.id == "len"
+            and not self._types.is_bound("len") and len(node.args) == 1
+            and len(node.keywords) <= 0 and isinstance(node.args[0], ast.Name)
+            and self._types.get_type(node.args[0]) == "str")
+
+    def _find_length_names(self, node):
+        '''
+        Return the names len() is called on in loops, their lengths are
+        cached: a len() of them costs a command or two until they are set
+        again, instead of measuring the string each time.
+        '''
+
+        names = set()
+        for loop in ast.walk(node):
+            if isinstance(loop, ast.While):
+                nodes = [loop.test] + loop.body
+            elif isinstance(loop, ast.For):
+                nodes = loop.body
             else:
-                function_name = node.func.id
-            batch_function = Function(function_name)
+                continue
+
+            for sub_node in nodes:
+                for call in ast.walk(sub_node):
+                    if isinstance(call, ast.Call) and self._is_length_call(call):
+                        names.add(call.args[0].id)
+        return names
+
+    def _parse_Call(self, node, source, variant):
+        arguments = []
+
+        if (isinstance(node.func, ast.Name) and node.func.id == "len"
+                and not self._types.is_bound("len") and len(node.args) == 1
+                and len(node.keywords) <= 0 and isinstance(node.args[0], ast.Name)
+                and self._types.get_type(node.args[0]) == "tuple"):
+            # A tuple holds its length
+            source.add_initialize(self._cg.set_variant(
+                variant, self._get_name_variant(node.args[0].id).value, "int", is_raw=True))
+            return
+
+        if self._is_length_call(node) and node.args[0].id in self._length_names:
+            name_variant = self._get_name_variant(node.args[0].id)
+            # Parameters are variants of the caller, they could be set
+            # without their cached length being cleared
+            if not isinstance(name_variant, ParameterVariant):
+                source.add_initialize(self._cg.invoke(
+                    Function("len.cached"), name_variant.id_))
+                if variant.tag != Object.TAG_RET:
+                    source.add_initialize(self._cg.set_variant(variant, RetVariant()))
+                return
+
+        if isinstance(node.func, ast.Attribute):
+            temp_variant = source.create_temp_varaint()
+            source.append(self._parse_node(node.func.value, temp_variant))
+            object_variant = temp_variant
+            function_name = "%%%s%%.%s" % (object_variant.type_info.id_.lower(), node.func.attr)
+            arguments.append(object_variant.id_)
+        else:
+            function_name = node.func.id
+        batch_function = Function(function_name)
 
-            for argument in node.args:
-                temp_variant = source.create_temp_varaint()
-                sub_source = self._parse_node(argument, temp_variant)
-                source.append(sub_source)
-                arguments.append(temp_variant.id_)
-
-            source.add_initialize(self._cg.invoke(batch_function.name, *arguments))
-            if variant.tag != Object.TAG_RET:
-                source.add_initialize(self._cg.set_variant(variant, RetVariant()))
-        elif isinstance(node, ast.FunctionDef):
-            sub_source = Source(self._cg)
-            sub_source.add_initialize("") # Add a new line before function definition
-            function_name = node.name
-            if isinstance(node._parent(), ast.ClassDef):
-                function_name = "%s.%s" % (node._parent().name, function_name)
-            sub_source.add_initialize(Function(function_name).id_)
-            with sub_source.start_context():
-                for an_arg in node.args.args:
-                    an_arg_variant = Variant(an_arg.arg)
-                    sub_source.add_initialize('set "%s=!%%1!" & set "%s=!%%1-T!"' % (
-                        an_arg_variant.id_, an_arg_variant.type_info.id_))
-                    sub_source.add_initialize('shift')
+        for argument in node.args:
+            temp_variant = source.create_temp_varaint()
+            sub_source = self._parse_node(argument, temp_variant)
+            source.append(sub_source)
+            arguments.append(temp_variant.id_)
+
+        source.add_initialize(self._cg.invoke(batch_function.name, *arguments))
+        if variant.tag != Object.TAG_RET:
+            self._copy_variant(source, variant, RetVariant(), self._types.get_type(node))
+
+    def _parse_FunctionDef(self, node, source, variant):
+        sub_source = Source(self._cg)
+        sub_source.add_initialize("") # Add a new line before function definition
+        function_name = node.name
+        parent = self._nodes.get_parent(node)
+        if isinstance(parent, ast.ClassDef):
+            function_name = "%s.%s" % (parent.name, function_name)
+        sub_source.add_initialize(Function(function_name).id_)
+        if node in self._scopeless_functions:
+            # Parameters are read from the variants passed, temporaries are
+            # kept apart from the caller's ones by their names
+            self._has_context = False
+            self._parameters = dict([(x.arg, ParameterVariant(i + 1))
+                for i, x in enumerate(node.args.args)])
+            self._temp_prefixes[Function(function_name).id_[1:]] = (
+                "%s." % Function(function_name).escaped_name)
+            with sub_source.start_temp_clearup():
                 sub_source.append(self._parse_node(node.body))
+                self._add_implicit_return(node, sub_source)
                 sub_source.add_finalize(self._cg.raw_return_("%ERRORLEVEL%"))
+            self._has_context = True
+            self._parameters = {}
             source.add_definition(sub_source)
-        elif isinstance(node, ast.BinOp):
-
-            left_temp_variant = source.create_temp_varaint()
-            left_source = self._parse_node(node.left, left_temp_variant)
-            source.append(left_source)
-
-            right_temp_variant = source.create_temp_varaint()
-            right_source = self._parse_node(node.right, right_temp_variant)
-            source.append(right_source)
-
-            operators = {
-                ast.Add:["+", "__add__"],
-                ast.Sub:["-", "__sub__"],
-                ast.Mult:["*", "__mul__"],
-                ast.Div:["/", "__truediv__"],
-                ast.Mod:["%", "__mod__"],
-                ast.LShift:["<<", "__lshift__"],
-                ast.RShift:[">>", "__rshift__"],
-                ast.BitOr:["|", "__or__"],
-                ast.BitAnd:["&", "__and__"],
-                ast.BitXor:["^", "__xor__"],
-            }
-
-            opt = operators[type(node.op)][0]
-            opt_name = operators[type(node.op)][1]
-            afunction = Function("%%%s%%.%s" % (left_temp_variant.type_info.id_.lower(), opt_name))
-            source.add_initialize(self._cg.invoke(
-                afunction,
-                left_temp_variant.id_, right_temp_variant.id_,
-            ))
-            if variant.tag != Object.TAG_RET:
-                source.add_initialize(self._cg.set_variant(variant, self._ret_variant))
-        elif isinstance(node, ast.Return):
-            with source.start_temp_clearup():
-                if node.value is not None:
-                    sub_source = self._parse_node(node.value)
-                    source.append(sub_source)
-            source.add_initialize(self._cg.return_())
-        elif isinstance(node, ast.NameConstant):
-            constants_table = {
-                True:1,
-                False:0,
-            }
-            source.add_initialize(self._cg.set_variant(
-                variant, constants_table[node.value], "bool"))
-        elif isinstance(node, ast.Assign):
-            atarget = node.targets[0]
-            with source.start_temp_clearup():
-                if isinstance(atarget, ast.Name):
-                    sub_source = self._parse_node(node.value, Variant(atarget.id))
-                    source.append(sub_source)
-                elif isinstance(atarget, ast.Tuple):
-                    for i in range(len(atarget.elts)):
-                        avariable = atarget.elts[i]
-                        value = node.value.elts[i]
-                        sub_source = self._parse_node(value, Variant(avariable.id))
-                        source.append(sub_source)
-        elif isinstance(node, ast.Expr):
-            with source.start_temp_clearup():
+            return
+
+        with sub_source.start_context():
+            for an_arg in node.args.args:
+                an_arg_variant = Variant(an_arg.arg)
+                command = 'set "%s=!%%1!" & set "%s=!%%1-T!"' % (
+                    an_arg_variant.id_, an_arg_variant.type_info.id_)
+                if an_arg.arg in self._length_names:
+                    command += ' & set "%s-L="' % an_arg_variant.id_
+                if self._has_tuples:
+                    command = self._cg.exec_all(command, self._cg.if_(
+                        '"!%1-T!"=="tuple"',
+                        self._cg.copy_tuple(an_arg_variant, ParameterVariant(1))))
+                sub_source.add_initialize(command)
+                sub_source.add_initialize('shift')
+            sub_source.append(self._parse_node(node.body))
+            self._add_implicit_return(node, sub_source)
+            sub_source.add_finalize(self._cg.raw_return_("%ERRORLEVEL%"))
+        source.add_definition(sub_source)
+
+    def _add_implicit_return(self, node, source):
+        # A function without return returns None, not what its last call
+        # left in the return variant
+        if not (len(node.body) > 0 and isinstance(node.body[-1], ast.Return)):
+            source.add_initialize(self._cg.set_variant(self._ret_variant, "", "NoneType"))
+
+    # Types "if" compares as numbers, true when not 0
+    _NUMERIC_TYPES = ("int", "bool")
+
+    def _is_int(self, node):
+        return self._types.get_type(node) == "int"
+
+    def _get_int_expression(self, node, source):
+        # Integer expressions are calculated by "set /a" in one go, other
+        # operands are evaluated to a temporary first.
+        if isinstance(node, ast.Constant):
+            if node.value < 0:
+                return "(%s)" % node.value
+            return str(node.value)
+        elif isinstance(node, ast.Name):
+            return self._get_name_variant(node.id).id_
+        elif (isinstance(node, ast.BinOp)
+                and self._is_int(node.left) and self._is_int(node.right)):
+            return "(%s)" % self._get_int_operation(node, source)
+
+        temp_variant = source.create_temp_varaint()
+        source.append(self._parse_node(node, temp_variant))
+        return temp_variant.id_
+
+    def _get_int_operation(self, node, source):
+        opt = OPERATORS[type(node.op)][0].replace("%", "%%")
+        return "%s%s%s" % (
+            self._get_int_expression(node.left, source),
+            opt,
+            self._get_int_expression(node.right, source))
+
+    def _parse_BinOp(self, node, source, variant):
+        if self._is_int(node.left) and self._is_int(node.right):
+            source.add_initialize(self._cg.calcuate_int(
+                self._get_int_operation(node, source), variant))
+            return
+
+        left_temp_variant = source.create_temp_varaint()
+        left_source = self._parse_node(node.left, left_temp_variant)
+        source.append(left_source)
+
+        right_temp_variant = source.create_temp_varaint()
+        right_source = self._parse_node(node.right, right_temp_variant)
+        source.append(right_source)
+
+        opt_name = OPERATORS[type(node.op)][1]
+        afunction = Function("%%%s%%.%s" % (left_temp_variant.type_info.id_.lower(), opt_name))
+        source.add_initialize(self._cg.invoke(
+            afunction,
+            left_temp_variant.id_, right_temp_variant.id_,
+        ))
+        if variant.tag != Object.TAG_RET:
+            self._copy_variant(
+                source, variant, self._ret_variant, self._types.get_type(node))
+
+    def _parse_UnaryOp(self, node, source, variant):
+        if isinstance(node.op, ast.Not):
+            self._parse_condition(node, source, variant)
+        elif self._is_int(node.operand):
+            source.add_initialize(self._cg.calcuate_int("%s%s" % (
+                UNARY_OPERATORS[type(node.op)],
+                self._get_int_expression(node.operand, source)), variant))
+        else:
+            raise NotImplementedError(type(node.op).__name__)
+
+    def _parse_Compare(self, node, source, variant):
+        self._parse_condition(node, source, variant)
+
+    def _parse_BoolOp(self, node, source, variant):
+        # The result is the operand deciding it, not a bool. Operands are
+        # evaluated to a temporary, the target could be read by later ones.
+        label_end_block = self._cg._new_label()
+        result_variant = source.create_temp_varaint()
+        is_or = isinstance(node.op, ast.Or)
+        for value in node.values[:-1]:
+            source.append(self._parse_node(value, result_variant))
+            self._branch_variant(
+                result_variant, self._types.get_type(value), source,
+                label_end_block, is_or)
+        source.append(self._parse_node(node.values[-1], result_variant))
+        source.add_initialize(label_end_block.id_)
+        self._copy_variant(source, variant, result_variant, self._types.get_type(node))
+
+    def _parse_condition(self, node, source, variant):
+        label_false_block = self._cg._new_label()
+        label_next_block = self._cg._new_label()
+        self._branch(node, source, label_false_block, False)
+        source.add_initialize(self._cg.set_variant(variant, 1, "bool"))
+        source.add_initialize(self._cg.goto(label_next_block))
+        source.add_initialize(label_false_block.id_)
+        source.add_initialize(self._cg.set_variant(variant, 0, "bool"))
+        source.add_initialize(label_next_block.id_)
+
+    def _branch(self, node, source, label, jump_if):
+        '''
+        Jump to label if the truth of node is jump_if, fall through otherwise.
+
+        Comparisons, "and", "or" and "not" become conditional gotos, other
+        values are tested without a bool being created.
+        '''
+
+        if isinstance(node, ast.BoolOp):
+            if isinstance(node.op, ast.And) != jump_if:
+                # Any operand decides: false for "and", true for "or"
+                for value in node.values:
+                    self._branch(value, source, label, jump_if)
+            else:
+                label_skip_block = self._cg._new_label()
+                for value in node.values[:-1]:
+                    self._branch(value, source, label_skip_block, not jump_if)
+                self._branch(node.values[-1], source, label, jump_if)
+                source.add_initialize(label_skip_block.id_)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            self._branch(node.operand, source, label, not jump_if)
+        elif isinstance(node, ast.Compare):
+            self._branch_compare(node, source, label, jump_if)
+        elif isinstance(node, ast.Constant):
+            if bool(node.value) == jump_if:
+                source.add_initialize(self._cg.goto(label))
+        else:
+            type_ = self._types.get_type(node)
+            if isinstance(node, ast.Name) and (
+                    type_ in self._NUMERIC_TYPES or self._types.is_typed(node)):
+                test_variant = self._get_name_variant(node.id)
+            else:
+                test_variant = source.create_temp_varaint()
+                source.append(self._parse_node(node, test_variant))
+            self._branch_variant(test_variant, type_, source, label, jump_if)
+
+    def _branch_variant(self, variant, type_, source, label, jump_if):
+        if type_ in self._NUMERIC_TYPES:
+            value = variant.value
+        else:
+            source.add_initialize(self._cg.bool_(variant))
+            value = self._ret_variant.value
+        source.add_initialize(self._cg.if_(
+            "%s %s 0" % (value, "NEQ" if jump_if else "EQU"),
+            self._cg.goto(label)))
+
+    def _branch_compare(self, node, source, label, jump_if):
+        # A chain jumps away as soon as one comparison is false, the last one
+        # decides when jumping on true.
+        pairs = list(zip(node.ops, node.comparators))
+        label_skip_block = label
+        if jump_if and len(pairs) > 1:
+            label_skip_block = self._cg._new_label()
+
+        left = self._get_compare_operand(node.left, source)
+        for i, (op, comparator) in enumerate(pairs):
+            right = self._get_compare_operand(comparator, source)
+            if jump_if and i == len(pairs) - 1:
+                condition = self._get_compare_condition(op, left, right, source, False)
+                source.add_initialize(self._cg.if_(condition, self._cg.goto(label)))
+            else:
+                condition = self._get_compare_condition(op, left, right, source, True)
+                source.add_initialize(self._cg.if_(
+                    condition, self._cg.goto(label_skip_block)))
+            left = right
+
+        if label_skip_block is not label:
+            source.add_initialize(label_skip_block.id_)
+
+    def _get_compare_operand(self, node, source):
+        # (node, variant holding its value), constants and names are read
+        # where they are compared
+        if isinstance(node, ast.Constant):
+            return (node, None)
+        elif isinstance(node, ast.Name):
+            return (node, self._get_name_variant(node.id))
+
+        temp_variant = source.create_temp_varaint()
+        source.append(self._parse_node(node, temp_variant))
+        return (node, temp_variant)
+
+    def _get_compare_kind(self, op, left, right):
+        # "int" or "str" if cmd's "if" compares the operands like python does,
+        # None if it's left to the runtime
+        left_type = self._types.get_type(left)
+        right_type = self._types.get_type(right)
+        if left_type in self._NUMERIC_TYPES and right_type in self._NUMERIC_TYPES:
+            return "int"
+
+        if left_type == "str" and right_type == "str" and isinstance(op, (ast.Eq, ast.NotEq)):
+            for operand in (left, right):
+                if isinstance(operand, ast.Constant) and any(
+                        [x in operand.value for x in '"!^']):
+                    return None
+            return "str"
+
+        return None
+
+    def _get_compare_condition(self, op, left, right, source, negate):
+        if type(op) not in COMPARE_OPERATORS:
+            raise NotImplementedError(type(op).__name__)
+
+        kind = self._get_compare_kind(op, left[0], right[0])
+        operator = COMPARE_OPERATORS[type(op)][int(negate)]
+        if kind == "int":
+            texts = []
+            for operand_node, operand_variant in (left, right):
+                if operand_variant is None:
+                    texts.append(str(int(operand_node.value)))
+                else:
+                    texts.append(operand_variant.value)
+            return "%s %s %s" % (texts[0], operator, texts[1])
+        elif kind == "str":
+            texts = []
+            for operand_node, operand_variant in (left, right):
+                if operand_variant is None:
+                    texts.append(operand_node.value.replace("%", "%%"))
+                else:
+                    # Read when the command runs, the value may hold
+                    # characters special to cmd.exe
+                    texts.append("!%s!" % operand_variant.id_)
+            return '%s"%s"=="%s"' % (
+                "NOT " if operator == "NEQ" else "", texts[0], texts[1])
+
+        arguments = []
+        for operand_node, operand_variant in (left, right):
+            if operand_variant is None or (
+                    isinstance(operand_node, ast.Name)
+                    and not self._types.is_typed(operand_node)):
+                # The runtime needs the type tag
+                operand_variant = source.create_temp_varaint()
+                source.append(self._parse_node(operand_node, operand_variant))
+            arguments.append(operand_variant.id_)
+        source.add_initialize(self._cg.invoke(
+            Function("compare"), arguments[0], operator, arguments[1]))
+        return "%s NEQ 0" % self._ret_variant.value
+
+    def _parse_Return(self, node, source, variant):
+        is_tuple = False
+        with source.start_temp_clearup():
+            if node.value is not None:
                 sub_source = self._parse_node(node.value)
                 source.append(sub_source)
-        elif isinstance(node, ast.Pass):
-            # Just pass ...
-            pass
-        elif isinstance(node, ast.Break):
-            if len(self._break_stack) > 0:
-                source.add_initialize(self._cg.goto(self._break_stack.top))
-        elif isinstance(node, ast.If):
-            label_true_block = self._cg._new_label()
-            label_false_block = self._cg._new_label()
-            label_next_block = self._cg._new_label()
-            temp_variant = source.create_temp_varaint()
-            sub_source = self._parse_node(node.test, temp_variant)
+                type_ = self._types.get_type(node.value)
+                if self._has_tuples:
+                    is_tuple = None if type_ is None else type_ == "tuple"
+            else:
+                source.add_initialize(self._cg.set_variant(self._ret_variant, "", "NoneType"))
+        source.add_initialize(self._cg.return_(
+            has_context=self._has_context, is_tuple=is_tuple))
+
+    def _parse_Assign(self, node, source, variant):
+        atarget = node.targets[0]
+        with source.start_temp_clearup():
+            if isinstance(atarget, ast.Name):
+                sub_source = self._parse_node(
+                    node.value, self._get_target_variant(atarget))
+                source.append(sub_source)
+            elif isinstance(atarget, ast.Tuple):
+                for i in range(len(atarget.elts)):
+                    avariable = atarget.elts[i]
+                    value = node.value.elts[i]
+                    sub_source = self._parse_node(
+                        value, self._get_target_variant(avariable))
+                    source.append(sub_source)
+
+    def _parse_Expr(self, node, source, variant):
+        with source.start_temp_clearup():
+            sub_source = self._parse_node(node.value)
             source.append(sub_source)
-            source.add_initialize(self._cg.bool_(temp_variant))
-            source.add_initialize(self._cg.if_equal(
-                RetVariant().value, "0",
-                self._cg.goto(label_false_block),
-                self._cg.goto(label_true_block)))
-            source.add_initialize(label_true_block.id_)
-            source.append(self._parse_node(node.body))
-            source.add_initialize(self._cg.goto(label_next_block))
-
-            source.add_initialize(label_false_block.id_)
-            source.append(self._parse_node(node.orelse))
-            source.add_initialize(self._cg.goto(label_next_block))
-
-            source.add_initialize(label_next_block.id_)
-        elif isinstance(node, ast.Index):
-            source.append(self._parse_node(node.value, variant))
-        elif isinstance(node, ast.Slice):
-            slice_lower = node.lower.n
-            slice_upper = node.upper.n
-            slice_step = 1
-            if node.step is not None:
-                slice_step = node.step.n
-            source.add_initialize(self._cg.set_variant(
-                variant,
-                "%s %s %s" % (slice_lower, slice_upper, slice_step),
-                "slice"))
-        elif isinstance(node, ast.Subscript):
+
+    def _parse_Pass(self, node, source, variant):
+        # Just pass ...
+        pass
+
+    def _parse_Break(self, node, source, variant):
+        if len(self._break_stack) <= 0:
+            return
+
+        top = self._break_stack.top
+        if isinstance(top, Variant):
+            # Body of a counting loop, the loop checks the flag after each
+            # call of the body
+            source.add_initialize(self._cg.exec_all(
+                'set "%s=1"' % top.id_, self._cg.raw_return_("%ERRORLEVEL%")))
+        else:
+            source.add_initialize(self._cg.goto(top))
+
+    def _parse_If(self, node, source, variant):
+        label_false_block = self._cg._new_label()
+        label_next_block = self._cg._new_label()
+        self._branch(node.test, source, label_false_block, False)
+        source.append(self._parse_node(node.body))
+        source.add_initialize(self._cg.goto(label_next_block))
+
+        source.add_initialize(label_false_block.id_)
+        source.append(self._parse_node(node.orelse))
+
+        source.add_initialize(label_next_block.id_)
+
+    def _get_slice_bound(self, node, source):
+        if node is None or (isinstance(node, ast.Constant) and node.value is None):
+            return "None"
+        return self._get_int_value(node, source)
+
+    def _parse_Slice(self, node, source, variant):
+        # "lower upper step", "None" for a missing one
+        source.add_initialize(self._cg.set_variant(
+            variant,
+            " ".join([self._get_slice_bound(x, source)
+                for x in (node.lower, node.upper, node.step)]),
+            "slice", is_raw=True))
+
+    @classmethod
+    def _is_int_constant(cls, node):
+        return isinstance(node, ast.Constant) and type(node.value) is int
+
+    def _get_expanded_int(self, node, source):
+        # An int expression as text expanded by "%...%", for substrings
+        if self._is_int_constant(node):
+            return str(node.value)
+
+        name_variant = None
+        if isinstance(node, ast.Name):
+            name_variant = self._get_name_variant(node.id)
+        if name_variant is not None and not isinstance(name_variant, ParameterVariant):
+            return name_variant.value
+
+        temp_variant = source.create_temp_varaint()
+        source.add_initialize(self._cg.calcuate_expr(
+            self._get_int_expression(node, source), temp_variant))
+        return temp_variant.value
+
+    def _get_substring(self, node, source):
+        '''
+        Return the "~offset[,length]" of a cmd.exe substring giving the str
+        subscript node like python, None if that depends on the length of the
+        string, "" if the result is always empty.
+
+        cmd.exe counts negative offsets and lengths from the end of the
+        string and clamps them, like python does with slice bounds, except
+        for a negative lower bound with a positive upper one.
+        '''
+
+        index = node.slice
+        if not isinstance(index, ast.Slice):
+            if self._is_int_constant(index) or self._is_int(index):
+                return "~%s,1" % self._get_expanded_int(index, source)
+            return None
+
+        if not (index.step is None or (
+                self._is_int_constant(index.step) and index.step.value == 1)):
+            return None
+
+        lower = index.lower
+        upper = index.upper
+        for bound in (lower, upper):
+            if not (bound is None or self._is_int_constant(bound) or self._is_int(bound)):
+                return None
+
+        if upper is None:
+            if lower is None:
+                return "~0"
+            return "~%s" % self._get_expanded_int(lower, source)
+
+        if not self._is_int_constant(upper):
+            return None
+
+        if upper.value < 0:
+            lower_text = "0"
+            if lower is not None:
+                lower_text = self._get_expanded_int(lower, source)
+            return "~%s,%s" % (lower_text, upper.value)
+
+        if lower is None:
+            lower_value = 0
+        elif self._is_int_constant(lower) and lower.value >= 0:
+            lower_value = lower.value
+        else:
+            return None
+
+        if upper.value <= lower_value:
+            return ""
+        return "~%s,%s" % (lower_value, upper.value - lower_value)
+
+    def _parse_Subscript(self, node, source, variant):
+        if self._types.get_type(node.value) == "str":
+            with source.start_temp_clearup():
+                value_variant = None
+                if isinstance(node.value, ast.Name):
+                    value_variant = self._get_name_variant(node.value.id)
+                if value_variant is None or isinstance(value_variant, ParameterVariant):
+                    value_variant = source.create_temp_varaint()
+                    value_source = self._parse_node(node.value, value_variant)
+                else:
+                    value_source = Source(self._cg)
+
+                substring_source = Source(self._cg)
+                substring = self._get_substring(node, substring_source)
+                if substring is not None:
+                    source.append(value_source)
+                    source.append(substring_source)
+                    if substring == "":
+                        source.add_initialize(self._cg.set_variant(variant, "", "str"))
+                    else:
+                        source.add_initialize(self._cg.set_variant(
+                            variant, "!%s:%s!" % (value_variant.id_, substring),
+                            "str", is_raw=True))
+                    return
+
+        type_ = self._types.get_type(node)
+        if self._types.get_type(node.value) == "tuple" and isinstance(node.value, ast.Name):
+            # Elements are read where the tuple keeps them
+            tuple_variant = self._get_name_variant(node.value.id)
+            if self._is_int_constant(node.slice) and node.slice.value >= 0:
+                self._copy_variant(source, variant, self._get_element_variant(
+                    tuple_variant, node.slice.value), type_)
+                return
+
+            with source.start_temp_clearup():
+                index_variant = source.create_temp_varaint()
+                source.append(self._parse_node(node.slice, index_variant))
+                source.add_initialize(self._cg.invoke(
+                    Function("tuple.__getitem__"), tuple_variant.id_, index_variant.id_))
+        else:
             with source.start_temp_clearup():
                 temp_variant = source.create_temp_varaint()
                 source.append(self._parse_node(node.value, temp_variant))
@@ -541,102 +1298,518 @@ class Translator(base.Translator):
                 source.add_initialize("call :PYTSV%%%s%%.__getitem__ %s %s" % (
                     temp_variant.type_info.id_, temp_variant.id_, temp_variant2.id_))
 
-            if variant.tag != Object.TAG_RET:
-                source.add_initialize(self._cg.set_variant(variant, self._ret_variant))
-        elif isinstance(node, ast.For):
-            label_begin_block = self._cg._new_label()
-            label_end_block = self._cg._new_label()
-            self._break_stack.push(label_end_block)
-            with self._break_stack, source.start_temp_clearup():
-                target_variant = Variant(node.target.id)
-                index_variant = source.create_temp_varaint()
+        if variant.tag != Object.TAG_RET:
+            self._copy_variant(source, variant, self._ret_variant, type_)
+
+    @classmethod
+    def _walk_statements(cls, statements, skipped_types):
+        # Statements nested in statements, without entering skipped_types
+        nodes = list(statements)
+        while len(nodes) > 0:
+            node = nodes.pop()
+            yield node
+            if not isinstance(node, skipped_types):
+                nodes += [x for x in ast.iter_child_nodes(node) if isinstance(x, ast.stmt)]
+
+    # Loops over tuple literals are unrolled if the copies of their body
+    # don't have more statements than this
+    MAX_UNROLLED_STATEMENTS = 16
+
+    def _is_body_callable(self, node):
+        # Whether the body of a loop could be a subroutine called for each
+        # value
+        if len(node.orelse) > 0 or not isinstance(node.target, ast.Name):
+            return False
+
+        return not any([isinstance(x, ast.Return) for x in self._walk_statements(
+            node.body, (ast.FunctionDef, ast.ClassDef))])
+
+    def _is_unrollable(self, node):
+        if not (isinstance(node.iter, ast.Tuple) and isinstance(node.target, ast.Name)):
+            return False
+
+        if len(node.orelse) > 0 or any([isinstance(x, ast.Starred) for x in node.iter.elts]):
+            return False
+
+        statements = list(self._walk_statements(node.body, ()))
+        if any([isinstance(x, (ast.FunctionDef, ast.ClassDef)) for x in statements]):
+            return False
+
+        return len(statements) * len(node.iter.elts) <= self.MAX_UNROLLED_STATEMENTS
+
+    def _get_range_bounds(self, node):
+        '''
+        Return (start, stop, step) of a loop over a range() call with a
+        constant step, None for other loops.
+        '''
+
+        aiter = node.iter
+        if isinstance(aiter, ast.Constant) and isinstance(aiter.value, range):
+            value = aiter.value
+            return (ast.Constant(value=value.start), ast.Constant(value=value.stop), value.step)
+
+        if not (isinstance(aiter, ast.Call) and isinstance(aiter.func, ast.Name)
+                and aiter.func.id == "range" and not self._types.is_bound("range")
+                and len(aiter.keywords) <= 0 and 1 <= len(aiter.args) <= 3):
+            return None
+
+        args = list(aiter.args)
+        if len(args) < 2:
+            args.insert(0, ast.Constant(value=0))
+        if len(args) < 3:
+            args.append(ast.Constant(value=1))
+
+        step = args[2]
+        if not (isinstance(step, ast.Constant) and type(step.value) is int and step.value != 0):
+            return None
+
+        for arg in args[:2]:
+            if not (self._is_int(arg) or (
+                    isinstance(arg, ast.Constant) and type(arg.value) is int)):
+                return None
+
+        return (args[0], args[1], step.value)
+
+    def _get_int_value(self, node, source, offset=0):
+        # Value of an int expression, for commands that don't calculate
+        if isinstance(node, ast.Constant):
+            return str(node.value + offset)
+        elif isinstance(node, ast.Name) and offset == 0:
+            return self._get_name_variant(node.id).value
+
+        expression = self._get_int_expression(node, source)
+        if offset != 0:
+            expression = "%s%+d" % (expression, offset)
+        temp_variant = source.create_temp_varaint()
+        source.add_initialize(self._cg.calcuate_expr(expression, temp_variant))
+        return temp_variant.value
+
+    def _parse_body_loop(self, node, source, loop, commands, read_variants=()):
+        '''
+        Emit a native "for" command, loop is the "for ... do" part and
+        commands set the target for each value.
+
+        The body becomes a subroutine right after the "for" line, it's
+        called once per value, cmd.exe finds its label quickly by scanning
+        forward. Temporaries in read_variants are read by commands on every
+        pass, the body must not reuse their names.
+        '''
+
+        label_body_block = self._cg._new_label()
+        label_end_block = self._cg._new_label()
+        has_break = any([isinstance(x, ast.Break) for x in self._walk_statements(
+            node.body, (ast.FunctionDef, ast.ClassDef, ast.For, ast.While))])
+
+        commands = commands + ["call %s" % label_body_block.id_]
+        flag_variant = None
+        if has_break:
+            flag_variant = source.create_temp_varaint()
+            source.add_initialize('set "%s="' % flag_variant.id_)
+            # A goto ends the "for" command
+            commands.append(self._cg.if_(
+                "defined %s" % flag_variant.id_, self._cg.goto(label_end_block)))
+
+        source.add_initialize("%s (%s)" % (loop, self._cg.exec_all(*commands)))
+        source.add_initialize(self._cg.goto(label_end_block))
+
+        source.add_initialize(label_body_block.id_)
+        self._break_stack.push(flag_variant)
+        with self._break_stack:
+            source.append(self._parse_node(node.body))
+        source.add_initialize(self._cg.raw_return_("%ERRORLEVEL%"))
+
+        source.add_initialize(label_end_block.id_)
+        if flag_variant is not None:
+            # Also keeps the flag alive over the whole body
+            source.add_initialize('set "%s="' % flag_variant.id_)
+        for read_variant in read_variants:
+            source.add_initialize('set "%s="' % read_variant.id_)
+
+    def _parse_counting_for(self, node, source, start, stop, step):
+        target_variant = self._get_target_variant(node.target)
+        with source.start_temp_clearup():
+            start_value = self._get_int_value(start, source)
+            # "for /l" stops after the end value, range() before the stop
+            end_value = self._get_int_value(stop, source, -1 if step > 0 else 1)
+            self._parse_body_loop(
+                node, source,
+                "for /l %%%%i in (%s,%s,%s) do" % (start_value, step, end_value),
+                [self._cg.set_variant(target_variant, "%%i", "int", is_raw=True)])
+
+    def _parse_tuple_for(self, node, source):
+        # "for /l" counts the indexes of the elements, they are read from
+        # their variants. A tuple the body could assign is iterated from a
+        # copy, like python iterates the one it started with.
+        target_variant = self._get_target_variant(node.target)
+        with source.start_temp_clearup():
+            read_variants = []
+            if isinstance(node.iter, ast.Name) and not any([
+                    isinstance(x, ast.Name) and x.id == node.iter.id
+                    and isinstance(x.ctx, ast.Store) for x in ast.walk(node)]):
+                iter_variant = self._get_name_variant(node.iter.id)
+            else:
                 iter_variant = source.create_temp_varaint()
-                len_variant = source.create_temp_varaint()
                 source.append(self._parse_node(node.iter, iter_variant))
-
-                source.add_initialize("call :PYTSVlen %s" % (iter_variant.id_))
-                source.add_initialize(self._cg.set_variant(len_variant, self._ret_variant))
-                source.add_initialize(self._cg.set_variant(index_variant, "-1", "int"))
-                source.add_initialize(label_begin_block.id_)
-                source.add_initialize(self._cg.calcuate_expr(
-                    "%s+1" % index_variant.id_, index_variant))
-                source.add_initialize("if %s GEQ %s %s" % (
-                    index_variant.value, len_variant.value,
-                    self._cg.goto(label_end_block)))
-                source.add_initialize("call :PYTSV%%%s%%.__getitem__ %s %s" % (
-                    iter_variant.type_info.id_, iter_variant.id_, index_variant.id_))
-                source.add_initialize(self._cg.set_variant(target_variant, self._ret_variant))
-                source.append(self._parse_node(node.body))
-                source.add_initialize(self._cg.goto(label_begin_block))
-                source.add_initialize(label_end_block.id_)
-
-        elif isinstance(node, ast.While):
-            label_begin_block = self._cg._new_label()
-            label_end_block = self._cg._new_label()
-            self._break_stack.push(label_end_block)
-            with self._break_stack, source.start_temp_clearup():
-                test_variant = source.create_temp_varaint()
-                source.add_initialize(label_begin_block.id_)
-                source.append(self._parse_node(node.test, test_variant))
-                source.add_initialize(self._cg.bool_(test_variant))
-                source.add_initialize("if %s EQU 0 %s" % (
-                    self._ret_variant.value,
-                    self._cg.goto(label_end_block),
-                ))
+                read_variants.append(iter_variant)
+            last_variant = source.create_temp_varaint()
+            source.add_initialize(self._cg.calcuate_expr(
+                "%s - 1" % iter_variant.id_, last_variant))
+
+            element_variant = self._get_element_variant(iter_variant, "%%i")
+            commands = ['set "%s=!%s!"' % (target_variant.id_, element_variant.id_)]
+            if target_variant.is_typed:
+                commands.append('set "%s=!%s!"' % (
+                    target_variant.type_info.id_, element_variant.type_info.id_))
+            if target_variant.is_length_cached:
+                commands.append('set "%s-L="' % target_variant.id_)
+            if self._types.get_type(node.target) in (None, "tuple"):
+                # Parenthesized, the rest of the line would belong to the
+                # "if" otherwise
+                commands.append("(%s)" % self._cg.if_(
+                    '"!%s!"=="tuple"' % element_variant.type_info.id_,
+                    "(%s)" % self._cg.copy_tuple(target_variant, element_variant)))
+            self._parse_body_loop(
+                node, source,
+                "for /l %%%%i in (0,1,%s) do" % last_variant.value,
+                commands, read_variants)
+
+    def _parse_unrolled_for(self, node, source):
+        # Elements are evaluated before the first pass like python does,
+        # constants are set where they are used.
+        label_end_block = self._cg._new_label()
+        target_variant = self._get_target_variant(node.target)
+        self._break_stack.push(label_end_block)
+        with self._break_stack, source.start_temp_clearup():
+            values = []
+            for element in node.iter.elts:
+                if isinstance(element, ast.Constant):
+                    values.append(element)
+                else:
+                    temp_variant = source.create_temp_varaint()
+                    source.append(self._parse_node(element, temp_variant))
+                    values.append(temp_variant)
+
+            for element, value in zip(node.iter.elts, values):
+                if isinstance(value, Variant):
+                    self._copy_variant(
+                        source, target_variant, value, self._types.get_type(element))
+                else:
+                    source.append(self._parse_node(value, target_variant))
                 source.append(self._parse_node(node.body))
-                source.add_initialize(self._cg.goto(label_begin_block))
-                source.add_initialize(label_end_block.id_)
-
-        elif isinstance(node, ast.Module):
-            with self._stack, source.start_context():
-                source.append(self._parse_node(node.body))
-        elif isinstance(node, list):
-            for sub_node in node:
-                source.append(self._parse_node(sub_node))
-        elif isinstance(node, ast.ClassDef):
-            constructor = Function(node.name)
-            constructor_variant = Variant(node.name)
-
-            sub_source = Source(self._cg)
-            sub_source.add_initialize("") # Add a new line before function definition
-            sub_source.add_initialize(constructor.id_)
-            sub_source.add_initialize('call %s.__new__ %s %%*' % (
-                constructor.id_, constructor_variant.id_))
-            sub_source.add_initialize('set "%s=%s"' % (
-                self._ret_variant.type_info.id_, node.name))
-            sub_source.add_initialize('call %s.__init__ %s %%*' % (
-                constructor.id_, self._ret_variant.id_))
-            sub_source.add_finalize(self._cg.raw_return_("%ERRORLEVEL%"))
-            source.add_definition(sub_source)
+            source.add_initialize(label_end_block.id_)
+
+    def _parse_For(self, node, source, variant):
+        if self._is_unrollable(node):
+            self._parse_unrolled_for(node, source)
+            return
+
+        if self._is_body_callable(node):
+            bounds = self._get_range_bounds(node)
+            if bounds is not None:
+                self._parse_counting_for(node, source, *bounds)
+                return
+
+            if self._types.get_type(node.iter) == "tuple":
+                self._parse_tuple_for(node, source)
+                return
+
+        label_begin_block = self._cg._new_label()
+        label_end_block = self._cg._new_label()
+        self._break_stack.push(label_end_block)
+        with self._break_stack, source.start_temp_clearup():
+            target_variant = self._get_target_variant(node.target)
+            index_variant = source.create_temp_varaint()
+            iter_variant = source.create_temp_varaint()
+            len_variant = source.create_temp_varaint()
+            source.append(self._parse_node(node.iter, iter_variant))
+
+            source.add_initialize("call :PYTSVlen %s" % (iter_variant.id_))
+            source.add_initialize(self._cg.set_variant(len_variant, self._ret_variant))
+            source.add_initialize(self._cg.set_variant(index_variant, "-1", "int"))
+            source.add_initialize(label_begin_block.id_)
+            source.add_initialize(self._cg.calcuate_expr(
+                "%s+1" % index_variant.id_, index_variant))
+            source.add_initialize("if %s GEQ %s %s" % (
+                index_variant.value, len_variant.value,
+                self._cg.goto(label_end_block)))
+            source.add_initialize("call :PYTSV%%%s%%.__getitem__ %s %s" % (
+                iter_variant.type_info.id_, iter_variant.id_, index_variant.id_))
+            self._copy_variant(source, target_variant, self._ret_variant,
+                               self._types.get_type(node.target))
+            source.append(self._parse_node(node.body))
+            source.add_initialize(self._cg.goto(label_begin_block))
+            source.add_initialize(label_end_block.id_)
+
+    def _parse_While(self, node, source, variant):
+        label_begin_block = self._cg._new_label()
+        label_end_block = self._cg._new_label()
+        self._break_stack.push(label_end_block)
+        with self._break_stack, source.start_temp_clearup():
+            source.add_initialize(label_begin_block.id_)
+            self._branch(node.test, source, label_end_block, False)
+            source.append(self._parse_node(node.body))
+            source.add_initialize(self._cg.goto(label_begin_block))
+            source.add_initialize(label_end_block.id_)
 
-            source.add_initialize(self._cg.set_variant(
-                constructor_variant, constructor_variant.name, "type"))
+    def _parse_Module(self, node, source, variant):
+        with self._stack, source.start_context():
             source.append(self._parse_node(node.body))
-        elif isinstance(node, ast.Attribute):
-            source.append(self._parse_node(node.value))
-        else:
-            raise NotImplementedError(type(node).__name__)
 
-        return source
+    def _parse_list(self, node, source, variant):
+        for sub_node in node:
+            source.append(self._parse_node(sub_node))
+
+    def _parse_ClassDef(self, node, source, variant):
+        constructor = Function(node.name)
+        constructor_variant = Variant(node.name)
+
+        sub_source = Source(self._cg)
+        sub_source.add_initialize("") # Add a new line before function definition
+        sub_source.add_initialize(constructor.id_)
+        sub_source.add_initialize('call %s.__new__ %s %%*' % (
+            constructor.id_, constructor_variant.id_))
+        sub_source.add_initialize('set "%s=%s"' % (
+            self._ret_variant.type_info.id_, node.name))
+        sub_source.add_initialize('call %s.__init__ %s %%*' % (
+            constructor.id_, self._ret_variant.id_))
+        sub_source.add_finalize(self._cg.raw_return_("%ERRORLEVEL%"))
+        source.add_definition(sub_source)
+
+        source.add_initialize(self._cg.set_variant(
+            constructor_variant, constructor_variant.name, "type"))
+        source.append(self._parse_node(node.body))
+
+    def _parse_Attribute(self, node, source, variant):
+        source.append(self._parse_node(node.value))
+
+    @property
+    def temp_peaks(self):
+        return self._temp_peaks
+
+    @property
+    def peephole_stats(self):
+        return self._peephole_stats
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @classmethod
+    def _get_routine_name(cls, label):
+        if label == "":
+            return "<module>"
+        if label.startswith(Object.TAG_NORMAL):
+            return Object._unescape_name(label[len(Object.TAG_NORMAL):])
+        return label
+
+    def _collect_stats(self, routines):
+        # Labels defined by the program, calls of other labels reach the
+        # runtime library
+        program_labels = set()
+        for routine in routines:
+            program_labels |= set([get_label(x) for x in routine.lines if is_label(x)])
+
+        stats = []
+        for routine in routines:
+            stats.append(collect_routine_stats(
+                self._get_routine_name(routine.label), routine.label,
+                routine.lines, program_labels,
+                self._temp_peaks.get(routine.label, 0),
+                self._peephole_stats.get(routine.label, (0, 0))[1]))
+        return stats
+
+    def _optimize_routine(self, label, lines):
+        logger = logging.getLogger(__name__)
+
+        lines, peak = TempAllocator(
+            prefix=self._temp_prefixes.get(label, "")).allocate(lines)
+        self._temp_peaks[label] = peak
+        logger.debug("%s: %s live temporaries at most", label or "<module>", peak)
+
+        lines, line_count, command_count = Peephole().optimize(lines)
+        self._peephole_stats[label] = (line_count, command_count)
+        logger.debug("%s: peephole removed %s lines, %s commands",
+                     label or "<module>", line_count, command_count)
+        return lines
+
+    def _create_routine(self, lines):
+        label = ""
+        for line in lines:
+            if is_label(line):
+                label = line[1:].split()[0]
+                break
+        return Routine(label, self._optimize_routine(label, lines))
+
+    def _prepare(self, node, shared_names=(), is_imported=False):
+        # Passes over the tree before it's parsed. Shared names are module
+        # level names of modules, other modules could read and set them.
+        inliner = Inliner(self.inline_threshold)
+        node = inliner.inline(node, shared_names)
+        logging.getLogger(__name__).debug("inlined %s calls", inliner.inlined_count)
+        node = ConstantFolder().fold(node)
+        self._types.infer(node, shared_names)
+        self._nodes = NodeIndex(node)
+        # Tuples could come from other modules
+        self._has_tuples = is_imported or any([
+            isinstance(x, ast.Tuple) and isinstance(x.ctx, ast.Load)
+            for x in ast.walk(node)]) or len(shared_names) > 0
+        self._length_names = self._find_length_names(node) - set(shared_names)
+        self._scopeless_functions = EscapeAnalysis(is_imported).analyze(node)
+        logging.getLogger(__name__).debug(
+            "%s functions without setlocal", len(self._scopeless_functions))
+        return node
+
+    def _get_module_directories(self):
+        if self.source_path is None:
+            return [os.getcwd()]
+        return [os.path.dirname(os.path.abspath(self.source_path))]
+
+    def _import_modules(self, node, module_name=None):
+        # Translate the local modules node imports (or take them from the
+        # session) and rename what refers to them. Module level names of an
+        # imported module itself are prefixed by module_name.
+        # Return the units and the names they are shared by.
+        units = []
+        for name in get_imported_names(node):
+            path = find_module(name, self._module_directories)
+            if path is None:
+                raise NotImplementedError("Import of %s, not a local module" % name)
+            units.append(self._get_module_unit(name, path))
+
+        names, modules = get_import_bindings(node)
+        module_names = get_module_names(node)
+        for name in sorted((set(names) | set(modules)) & module_names):
+            raise NotImplementedError("%s bound by import and assignment" % name)
+        if module_name is not None:
+            for name in module_names:
+                names[name] = "%s.%s" % (module_name, name)
+
+        if len(names) <= 0 and len(modules) <= 0:
+            return units, set()
+
+        rewriter = NamespaceRewriter(
+            names, modules, set([x.name for x in units if x.has_init]))
+        rewriter.rewrite(node)
+        return units, rewriter.shared_names
+
+    def _get_module_unit(self, name, path):
+        unit = self._modules.get(path, self._module_directories)
+        if unit is not None:
+            return unit
+
+        self._modules.begin(name)
+        try:
+            # A translator of its own, the state of this one is in the middle
+            # of a translation
+            translator = type(self)()
+            translator.inline_threshold = self.inline_threshold
+            translator._modules = self._modules
+            unit = translator._generate_unit(name, path, self._module_directories)
+        finally:
+            self._modules.end(name)
+        self._modules.put(unit, self._module_directories)
+        return unit
 
-    def translate(self, node):
+    @classmethod
+    def _is_docstring(cls, node):
+        return (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+                and isinstance(node.value.value, str))
+
+    def _generate_unit(self, name, path, directories):
+        self._reset()
+        self._cg = CommandGenerator("%s." % name)
+        self._module_directories = directories
+        source_text = read_source(path)
+        node = ast.parse(source_text, path)
+        node.body = [x for x in node.body if not self._is_docstring(x)]
+        units, shared_names = self._import_modules(node, name)
+        node = self._prepare(node, shared_names, True)
+
+        routines = []
+        with self._stack:
+            source = self._parse_node(node.body)
+
+            # The body runs once, in the scope of the first importer
+            init_lines = list(source)
+            has_init = len([x for x in init_lines if x != ""]) > 0
+            if has_init:
+                function = Function(name)
+                guard_variant = Variant(name, Object.TAG_INTERNAL)
+                lines = ["", function.id_, self._cg.if_(
+                    "defined %s" % guard_variant.id_, self._cg.raw_return_("0"))]
+                lines.append('set "%s=1"' % guard_variant.id_)
+                lines += init_lines
+                lines.append(self._cg.raw_return_("%ERRORLEVEL%"))
+                self._temp_prefixes[function.id_[1:]] = "%s." % function.escaped_name
+                routines.append(self._create_routine(lines))
+
+            for sub_source in source.definitions:
+                routines.append(self._create_routine(sub_source))
+
+        digests = {path: get_digest(source_text)}
+        for unit in units:
+            digests.update(unit.digests)
+        return ModuleUnit(name, path, routines, has_init, digests, units,
+                          self._temp_peaks, self._peephole_stats)
+
+    def _link_modules(self, units, lines):
+        # Routines of the imported modules the program could reach
+        module_lines = []
+        seen = set()
+        for unit in units:
+            for sub_unit in unit.walk():
+                if sub_unit.name in seen:
+                    continue
+                seen.add(sub_unit.name)
+                self._temp_peaks.update(sub_unit.temp_peaks)
+                self._peephole_stats.update(sub_unit.peephole_stats)
+                for routine in sub_unit.routines:
+                    module_lines += routine.lines
+        return Library(module_lines).resolve(lines)
+
+    def generate(self, node):
+        self._reset()
+        self._module_directories = self._get_module_directories()
+        units, shared_names = self._import_modules(node)
+        node = self._prepare(node, shared_names)
         with self._stack:
             source = self._parse_node(node)
-            lines = []
-            lines.append("@echo off")
-            lines += source.front
-            lines += source.back
 
+            # Walk each rope once, everything below scans the lines again.
+            # A rope is let go as soon as its lines are in a list.
+            definitions = source.definitions
+            lines = ["@echo off"]
+            lines += source
+            del source
             lines.append(self._cg.raw_return_("%ERRORLEVEL%"))
+            lines = self._optimize_routine("", lines)
 
-            for sub_source in source.definitions:
-                lines += sub_source.front
-                lines += sub_source.back
+            routines = []
+            definitions.reverse()
+            while len(definitions) > 0:
+                routines.append(self._create_routine(definitions.pop()))
 
-        if not self.is_bootstrap:
-            site_module_file = open(os.path.join(self.get_module_path(), "site.bat"), "r")
-            with site_module_file:
-                for line in site_module_file:
-                    lines.append(line.strip())
+        if len(units) > 0:
+            routines += self._link_modules(
+                units, list(itertools.chain(lines, *[x.lines for x in routines])))
+
+        if self.is_collecting_stats:
+            self._stats = self._collect_stats([Routine("", lines)] + routines)
 
-        return "\n".join(lines)
+        program_lines = itertools.chain(lines, *[x.lines for x in routines])
+
+        # Only link runtime routines the program could reach
+        types = set()
+        if not self.is_bootstrap:
+            library = self._get_library()
+            library_routines, types = library.reach(program_lines)
+            lines += library.prelude
+            routines += library_routines
+
+        if self.layout == "hot":
+            routines = HotLayout(self.layout_profile).arrange(
+                Routine("", lines), routines, types)
+
+        yield from lines
+        for routine in routines:
+            yield from routine.lines
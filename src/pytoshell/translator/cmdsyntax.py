@@ -0,0 +1,22 @@
+def count_parentheses(line):
+    # How much deeper the line leaves the block nesting, parentheses in
+    # quotes don't count
+    level = 0
+    in_quote = False
+    for c in line:
+        if c == '"':
+            in_quote = not in_quote
+        elif not in_quote:
+            if c == "(":
+                level += 1
+            elif c == ")":
+                level -= 1
+    return level
+
+def is_label(line):
+    # "::" starts a comment
+    return line.startswith(":") and not line.startswith("::")
+
+def get_label(line):
+    # Labels are looked up case insensitively
+    return line[1:].split()[0].lower()
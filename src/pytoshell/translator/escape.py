@@ -0,0 +1,102 @@
+import ast
+
+class EscapeAnalysis(object):
+    '''
+    Find functions that don't need a private scope.
+
+    A generated function starts with setlocal, which copies the whole
+    environment, and ends with endlocal, so nothing it sets is seen by its
+    caller. A function that binds no names (it reads its parameters from the
+    variants the caller passed) only writes the return variant and its
+    temporaries. If it's never active twice at the same time, its
+    temporaries could live in a namespace of its own and are dead once it
+    returns, so it's called without setlocal.
+
+    Only module level functions are analyzed. A function is active twice if
+    it could call itself, directly or through other functions. Calls of
+    methods, of names that aren't module level functions (the runtime could
+    call back a method, len() calls __len__ ...) are taken to reach every
+    method of the module. Functions of an imported module could also be
+    called back by the importer through them, so there they reach every
+    function too.
+    '''
+
+    # cmd.exe only reads the arguments %1 to %9 without shift
+    MAX_PARAMETERS = 9
+
+    # Nodes binding names, or bringing code we don't follow
+    _BINDING_TYPES = (
+        ast.FunctionDef, ast.ClassDef, ast.Lambda, ast.Global, ast.Nonlocal,
+        ast.Import, ast.ImportFrom,
+    )
+
+    def __init__(self, is_imported=False):
+        self._is_imported = is_imported
+
+    def analyze(self, node):
+        '''
+        Return the set of function definition nodes that don't need a
+        private scope.
+        '''
+
+        functions = {}
+        methods = []
+        for statement in node.body:
+            if isinstance(statement, ast.FunctionDef):
+                functions[statement.name] = statement
+            elif isinstance(statement, ast.ClassDef):
+                methods += [x for x in statement.body if isinstance(x, ast.FunctionDef)]
+
+        calls = {}
+        for function in list(functions.values()) + methods:
+            calls[function] = self._get_callees(function, functions, methods)
+
+        result = set()
+        for function in functions.values():
+            if self._is_candidate(function) and not self._is_recursive(function, calls):
+                result.add(function)
+        return result
+
+    def _get_callees(self, function, functions, methods):
+        callees = set()
+        for sub_node in ast.walk(function):
+            if not isinstance(sub_node, ast.Call):
+                continue
+
+            if isinstance(sub_node.func, ast.Name) and sub_node.func.id in functions:
+                callees.add(functions[sub_node.func.id])
+            else:
+                callees |= set(methods)
+                if self._is_imported:
+                    callees |= set(functions.values())
+        return callees
+
+    @classmethod
+    def _is_recursive(cls, function, calls):
+        reached = set()
+        pending = list(calls[function])
+        while len(pending) > 0:
+            callee = pending.pop()
+            if callee not in reached:
+                reached.add(callee)
+                pending += list(calls[callee])
+        return function in reached
+
+    def _is_candidate(self, function):
+        arguments = function.args
+        if (len(function.decorator_list) > 0 or len(arguments.defaults) > 0
+                or arguments.vararg is not None or arguments.kwarg is not None
+                or len(arguments.kwonlyargs) > 0
+                or len(getattr(arguments, "posonlyargs", [])) > 0
+                or len(arguments.args) > self.MAX_PARAMETERS):
+            return False
+
+        for sub_node in ast.walk(function):
+            if sub_node is function:
+                continue
+
+            if isinstance(getattr(sub_node, "ctx", None), (ast.Store, ast.Del)):
+                return False
+            if isinstance(sub_node, self._BINDING_TYPES):
+                return False
+        return True
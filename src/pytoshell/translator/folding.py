@@ -0,0 +1,267 @@
+import ast
+import re
+import six
+
+def wrap_int(value, bits=32):
+    '''
+    Wrap value around to a signed integer of bits width, like "set /a" does.
+    '''
+
+    mask = (1 << bits) - 1
+    value &= mask
+    if value >> (bits - 1):
+        value -= (1 << bits)
+    return value
+
+def format_str(text, value):
+    '''
+    The runtime's str.__mod__: replace the first "%s" with str(value), a
+    "%" followed by any other character leaves that character.
+    '''
+
+    result = []
+    last_char = ""
+    for i, c in enumerate(text):
+        if last_char == "%":
+            if c == "s":
+                result.append(value)
+                result.append(text[i + 1:])
+                break
+            result.append(c)
+            last_char = ""
+        else:
+            if c != "%":
+                result.append(c)
+            last_char = c
+    return "".join(result)
+
+class ConstantFolder(ast.NodeTransformer):
+    '''
+    Evaluate constant expressions at compile time.
+
+    Results follow the runtime library of the generated scripts instead of
+    python where they differ: integers wrap around at int_bits and division
+    truncates. Anything the runtime would evaluate differently from python
+    (or fail on) is left alone.
+    '''
+
+    # Longest string a variable could hold in cmd.exe
+    MAX_STR_LENGTH = 8191
+
+    # Builtins without side effects we could call at compile time
+    PURE_BUILTINS = ["len", "str", "int", "range"]
+
+    _DECIMAL_RE = re.compile(r'^-?(0|[1-9][0-9]*)$')
+
+    def __init__(self, int_bits=32):
+        super().__init__()
+        self._int_bits = int_bits
+        self._shadowed_names = set()
+
+    def fold(self, node):
+        self._shadowed_names = self._collect_bound_names(node)
+        return ast.fix_missing_locations(self.visit(node))
+
+    @classmethod
+    def _collect_bound_names(cls, node):
+        names = set()
+        for sub_node in ast.walk(node):
+            if isinstance(sub_node, ast.Name) and not isinstance(sub_node.ctx, ast.Load):
+                names.add(sub_node.id)
+            elif isinstance(sub_node, (ast.FunctionDef, ast.ClassDef)):
+                names.add(sub_node.name)
+            elif isinstance(sub_node, ast.arg):
+                names.add(sub_node.arg)
+            elif isinstance(sub_node, ast.alias):
+                names.add((sub_node.asname or sub_node.name).split(".")[0])
+        return names
+
+    @classmethod
+    def _is_int(cls, value):
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def _is_valid_int(self, value):
+        return (self._is_int(value)
+            and wrap_int(value, self._int_bits) == value)
+
+    def _is_valid_str(self, value):
+        return (isinstance(value, six.string_types)
+            and len(value) <= self.MAX_STR_LENGTH)
+
+    def _is_constant(self, node):
+        if not isinstance(node, ast.Constant):
+            return False
+
+        value = node.value
+        return (isinstance(value, bool) or self._is_valid_int(value)
+            or self._is_valid_str(value))
+
+    def _to_str(self, value):
+        if isinstance(value, bool):
+            return "True" if value else "False"
+        return str(value)
+
+    def _replace(self, node, value):
+        if value is None:
+            return node
+
+        if not (self._is_valid_int(value) or self._is_valid_str(value)
+                or isinstance(value, (bool, range))):
+            return node
+
+        return ast.copy_location(ast.Constant(value=value), node)
+
+    def _eval_int_op(self, op, left, right):
+        if isinstance(op, ast.Add):
+            value = left + right
+        elif isinstance(op, ast.Sub):
+            value = left - right
+        elif isinstance(op, ast.Mult):
+            value = left * right
+        elif isinstance(op, (ast.Div, ast.Mod)):
+            if right == 0:
+                # Leave it to fail at runtime
+                return None
+
+            # Truncated toward zero, the remainder takes the sign of left
+            quotient = abs(left) // abs(right)
+            if (left < 0) != (right < 0):
+                quotient = -quotient
+            if isinstance(op, ast.Div):
+                value = quotient
+            else:
+                value = left - quotient * right
+        elif isinstance(op, (ast.LShift, ast.RShift)):
+            if right < 0 or right >= self._int_bits:
+                return None
+
+            if isinstance(op, ast.LShift):
+                value = left << right
+            else:
+                value = left >> right
+        elif isinstance(op, ast.BitOr):
+            value = left | right
+        elif isinstance(op, ast.BitAnd):
+            value = left & right
+        elif isinstance(op, ast.BitXor):
+            value = left ^ right
+        else:
+            return None
+
+        return wrap_int(value, self._int_bits)
+
+    def _eval_str_op(self, op, left, right):
+        if isinstance(op, ast.Add) and isinstance(right, six.string_types):
+            return left + right
+
+        if isinstance(op, ast.Mult) and self._is_int(right):
+            if len(left) * max(right, 0) > self.MAX_STR_LENGTH:
+                return None
+            return left * right
+
+        if isinstance(op, ast.Mod) and isinstance(right, (bool, int, six.string_types)):
+            value = format_str(left, self._to_str(right))
+            try:
+                # Only fold when python agrees with the runtime
+                if (left % right) != value:
+                    return None
+            except (TypeError, ValueError):
+                return None
+            return value
+
+        return None
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if not (self._is_constant(node.left) and self._is_constant(node.right)):
+            return node
+
+        left = node.left.value
+        right = node.right.value
+        value = None
+        if self._is_int(left) and self._is_int(right):
+            value = self._eval_int_op(node.op, left, right)
+        elif isinstance(left, six.string_types):
+            value = self._eval_str_op(node.op, left, right)
+        elif (self._is_int(left) and isinstance(right, six.string_types)
+                and isinstance(node.op, ast.Mult)):
+            # int.__mul__ hands a string operand over to str.__mul__
+            value = self._eval_str_op(node.op, right, left)
+
+        return self._replace(node, value)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if not self._is_constant(node.operand):
+            return node
+
+        operand = node.operand.value
+        value = None
+        if isinstance(node.op, ast.Not):
+            value = not operand
+        elif self._is_int(operand):
+            if isinstance(node.op, ast.USub):
+                value = wrap_int(-operand, self._int_bits)
+            elif isinstance(node.op, ast.UAdd):
+                value = operand
+            elif isinstance(node.op, ast.Invert):
+                value = wrap_int(~operand, self._int_bits)
+
+        return self._replace(node, value)
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.func, ast.Name):
+            return node
+
+        name = node.func.id
+        if (name not in self.PURE_BUILTINS) or (name in self._shadowed_names):
+            return node
+
+        if len(node.keywords) > 0:
+            return node
+
+        args = node.args
+        if name == "len" and len(args) == 1 and isinstance(args[0], ast.Tuple):
+            if all([self._is_constant(x) for x in args[0].elts]):
+                return self._replace(node, len(args[0].elts))
+            return node
+
+        if not all([self._is_constant(x) for x in args]):
+            return node
+
+        values = [x.value for x in args]
+        value = None
+        if name == "len":
+            if len(values) == 1 and isinstance(values[0], six.string_types):
+                value = len(values[0])
+        elif name == "str":
+            if len(values) == 1:
+                value = self._to_str(values[0])
+        elif name == "int":
+            if len(values) == 1:
+                value = self._eval_int(values[0])
+        elif name == "range":
+            if (1 <= len(values) <= 3) and all([self._is_int(x) for x in values]):
+                # The runtime doesn't check the step, we leave a zero step to
+                # python's error at runtime instead.
+                if len(values) < 3 or values[2] != 0:
+                    value = range(*values)
+
+        return self._replace(node, value)
+
+    def _eval_int(self, value):
+        if isinstance(value, bool):
+            return int(value)
+
+        if self._is_int(value):
+            return value
+
+        # "set /a" reads "010" as octal and "0x10" as hex, python doesn't
+        # accept either, so only plain decimals are folded.
+        if self._DECIMAL_RE.match(value):
+            value = int(value)
+            if self._is_valid_int(value):
+                return value
+
+        return None
@@ -0,0 +1,370 @@
+import ast
+import copy
+
+class Inliner(object):
+    '''
+    Substitute calls of small module level functions by their body.
+
+    The tree is rewritten before any backend sees it, so batch and sh share
+    it: a call costs a label scan, a setlocal (a copy of the whole
+    environment) and an endlocal in batch, a function call and its locals in
+    sh. Functions under threshold expression and statement nodes are inlined
+    where they are called from a statement: as the statement itself, the
+    value of an assignment or return, the test of an if or the iterable of a
+    for. Calls nested in those expressions are hoisted into a variable before
+    the statement, as long as nothing evaluated before them could see the
+    difference.
+
+    Parameters and locals of an inlined body are renamed to fresh names, so
+    they don't clash with names at the call site. Only functions without
+    decorators, defaults, keyword or variable arguments, which aren't
+    recursive and only return at the end of their body are inlined.
+    '''
+
+    DEFAULT_THRESHOLD = 32
+
+    # Builtins without side effects, calls of them could be passed by
+    PURE_BUILTINS = ["len", "str", "int", "bool", "range", "type"]
+
+    # Nodes evaluating their operands conditionally (or later)
+    _LAZY_TYPES = (
+        ast.BoolOp, ast.IfExp, ast.Lambda, ast.ListComp, ast.SetComp,
+        ast.DictComp, ast.GeneratorExp,
+    )
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self._threshold = threshold
+        self._functions = {}
+        self._names = set()
+        self._bound_names = set()
+        self._inline_id = 0
+        self._inlined_count = 0
+        self._exported_names = set()
+
+    @property
+    def inlined_count(self):
+        return self._inlined_count
+
+    def inline(self, node, exported_names=()):
+        '''
+        Inline calls in the module node, functions named in exported_names
+        are called by other modules and kept even if nothing calls them here.
+        '''
+
+        self._exported_names = set(exported_names)
+        self._functions = {}
+        self._names = set()
+        self._inline_id = 0
+        self._inlined_count = 0
+        if self._threshold <= 0:
+            return node
+
+        self._names = self._collect_names(node)
+        self._functions = self._find_functions(node)
+        if len(self._functions) <= 0:
+            return node
+
+        node.body = self._inline_body(node.body, set())
+        for sub_node in ast.walk(node):
+            if isinstance(sub_node, ast.FunctionDef):
+                sub_node.body = self._inline_body(
+                    sub_node.body, self._get_locals(sub_node))
+
+        self._remove_unused(node)
+        return ast.fix_missing_locations(node)
+
+    def _remove_unused(self, node):
+        # Definitions of functions no longer referred to, removing one could
+        # leave others unused
+        while True:
+            names = set([x.id for x in ast.walk(node) if isinstance(x, ast.Name)])
+            body = [x for x in node.body if not (
+                isinstance(x, ast.FunctionDef) and x.name in self._functions
+                and x.name not in names and x.name not in self._exported_names)]
+            if len(body) == len(node.body):
+                break
+            node.body = body
+
+    @classmethod
+    def _collect_names(cls, node):
+        names = set()
+        for sub_node in ast.walk(node):
+            if isinstance(sub_node, ast.Name):
+                names.add(sub_node.id)
+            elif isinstance(sub_node, (ast.FunctionDef, ast.ClassDef)):
+                names.add(sub_node.name)
+            elif isinstance(sub_node, ast.arg):
+                names.add(sub_node.arg)
+            elif isinstance(sub_node, ast.alias):
+                names.add((sub_node.asname or sub_node.name).split(".")[0])
+        return names
+
+    @classmethod
+    def _get_locals(cls, function):
+        names = set([x.arg for x in function.args.args])
+        for sub_node in ast.walk(function):
+            if sub_node is function:
+                continue
+
+            if isinstance(sub_node, ast.Name) and not isinstance(sub_node.ctx, ast.Load):
+                names.add(sub_node.id)
+            elif isinstance(sub_node, (ast.FunctionDef, ast.ClassDef)):
+                names.add(sub_node.name)
+        return names
+
+    @classmethod
+    def _get_size(cls, function):
+        return len([x for x in ast.walk(function)
+            if isinstance(x, (ast.stmt, ast.expr))]) - 1
+
+    def _is_candidate(self, function):
+        arguments = function.args
+        if (len(function.decorator_list) > 0 or len(arguments.defaults) > 0
+                or arguments.vararg is not None or arguments.kwarg is not None
+                or len(arguments.kwonlyargs) > 0
+                or len(getattr(arguments, "posonlyargs", [])) > 0):
+            return False
+
+        if self._get_size(function) > self._threshold:
+            return False
+
+        for i, statement in enumerate(function.body):
+            for sub_node in ast.walk(statement):
+                if isinstance(sub_node, ast.Return) and not (
+                        sub_node is statement and i == len(function.body) - 1):
+                    return False
+                if isinstance(sub_node, (
+                        ast.FunctionDef, ast.ClassDef, ast.Global, ast.Nonlocal,
+                        ast.Yield, ast.YieldFrom, ast.Lambda, ast.Import,
+                        ast.ImportFrom)):
+                    return False
+        return True
+
+    def _find_functions(self, node):
+        # Module level functions bound nowhere else
+        bound_counts = {}
+        for sub_node in ast.walk(node):
+            name = None
+            if isinstance(sub_node, ast.Name) and not isinstance(sub_node.ctx, ast.Load):
+                name = sub_node.id
+            elif isinstance(sub_node, (ast.FunctionDef, ast.ClassDef)):
+                name = sub_node.name
+            elif isinstance(sub_node, ast.arg):
+                name = sub_node.arg
+            elif isinstance(sub_node, ast.alias):
+                name = (sub_node.asname or sub_node.name).split(".")[0]
+            if name is not None:
+                bound_counts[name] = bound_counts.get(name, 0) + 1
+        self._bound_names = set(bound_counts.keys())
+
+        functions = {}
+        for statement in node.body:
+            if (isinstance(statement, ast.FunctionDef)
+                    and bound_counts.get(statement.name) == 1
+                    and self._is_candidate(statement)):
+                functions[statement.name] = statement
+
+        # Drop recursive functions, directly or through other candidates
+        calls = {}
+        for name, function in functions.items():
+            calls[name] = set([x.func.id for x in ast.walk(function)
+                if isinstance(x, ast.Call) and isinstance(x.func, ast.Name)
+                and x.func.id in functions])
+
+        for name in list(functions.keys()):
+            reached = set()
+            pending = list(calls[name])
+            while len(pending) > 0:
+                callee = pending.pop()
+                if callee not in reached:
+                    reached.add(callee)
+                    pending += list(calls[callee])
+            if name in reached:
+                del functions[name]
+
+        return functions
+
+    def _get_function(self, node, scope_locals):
+        # The function a call could be inlined from, None if it can't
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)):
+            return None
+
+        function = self._functions.get(node.func.id)
+        if function is None or node.func.id in scope_locals:
+            return None
+
+        if len(node.keywords) > 0 or len(node.args) != len(function.args.args):
+            return None
+
+        if any([isinstance(x, ast.Starred) for x in node.args]):
+            return None
+
+        # Free names of the body are globals, a local of the caller would
+        # hide them
+        free_names = set([x.id for x in ast.walk(function)
+            if isinstance(x, ast.Name)]) - self._get_locals(function)
+        if len(free_names & scope_locals) > 0:
+            return None
+
+        return function
+
+    def _is_pure_call(self, node):
+        return (isinstance(node.func, ast.Name)
+            and node.func.id in self.PURE_BUILTINS
+            and node.func.id not in self._bound_names)
+
+    def _collect_calls(self, node, scope_locals, calls):
+        '''
+        Append calls in node that could be inlined to calls, in evaluation
+        order. Return False once a call with unknown effects was met, calls
+        evaluated after it must stay where they are.
+        '''
+
+        if isinstance(node, self._LAZY_TYPES):
+            return not any([isinstance(x, ast.Call) for x in ast.walk(node)])
+
+        for child in ast.iter_child_nodes(node):
+            if not self._collect_calls(child, scope_locals, calls):
+                return False
+
+        if isinstance(node, ast.Call):
+            if self._get_function(node, scope_locals) is not None:
+                calls.append(node)
+            elif not self._is_pure_call(node):
+                return False
+
+        return True
+
+    def _new_name(self, function, name):
+        return "_%s%s_%s" % (function.name, self._inline_id, name)
+
+    def _expand(self, function, call, scope_locals):
+        '''
+        Return the statements of the body of function with call's arguments
+        bound to renamed parameters, the returned expression (None if the
+        body doesn't return anything) and a fresh name for the result.
+        '''
+
+        self._inline_id += 1
+        # "return" can't be the name of a local
+        function_locals = self._get_locals(function) | set(["return"])
+        while any([self._new_name(function, x) in self._names for x in function_locals]):
+            self._inline_id += 1
+        names = dict([(x, self._new_name(function, x)) for x in function_locals])
+        self._names |= set(names.values())
+        self._inlined_count += 1
+
+        statements = []
+        for an_arg, value in zip(function.args.args, call.args):
+            statements.append(ast.copy_location(ast.Assign(
+                targets=[ast.Name(id=names[an_arg.arg], ctx=ast.Store())],
+                value=value), call))
+
+        body = copy.deepcopy(function.body)
+        for statement in body:
+            for sub_node in ast.walk(statement):
+                if isinstance(sub_node, ast.Name) and sub_node.id in names:
+                    sub_node.id = names[sub_node.id]
+            ast.copy_location(statement, call)
+
+        # The body could call other functions to inline, the returned value
+        # too
+        body = self._inline_body(body, scope_locals)
+        value = None
+        if len(body) > 0 and isinstance(body[-1], ast.Return):
+            value = body.pop().value
+            if value is None:
+                value = ast.Constant(value=None)
+
+        statements += body
+        return statements, value, names["return"]
+
+    def _replace_node(self, root, old_node, new_node):
+        for node in ast.walk(root):
+            for field, value in ast.iter_fields(node):
+                if value is old_node:
+                    setattr(node, field, new_node)
+                    return True
+                if isinstance(value, list):
+                    for i, item in enumerate(value):
+                        if item is old_node:
+                            value[i] = new_node
+                            return True
+        return False
+
+    def _inline_statement(self, statement, scope_locals):
+        result = []
+
+        # A call being the whole statement or value is substituted directly
+        call = None
+        if isinstance(statement, (ast.Expr, ast.Return)):
+            call = statement.value
+        elif isinstance(statement, ast.Assign):
+            call = statement.value
+        if call is not None and self._get_function(call, scope_locals) is not None:
+            # Arguments are evaluated before the body, calls in them first
+            statement_calls = []
+            for argument in call.args:
+                if not self._collect_calls(argument, scope_locals, statement_calls):
+                    break
+            result += self._hoist(statement_calls, call, scope_locals)
+
+            body, value, name = self._expand(
+                self._get_function(call, scope_locals), call, scope_locals)
+            result += body
+            if isinstance(statement, ast.Expr):
+                if value is not None and any(
+                        [isinstance(x, ast.Call) for x in ast.walk(value)]):
+                    result.append(ast.copy_location(ast.Expr(value=value), statement))
+            else:
+                if value is None:
+                    value = ast.Constant(value=None)
+                statement.value = value
+                result.append(statement)
+            return result
+
+        expression = None
+        if isinstance(statement, (ast.Expr, ast.Return, ast.Assign)):
+            expression = statement.value
+        elif isinstance(statement, ast.If):
+            expression = statement.test
+        elif isinstance(statement, ast.For):
+            expression = statement.iter
+
+        if expression is not None:
+            calls = []
+            self._collect_calls(expression, scope_locals, calls)
+            result += self._hoist(calls, statement, scope_locals)
+
+        result.append(statement)
+        return result
+
+    def _hoist(self, calls, root, scope_locals):
+        # Evaluate calls to new variables before root, which reads them
+        # instead
+        result = []
+        for call in calls:
+            function = self._get_function(call, scope_locals)
+            body, value, name = self._expand(function, call, scope_locals)
+            if value is None:
+                value = ast.Constant(value=None)
+            result += body
+            result.append(ast.copy_location(ast.Assign(
+                targets=[ast.Name(id=name, ctx=ast.Store())], value=value), call))
+            self._replace_node(root, call, ast.copy_location(
+                ast.Name(id=name, ctx=ast.Load()), call))
+        return result
+
+    def _inline_body(self, statements, scope_locals):
+        result = []
+        for statement in statements:
+            if isinstance(statement, (ast.If, ast.While, ast.For)):
+                statement.body = self._inline_body(statement.body, scope_locals)
+                statement.orelse = self._inline_body(statement.orelse, scope_locals)
+            if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+                # Bodies of functions are inlined with their own locals
+                result.append(statement)
+                continue
+
+            result += self._inline_statement(statement, scope_locals)
+        return result
@@ -0,0 +1,155 @@
+import io
+import json
+import re
+from .cmdsyntax import count_parentheses, get_label, is_label
+from .linker import Routine, resolve_dynamic_call
+
+# Estimated iteration count of a loop, used to weight the lines inside it
+LOOP_WEIGHT = 10
+
+def estimate_line_weights(lines):
+    '''
+    Estimate how often each line runs relative to the routine entry.
+
+    A loop is either the lines between a label and a later goto back to it,
+    or the block of a "for" command. Each loop nesting level multiplies the
+    weight by LOOP_WEIGHT.
+    '''
+
+    labels = {}
+    for i, line in enumerate(lines):
+        if is_label(line):
+            labels.setdefault(get_label(line), i)
+
+    depth_changes = [0] * (len(lines) + 1)
+    for i, line in enumerate(lines):
+        for target in re.findall(r'\bgoto\s+:?([^\s&|()"]+)', line, re.IGNORECASE):
+            start = labels.get(target.lower())
+            if start is not None and start < i:
+                depth_changes[start] += 1
+                depth_changes[i + 1] -= 1
+
+        if line[:4].lower() == "for ":
+            # The block of a for command ends when its parentheses balance
+            end = i
+            level = count_parentheses(line)
+            while level > 0 and end + 1 < len(lines):
+                end += 1
+                level += count_parentheses(lines[end])
+            depth_changes[i] += 1
+            depth_changes[end + 1] -= 1
+
+    weights = []
+    depth = 0
+    for i in range(len(lines)):
+        depth += depth_changes[i]
+        weights.append(LOOP_WEIGHT ** depth)
+    return weights
+
+def load_profile(path):
+    '''
+    Load per label call counts recorded by a previous run.
+
+    Either a plain {"label": count} object or an object with such a mapping
+    under "calls" (as written by the emulator's --profile option).
+    '''
+
+    with io.open(path) as profile_file:
+        profile = json.load(profile_file)
+
+    if "calls" in profile and isinstance(profile["calls"], dict):
+        profile = profile["calls"]
+
+    return dict([(x.lstrip(":").lower(), int(y)) for x, y in profile.items()])
+
+class HotLayout(object):
+    '''
+    Order routines so hot callees are placed right after their callers.
+
+    cmd.exe looks for the target of a "call :label" or "goto" by scanning
+    forward from the current position and wrapping around at the end of the
+    script, so a callee placed just after its caller is found quickly.
+    '''
+
+    def __init__(self, profile=None, prefix="PYTSV"):
+        self._profile = profile
+        self._prefix = prefix
+
+    def _estimate_edges(self, routine, routine_map, types):
+        edges = {}
+        lines = list(routine.lines)
+        weights = estimate_line_weights(lines)
+        for line, weight in zip(lines, weights):
+            calls, dynamic_calls = Routine.parse_targets(line, self._prefix)
+            for key in calls:
+                if key in routine_map:
+                    edges[key] = edges.get(key, 0) + weight
+
+            for type_, method in dynamic_calls:
+                if type_ is None and method is None:
+                    continue
+
+                keys = resolve_dynamic_call(
+                    type_, method, types, routine_map, self._prefix)
+                for key in keys:
+                    edges[key] = edges.get(key, 0) + float(weight) / len(keys)
+        return edges
+
+    def _apply_profile(self, main, graph):
+        if not self._profile:
+            return
+
+        incoming = {}
+        for caller_edges in graph.values():
+            for key, weight in caller_edges.items():
+                incoming[key] = incoming.get(key, 0) + weight
+
+        for key, count in self._profile.items():
+            if key not in graph:
+                continue
+
+            if incoming.get(key, 0) <= 0:
+                # Only reached through sites we couldn't resolve statically
+                graph[main.key][key] = count
+                continue
+
+            # Split the measured count between callers in proportion to the
+            # static estimate.
+            scale = float(count) / incoming[key]
+            for caller_edges in graph.values():
+                if key in caller_edges:
+                    caller_edges[key] *= scale
+
+    def arrange(self, main, routines, types=()):
+        '''
+        Return routines in hot order, main is the entry and is not included.
+        '''
+
+        routine_map = dict([(x.key, x) for x in routines])
+        graph = {}
+        for routine in [main] + list(routines):
+            graph[routine.key] = self._estimate_edges(routine, routine_map, types)
+        self._apply_profile(main, graph)
+
+        indexes = dict([(x.key, i) for i, x in enumerate(routines)])
+        order = []
+        placed = set([main.key])
+
+        # Depth first from the entry, following the hottest call first
+        stack = [main.key]
+        while len(stack) > 0:
+            key = stack.pop()
+            if key != main.key:
+                if key in placed:
+                    continue
+                placed.add(key)
+                order.append(routine_map[key])
+
+            callees = sorted(graph[key].items(), key=lambda x: (-x[1], indexes[x[0]]))
+            for callee, weight in reversed(callees):
+                if callee not in placed:
+                    stack.append(callee)
+
+        # Routines we never saw a call to keep their original order
+        order += [x for x in routines if x.key not in placed]
+        return order
@@ -0,0 +1,295 @@
+import re
+
+class Routine(object):
+    '''
+    A labeled routine of a runtime library, or the generated program itself
+    when label is None.
+
+    We keep what the routine refers to: static call/goto targets, dynamic
+    dispatch sites and the type tags it produces.
+    '''
+
+    # call :label, goto label, goto :label
+    _TARGET_RE = re.compile(r'\b(?:call\s+:|goto\s+:?)([^\s&|()"]+)', re.IGNORECASE)
+    # set "@PYTSR-T=int"
+    _TYPE_RE = re.compile(r'-T=([A-Za-z_][\w.]*)"', re.IGNORECASE)
+    # :PYTSV%@PYTSR-T%.__len__ or :PYTSV!%1-T!.__getitem__, without prefix
+    _DYNAMIC_TYPE_RE = re.compile(r'^(?:%[^%]*%|![^!]*!)\.([^\s%!]+)$')
+    # :PYTSVstr.%@PYTSRTEMP_METHOD%, without prefix
+    _DYNAMIC_METHOD_RE = re.compile(r'^([^\s%!.]+)\.(?:%[^%]*%|![^!]*!)')
+
+    def __init__(self, label, lines, prefix="PYTSV"):
+        self.label = label
+        self.lines = lines
+        self.calls = set()
+        self.types = set()
+        # (type, method), None stands for "unknown at link time"
+        self.dynamic_calls = set()
+
+        for line in lines:
+            calls, dynamic_calls = self.parse_targets(line, prefix)
+            self.calls.update(calls)
+            self.dynamic_calls.update(dynamic_calls)
+            self.types.update(self._TYPE_RE.findall(line))
+
+    @classmethod
+    def parse_targets(cls, line, prefix="PYTSV"):
+        calls = []
+        dynamic_calls = []
+        if line.startswith("::") or line[:4].lower() == "rem ":
+            return calls, dynamic_calls
+
+        for target in cls._TARGET_RE.findall(line):
+            if ("%" not in target) and ("!" not in target):
+                calls.append(target.lower())
+                continue
+
+            if target.lower().startswith(prefix.lower()):
+                target = target[len(prefix):]
+
+                match = cls._DYNAMIC_TYPE_RE.match(target)
+                if match:
+                    dynamic_calls.append((None, match.group(1).lower()))
+                    continue
+
+                match = cls._DYNAMIC_METHOD_RE.match(target)
+                if match:
+                    dynamic_calls.append((match.group(1).lower(), None))
+                    continue
+
+            dynamic_calls.append((None, None))
+
+        return calls, dynamic_calls
+
+    @property
+    def key(self):
+        return self.label.lower()
+
+def resolve_dynamic_call(type_, method, types, routine_map, prefix="PYTSV",
+                         separator="."):
+    '''
+    Return keys of routine_map a dynamic dispatch site could reach.
+
+    Methods are named (prefix)(type)(separator)(method).
+    '''
+
+    prefix = prefix.lower()
+    if type_ is None and method is None:
+        # Can't tell anything about the target, keep everything
+        return list(routine_map.keys())
+
+    if method is None:
+        # Keep the whole method family of the type
+        family = "%s%s%s" % (prefix, type_, separator)
+        return [x for x in routine_map.keys() if x.startswith(family)]
+
+    keys = []
+    for atype in sorted(types):
+        key = "%s%s%s%s" % (prefix, atype.lower(), separator, method)
+        if key in routine_map:
+            keys.append(key)
+    return keys
+
+class Library(object):
+    '''
+    A runtime library split into routines, one per top level label.
+
+    Labels starting with prefix open a new routine, other labels (the
+    LABEL_xxx jump targets) belong to the routine they appear in.
+    '''
+
+    routine_class = Routine
+    separator = "."
+
+    def __init__(self, lines, prefix="PYTSV"):
+        self._prefix = prefix
+        self._prelude = []
+        self._routines = []
+        self._routine_map = {}
+
+        routine_lines = self._prelude
+        pending_lines = []
+        label = None
+        for line in lines:
+            stripped = line.strip()
+            routine_label = self._get_routine_label(stripped)
+            if routine_label is not None:
+                if label is not None:
+                    self._add_routine(label, routine_lines)
+                label = routine_label
+                routine_lines = []
+                # Comments just before a label describe the routine after them
+                routine_lines += pending_lines
+                pending_lines = []
+                routine_lines.append(line)
+            elif stripped == "" or self._is_comment(stripped):
+                pending_lines.append(line)
+            else:
+                routine_lines += pending_lines
+                pending_lines = []
+                routine_lines.append(line)
+
+        if label is not None:
+            self._add_routine(label, routine_lines)
+
+        # Drop comment-only preludes, they are only scanned text for cmd.exe
+        if len([x for x in self._prelude if x.strip() != ""]) <= 0:
+            self._prelude = []
+
+    def _get_routine_label(self, line):
+        # The label of the routine line starts, None if it doesn't start one
+        if line.startswith(":") and line[1:].upper().startswith(self._prefix):
+            return line.split()[0][1:]
+        return None
+
+    @classmethod
+    def _is_comment(cls, line):
+        return line.startswith("::") or line[:4].upper() == "REM "
+
+    def _add_routine(self, label, lines):
+        routine = self.routine_class(label, lines, self._prefix)
+        self._routines.append(routine)
+        self._routine_map[routine.key] = routine
+
+    def update(self, other):
+        '''
+        Add the prelude and routines of other library, its routines replace
+        the ones of the same name in place.
+        '''
+
+        self._prelude = self._prelude + other.prelude
+        for routine in other._routines:
+            replaced = self._routine_map.get(routine.key)
+            if replaced is None:
+                self._routines.append(routine)
+            else:
+                self._routines[self._routines.index(replaced)] = routine
+            self._routine_map[routine.key] = routine
+
+    @property
+    def routines(self):
+        return self._routines
+
+    def get_routine(self, label):
+        return self._routine_map.get(label.lower())
+
+    def _resolve(self, type_, method, types):
+        return resolve_dynamic_call(
+            type_, method, types, self._routine_map, self._prefix, self.separator)
+
+    def reach(self, lines):
+        '''
+        Return routines reachable from the program lines, in library order,
+        and the type tags the program could produce.
+
+        Dynamic dispatch sites (:PYTSV%type%.method) are resolved against the
+        type tags produced by the program and by every reachable routine, so
+        this runs to a fixed point.
+        '''
+
+        program = self.routine_class(None, lines, self._prefix)
+        reachable = set()
+        types = set()
+        dynamic_calls = set()
+        queue = [program]
+
+        while True:
+            while len(queue) > 0:
+                routine = queue.pop()
+                types.update(routine.types)
+                dynamic_calls.update(routine.dynamic_calls)
+                for key in routine.calls:
+                    if (key in self._routine_map) and (key not in reachable):
+                        reachable.add(key)
+                        queue.append(self._routine_map[key])
+
+            for type_, method in dynamic_calls:
+                for key in self._resolve(type_, method, types):
+                    if key not in reachable:
+                        reachable.add(key)
+                        queue.append(self._routine_map[key])
+
+            if len(queue) <= 0:
+                break
+
+        return [x for x in self._routines if x.key in reachable], types
+
+    def resolve(self, lines):
+        return self.reach(lines)[0]
+
+    @property
+    def prelude(self):
+        return self._prelude
+
+    def link(self, lines):
+        '''
+        Return the library lines needed by the program lines.
+        '''
+
+        result = list(self._prelude)
+        for routine in self.resolve(lines):
+            result += routine.lines
+        return result
+
+class ShRoutine(Routine):
+    '''
+    A function of a sh runtime library, methods are named
+    (prefix)(type)_(method).
+    '''
+
+    # PYTSFlen, PYTSF${PYTSTA1}___add__, PYTSFstr_${PYTSRTEMP_METHOD}
+    _TARGET_RE = re.compile(r'\bPYTSF((?:\w|\$\{[^}]*\})+)')
+    # PYTSTR=int, or a type tag passed with its value: PYTSFprint 'a' str
+    _TYPE_RE = re.compile(r'(?:\bPYTST\w*=|\s)([A-Za-z_]\w*)(?=[\s;]|$)')
+    _DYNAMIC_TYPE_RE = re.compile(r'^\$\{[^}]*\}_(\w+)$')
+    _DYNAMIC_METHOD_RE = re.compile(r'^([A-Za-z0-9]+)_\$\{')
+
+    @classmethod
+    def parse_targets(cls, line, prefix="PYTSF"):
+        calls = []
+        dynamic_calls = []
+        if line.lstrip().startswith("#"):
+            return calls, dynamic_calls
+
+        for target in cls._TARGET_RE.findall(line):
+            if "$" not in target:
+                calls.append((prefix + target).lower())
+                continue
+
+            match = cls._DYNAMIC_TYPE_RE.match(target)
+            if match:
+                dynamic_calls.append((None, match.group(1).lower()))
+                continue
+
+            match = cls._DYNAMIC_METHOD_RE.match(target)
+            if match:
+                dynamic_calls.append((match.group(1).lower(), None))
+                continue
+
+            dynamic_calls.append((None, None))
+
+        return calls, dynamic_calls
+
+class ShLibrary(Library):
+    '''
+    A sh runtime library split into routines, one per top level function
+    named after prefix.
+    '''
+
+    routine_class = ShRoutine
+    separator = "_"
+
+    _FUNCTION_RE = re.compile(r'^(\w+)\s*\(\s*\)')
+
+    def __init__(self, lines, prefix="PYTSF"):
+        super().__init__(lines, prefix)
+
+    def _get_routine_label(self, line):
+        match = self._FUNCTION_RE.match(line)
+        if match and match.group(1).upper().startswith(self._prefix):
+            return match.group(1)
+        return None
+
+    @classmethod
+    def _is_comment(cls, line):
+        return line.startswith("#")
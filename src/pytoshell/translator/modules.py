@@ -0,0 +1,290 @@
+import ast
+import hashlib
+import io
+import os.path
+
+def find_module(name, directories):
+    '''
+    Return the path of the local module name ("a.b" is a/b.py or
+    a/b/__init__.py) in the first of directories having it, None if no one
+    has.
+    '''
+
+    for directory in directories:
+        base_path = os.path.join(directory, *name.split("."))
+        for path in (base_path + ".py", os.path.join(base_path, "__init__.py")):
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+    return None
+
+def read_source(path):
+    with io.open(path, "rb") as module_file:
+        return module_file.read()
+
+def get_digest(source):
+    return hashlib.sha1(source).hexdigest()
+
+def get_imported_names(node):
+    '''
+    Return names of the modules imported by statements of the module node,
+    in the order they are imported.
+
+    Only module level statements may import, and only absolute imports of
+    whole modules or names in them are supported.
+    '''
+
+    names = []
+    for statement in node.body:
+        if isinstance(statement, ast.Import):
+            names += [x.name for x in statement.names]
+        elif isinstance(statement, ast.ImportFrom):
+            if statement.level > 0:
+                raise NotImplementedError("Relative import of %s" % statement.module)
+            if any([x.name == "*" for x in statement.names]):
+                raise NotImplementedError("from %s import *" % statement.module)
+            names.append(statement.module)
+
+    module_statements = set(node.body)
+    for sub_node in ast.walk(node):
+        if (isinstance(sub_node, (ast.Import, ast.ImportFrom))
+                and sub_node not in module_statements):
+            raise NotImplementedError("Import out of module level")
+
+    result = []
+    for name in names:
+        if name not in result:
+            result.append(name)
+    return result
+
+def get_import_bindings(node):
+    '''
+    Return (names, modules) bound by the import statements of the module
+    node: names maps a name imported from a module to "(module).(name)",
+    modules maps a name bound by "import" to the module name.
+    '''
+
+    names = {}
+    modules = {}
+    for statement in node.body:
+        if isinstance(statement, ast.Import):
+            for alias in statement.names:
+                if alias.asname is None and "." in alias.name:
+                    raise NotImplementedError("import %s without as" % alias.name)
+                modules[alias.asname or alias.name] = alias.name
+        elif isinstance(statement, ast.ImportFrom):
+            for alias in statement.names:
+                names[alias.asname or alias.name] = "%s.%s" % (
+                    statement.module, alias.name)
+    return names, modules
+
+def collect_digests(node, directories):
+    '''
+    Return {path: digest} of the local modules the module node imports,
+    directly or through other modules.
+    '''
+
+    digests = {}
+    nodes = [node]
+    while len(nodes) > 0:
+        for name in get_imported_names(nodes.pop()):
+            path = find_module(name, directories)
+            if path is None or path in digests:
+                continue
+            source = read_source(path)
+            digests[path] = get_digest(source)
+            nodes.append(ast.parse(source, path))
+    return digests
+
+def _get_stored_names(statements):
+    # Names bound by statements, not looking into functions and classes
+    # they define
+    names = set()
+    nodes = list(statements)
+    while len(nodes) > 0:
+        node = nodes.pop()
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            continue
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+        elif isinstance(node, ast.Global):
+            continue
+        nodes += list(ast.iter_child_nodes(node))
+    return names
+
+def get_module_names(node):
+    '''
+    Return names the module node binds at module level.
+    '''
+
+    return _get_stored_names([x for x in node.body
+        if not isinstance(x, (ast.Import, ast.ImportFrom))])
+
+class ModuleUnit(object):
+    '''
+    A module translated on its own, once per session.
+
+    Its functions, classes and variables are named "(module).(name)", its
+    jump labels are prefixed by the module name, so the routines of any
+    number of modules link into one script. The body of the module is the
+    routine named after the module, run by the first import (has_init is
+    False if there's nothing to run).
+    '''
+
+    def __init__(self, name, path, routines, has_init, digests,
+                 dependencies, temp_peaks=None, peephole_stats=None):
+        self.name = name
+        self.path = path
+        self.routines = routines
+        self.has_init = has_init
+        # {path: digest} of the module and every module it imports
+        self.digests = digests
+        self.dependencies = dependencies
+        self.temp_peaks = temp_peaks or {}
+        self.peephole_stats = peephole_stats or {}
+
+    def walk(self):
+        '''
+        Yield the unit and the units it imports, directly or not, once each.
+        '''
+
+        seen = set()
+        units = [self]
+        while len(units) > 0:
+            unit = units.pop()
+            if unit.name in seen:
+                continue
+            seen.add(unit.name)
+            yield unit
+            units += reversed(unit.dependencies)
+
+class ModuleCache(object):
+    '''
+    Units translated in a session, keyed by the path of the module and the
+    directories imports are looked up in. A unit is reused as long as its
+    module and the modules it imports are unchanged on disk.
+    '''
+
+    def __init__(self):
+        self._units = {}
+        self._pending = set()
+
+    def get(self, path, directories):
+        unit = self._units.get((path, tuple(directories)))
+        if unit is None:
+            return None
+
+        for module_path, digest in unit.digests.items():
+            if not os.path.isfile(module_path):
+                return None
+            if get_digest(read_source(module_path)) != digest:
+                return None
+        return unit
+
+    def put(self, unit, directories):
+        self._units[(unit.path, tuple(directories))] = unit
+
+    def begin(self, name):
+        # Marks a module being translated, a module reached again from its
+        # own imports is a circular import
+        if name in self._pending:
+            raise NotImplementedError("Circular import of %s" % name)
+        self._pending.add(name)
+
+    def end(self, name):
+        self._pending.discard(name)
+
+    def __len__(self):
+        return len(self._units)
+
+class NamespaceRewriter(ast.NodeTransformer):
+    '''
+    Rewrite names of a module to the names they have in the linked script.
+
+    names maps a module level name to its new name, modules maps a name
+    bound by "import" to the module it is: "m.f" becomes the name "(module).f".
+    Names a function binds itself are left alone in it. Import statements
+    become a call of the module's routine, or nothing if the module has
+    nothing to run (inits holds modules that have) or was imported before.
+
+    shared_names are the names rewritten to, other modules could read or set
+    them.
+    '''
+
+    def __init__(self, names, modules, inits):
+        self._names = names
+        self._modules = modules
+        self._inits = inits
+        self._scopes = [set()]
+        self._shared_names = set()
+        self._called_inits = set()
+
+    @property
+    def shared_names(self):
+        return self._shared_names
+
+    def rewrite(self, node):
+        return ast.fix_missing_locations(self.visit(node))
+
+    def _is_module_level(self):
+        return len(self._scopes) <= 1
+
+    def _rename(self, node):
+        if self._is_module_level() and node.name in self._names:
+            node.name = self._names[node.name]
+            self._shared_names.add(node.name)
+
+    def _enter_scope(self, node, names):
+        self._scopes.append(names)
+        try:
+            node.body = [self.visit(x) for x in node.body]
+        finally:
+            self._scopes.pop()
+
+    def visit_FunctionDef(self, node):
+        self._rename(node)
+        node.decorator_list = [self.visit(x) for x in node.decorator_list]
+        node.args = self.visit(node.args)
+
+        names = set([x.arg for x in node.args.args])
+        names |= _get_stored_names(node.body)
+        for sub_node in ast.walk(node):
+            if isinstance(sub_node, ast.Global):
+                names -= set(sub_node.names)
+        self._enter_scope(node, names)
+        return node
+
+    def visit_ClassDef(self, node):
+        self._rename(node)
+        node.bases = [self.visit(x) for x in node.bases]
+        self._enter_scope(node, _get_stored_names(node.body))
+        return node
+
+    def visit_Name(self, node):
+        if (node.id not in self._scopes[-1]) and (node.id in self._names):
+            node.id = self._names[node.id]
+            self._shared_names.add(node.id)
+        return node
+
+    def visit_Attribute(self, node):
+        if (isinstance(node.value, ast.Name) and (node.value.id in self._modules)
+                and (node.value.id not in self._scopes[-1])):
+            name = "%s.%s" % (self._modules[node.value.id], node.attr)
+            self._shared_names.add(name)
+            return ast.copy_location(ast.Name(id=name, ctx=node.ctx), node)
+        return self.generic_visit(node)
+
+    def _call_init(self, node, names):
+        statements = []
+        for name in names:
+            if name in self._inits and name not in self._called_inits:
+                self._called_inits.add(name)
+                statements.append(ast.copy_location(ast.Expr(value=ast.Call(
+                    func=ast.Name(id=name, ctx=ast.Load()), args=[], keywords=[])), node))
+        return statements
+
+    def visit_Import(self, node):
+        return self._call_init(node, [x.name for x in node.names])
+
+    def visit_ImportFrom(self, node):
+        return self._call_init(node, [node.module])
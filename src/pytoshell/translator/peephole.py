@@ -0,0 +1,407 @@
+import re
+from .cmdsyntax import count_parentheses, get_label, is_label
+
+def _split_commands(line):
+    # Split a line at "&" outside of quotes
+    commands = []
+    start = 0
+    in_quote = False
+    for i, c in enumerate(line):
+        if c == '"':
+            in_quote = not in_quote
+        elif c == "&" and not in_quote:
+            commands.append(line[start:i].strip())
+            start = i + 1
+    commands.append(line[start:].strip())
+    return [x for x in commands if x != ""]
+
+def count_commands(lines):
+    '''
+    Count commands of lines, labels, comments and lines only closing a
+    block don't count.
+    '''
+
+    count = 0
+    for line in lines:
+        line = line.strip()
+        if line == "" or line.startswith(":") or line[:4].lower() == "rem ":
+            continue
+
+        commands = _split_commands(line)
+        count += len([x for x in commands if x.strip("() ").lower() not in ("", "else")])
+    return count
+
+class Rule(object):
+    '''
+    A rewrite of the lines of one routine.
+
+    apply() returns the new lines, or the same list object if nothing
+    changed.
+    '''
+
+    def apply(self, lines):
+        raise NotImplementedError("You must implement apply()!")
+
+class IfElseJumpRule(Rule):
+    '''
+    if COND (               if COND command
+    command          ==>    :LABEL
+    ) else (
+    goto LABEL
+    )
+    :LABEL
+    '''
+
+    _IF_RE = re.compile(r'^if\s+(.*\S)\s*\($', re.IGNORECASE)
+
+    def apply(self, lines):
+        result = []
+        i = 0
+        is_changed = False
+        while i < len(lines):
+            match = self._IF_RE.match(lines[i])
+            if match and (i + 5 < len(lines)) and (
+                    lines[i + 2].replace(" ", "").lower() == ")else("
+                    and lines[i + 4].strip() == ")" and is_label(lines[i + 5])):
+                condition = match.group(1)
+                then_line = lines[i + 1]
+                else_line = lines[i + 3]
+                label = get_label(lines[i + 5])
+                line = None
+                if JumpToNextRule.get_target(else_line) == label and self._is_single(then_line):
+                    line = "if %s %s" % (condition, then_line)
+                elif JumpToNextRule.get_target(then_line) == label and self._is_single(else_line):
+                    line = "if NOT %s %s" % (condition, else_line)
+
+                if line is not None:
+                    result.append(line)
+                    i += 5
+                    is_changed = True
+                    continue
+
+            result.append(lines[i])
+            i += 1
+
+        if not is_changed:
+            return lines
+        return result
+
+    @classmethod
+    def _is_single(cls, line):
+        return (not is_label(line)) and len(_split_commands(line)) == 1 and (
+            count_parentheses(line) == 0)
+
+class JumpToNextRule(Rule):
+    '''
+    Drop a goto to a label that directly follows it.
+    '''
+
+    _GOTO_RE = re.compile(r'^goto\s+:?(\S+)$', re.IGNORECASE)
+
+    @classmethod
+    def get_target(cls, line):
+        match = cls._GOTO_RE.match(line.strip())
+        if match is None:
+            return None
+        return match.group(1).lower()
+
+    def apply(self, lines):
+        result = []
+        is_changed = False
+        for i, line in enumerate(lines):
+            target = self.get_target(line)
+            if target is not None:
+                j = i + 1
+                labels = set()
+                while j < len(lines) and (is_label(lines[j]) or lines[j].strip() == ""):
+                    if is_label(lines[j]):
+                        labels.add(get_label(lines[j]))
+                    j += 1
+
+                if target in labels:
+                    is_changed = True
+                    continue
+
+            result.append(line)
+
+        if not is_changed:
+            return lines
+        return result
+
+class InvertJumpRule(Rule):
+    '''
+    if COND goto A              if NOT COND goto B
+    goto B               ==>    :A
+    :A
+    '''
+
+    _IF_GOTO_RE = re.compile(r'^if\s+(NOT\s+)?(.*\S)\s+(goto\s+:?\S+)$', re.IGNORECASE)
+
+    def apply(self, lines):
+        result = []
+        i = 0
+        is_changed = False
+        while i < len(lines):
+            match = self._IF_GOTO_RE.match(lines[i])
+            if match and (i + 2 < len(lines)) and is_label(lines[i + 2]) and (
+                    len(_split_commands(lines[i])) == 1
+                    and count_parentheses(lines[i]) == 0):
+                target = JumpToNextRule.get_target(match.group(3))
+                other_target = JumpToNextRule.get_target(lines[i + 1])
+                if target == get_label(lines[i + 2]) and other_target is not None:
+                    result.append("if %s%s %s" % (
+                        "" if match.group(1) else "NOT ", match.group(2),
+                        lines[i + 1].strip()))
+                    i += 2
+                    is_changed = True
+                    continue
+
+            result.append(lines[i])
+            i += 1
+
+        if not is_changed:
+            return lines
+        return result
+
+class UnreachableRule(Rule):
+    '''
+    Drop lines between an unconditional goto or exit and the next label.
+    '''
+
+    _JUMP_RE = re.compile(r'^(?:goto\s|exit\s+/b\b|exit$)', re.IGNORECASE)
+
+    @classmethod
+    def _is_jump(cls, line):
+        if line[:3].lower() in ("if ", "for") or count_parentheses(line) != 0:
+            return False
+
+        commands = _split_commands(line)
+        return len(commands) > 0 and cls._JUMP_RE.match(commands[-1]) is not None
+
+    def apply(self, lines):
+        result = []
+        is_reachable = True
+        depth = 0
+        for line in lines:
+            if is_label(line):
+                is_reachable = True
+            elif not is_reachable and line.strip() != "":
+                continue
+
+            result.append(line)
+            if depth == 0 and self._is_jump(line):
+                is_reachable = False
+            depth += count_parentheses(line)
+
+        if len(result) == len(lines):
+            return lines
+        return result
+
+class UnusedLabelRule(Rule):
+    '''
+    Drop generated labels (PYTSL) no goto or call refers to.
+    '''
+
+    # :PYTSL1, or :PYTSLhelpers.1 in an imported module
+    _LABEL_RE = re.compile(r'^:PYTSL[#\w.]*\d$', re.IGNORECASE)
+    _TARGET_RE = re.compile(r'\b(?:call\s+:|goto\s+:?)([^\s&|()"]+)', re.IGNORECASE)
+
+    def apply(self, lines):
+        targets = set()
+        for line in lines:
+            if not is_label(line):
+                targets.update([x.lower() for x in self._TARGET_RE.findall(line)])
+
+        result = [x for x in lines if not (
+            self._LABEL_RE.match(x) and get_label(x) not in targets)]
+        if len(result) == len(lines):
+            return lines
+        return result
+
+class CopyBackRule(Rule):
+    '''
+    Drop "set B=%A%" right after "set A=%B%", B still holds the value.
+    '''
+
+    _COPY_RE = re.compile(r'^set "([^"=%!]+)=%([^"=%!]+)%"$', re.IGNORECASE)
+
+    @classmethod
+    def _parse_copy(cls, line):
+        # Return {destination: source} of a line only made of copies
+        copies = {}
+        for command in _split_commands(line):
+            match = cls._COPY_RE.match(command)
+            if match is None:
+                return None
+            copies[match.group(1).lower()] = match.group(2).lower()
+        return copies
+
+    def apply(self, lines):
+        result = []
+        is_changed = False
+        last_copies = None
+        for line in lines:
+            copies = self._parse_copy(line)
+            if (copies is not None) and (last_copies is not None) and all([
+                    last_copies.get(y) == x for x, y in copies.items()]):
+                # Keep last_copies, a third line copying back again is
+                # redundant too
+                is_changed = True
+                continue
+
+            last_copies = copies
+            result.append(line)
+
+        if not is_changed:
+            return lines
+        return result
+
+class DeadUnsetRule(Rule):
+    '''
+    Drop unsets of variables nothing else in the routine mentions.
+    '''
+
+    _UNSET_RE = re.compile(r'^set "([^"=]+)=" & set "\1-T="$', re.IGNORECASE)
+    _NAME_RE = re.compile(r'@PYTS[A-Z]+[#\w.]*', re.IGNORECASE)
+
+    def apply(self, lines):
+        counts = {}
+        for line in lines:
+            if self._UNSET_RE.match(line):
+                continue
+
+            for name in self._NAME_RE.findall(line):
+                name = name.lower()
+                if name.endswith("-t"):
+                    name = name[:-2]
+                counts[name] = counts.get(name, 0) + 1
+
+        result = []
+        for line in lines:
+            match = self._UNSET_RE.match(line)
+            # Only temporaries, other variants could be read by the caller
+            if match and match.group(1).upper().startswith("@PYTSA") and (
+                    match.group(1).lower() not in counts):
+                continue
+            result.append(line)
+
+        if len(result) == len(lines):
+            return lines
+        return result
+
+class JoinRule(Rule):
+    '''
+    Join simple lines with "&", cmd.exe parses each line separately.
+
+    A line expands %variants% once, before any command of it runs, so a line
+    is only joined to the previous one if it doesn't expand a variant the
+    previous one sets. Nothing is joined after a line that could change
+    variants in ways we can't see (call, shift, setlocal ...) or that takes
+    the rest of the line (if, for), or into or out of parenthesized blocks.
+    '''
+
+    MAX_LINE_LENGTH = 1024
+
+    _SET_RE = re.compile(r'^set\s+(?:/a\s+)?"([^"=]+)=', re.IGNORECASE)
+    _EXPANSION_RE = re.compile(r'%([^%\s]+)%')
+
+    @classmethod
+    def _get_assigned(cls, line):
+        # Variants set by a line, None if it isn't a line of plain sets
+        names = set()
+        for command in _split_commands(line):
+            match = cls._SET_RE.match(command)
+            if match is None:
+                return None
+            names.add(match.group(1).lower())
+        return names
+
+    @classmethod
+    def _is_joinable(cls, line):
+        stripped = line.strip()
+        return (stripped != "" and (not stripped.startswith(":"))
+            and stripped[:4].lower() != "rem " and "(" not in stripped
+            and ")" not in stripped and "|" not in stripped)
+
+    def apply(self, lines):
+        result = []
+        assigned = None
+        is_changed = False
+        depth = 0
+        for line in lines:
+            level = count_parentheses(line)
+            is_joinable = (depth == 0) and (level == 0) and self._is_joinable(line)
+            depth += level
+
+            if is_joinable and (assigned is not None) and (
+                    len(result[-1]) + len(line) + 3 <= self.MAX_LINE_LENGTH):
+                expanded = set([x.lower() for x in self._EXPANSION_RE.findall(line)])
+                if len(expanded & assigned) <= 0:
+                    result[-1] = "%s & %s" % (result[-1], line.strip())
+                    is_changed = True
+                    line_assigned = self._get_assigned(line)
+                    if line_assigned is None:
+                        assigned = None
+                    else:
+                        assigned |= line_assigned
+                    continue
+
+            result.append(line)
+            assigned = None
+            if is_joinable:
+                assigned = self._get_assigned(line)
+
+        if not is_changed:
+            return lines
+        return result
+
+class Peephole(object):
+    '''
+    Apply rewrite rules to the lines of a routine until none of them changes
+    anything.
+    '''
+
+    DEFAULT_RULES = [
+        IfElseJumpRule,
+        JumpToNextRule,
+        InvertJumpRule,
+        UnreachableRule,
+        UnusedLabelRule,
+        CopyBackRule,
+        DeadUnsetRule,
+        JoinRule,
+    ]
+
+    MAX_PASSES = 8
+
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = [x() for x in self.DEFAULT_RULES]
+        self._rules = rules
+
+    @property
+    def rules(self):
+        return self._rules
+
+    def optimize(self, lines):
+        '''
+        Return the optimized lines, and the count of removed lines and
+        commands.
+        '''
+
+        if not isinstance(lines, list):
+            lines = list(lines)
+        line_count = len(lines)
+        command_count = count_commands(lines)
+        for i in range(self.MAX_PASSES):
+            is_changed = False
+            for rule in self._rules:
+                new_lines = rule.apply(lines)
+                if new_lines is not lines:
+                    lines = new_lines
+                    is_changed = True
+
+            if not is_changed:
+                break
+
+        return lines, line_count - len(lines), command_count - count_commands(lines)
@@ -0,0 +1,143 @@
+import re
+from .cmdsyntax import get_label, is_label
+
+class TempAllocator(object):
+    '''
+    Reuse a small pool of temporary variant names inside one routine.
+
+    The translator mints a new @PYTSA<n> for every sub expression and unsets
+    it when the statement is done. cmd.exe looks up environment variants
+    linearly, so instead we rename temporaries whose lifetimes don't overlap
+    to the same name and drop the unset lines, a temporary is just
+    overwritten by the next one using its name.
+
+    A lifetime runs from the first to the last line mentioning the
+    temporary. If it's alive when a loop (a label and a later goto back to
+    it, or a "for" line calling a body block placed after it) starts, it's
+    kept alive to the end of the loop.
+    '''
+
+    _TEMP_RE = re.compile(r'@PYTSA(\d+)', re.IGNORECASE)
+    _UNSET_RE = re.compile(r'^set "@PYTSA(\d+)=" & set "@PYTSA\1-T="$', re.IGNORECASE)
+    _GOTO_RE = re.compile(r'\bgoto\s+:?([^\s&|()"]+)', re.IGNORECASE)
+    _CALL_RE = re.compile(r'\bcall\s+:([^\s&|()"]+)', re.IGNORECASE)
+
+    def __init__(self, excluded_ids=(), prefix=""):
+        # Temporaries that keep their name, their unset lines are dropped
+        # too.
+        self._excluded_ids = set([str(x) for x in excluded_ids])
+        # Prepended to the register names, routines running in the scope of
+        # their caller must not overwrite its temporaries
+        self._prefix = prefix
+
+    @classmethod
+    def _find_loops(cls, lines):
+        labels = {}
+        for i, line in enumerate(lines):
+            if is_label(line):
+                labels.setdefault(get_label(line), i)
+
+        loops = []
+        for i, line in enumerate(lines):
+            if line.startswith(":"):
+                continue
+
+            for target in cls._GOTO_RE.findall(line):
+                start = labels.get(target.lower())
+                if start is not None and start < i:
+                    loops.append((start, i))
+
+            if not line.lower().startswith("for "):
+                continue
+
+            # The body block is called by every pass and ends where the
+            # goto following the "for" line jumps to
+            if any([labels.get(x.lower(), -1) > i for x in cls._CALL_RE.findall(line)]):
+                end = len(lines) - 1
+                if i + 1 < len(lines):
+                    for target in cls._GOTO_RE.findall(lines[i + 1]):
+                        end = labels.get(target.lower(), end)
+                loops.append((i, end))
+        return loops
+
+    def _find_lifetimes(self, lines):
+        lifetimes = {}
+        dropped = set()
+        for i, line in enumerate(lines):
+            match = self._UNSET_RE.match(line)
+            if match:
+                dropped.add(i)
+                continue
+
+            for temp_id in self._TEMP_RE.findall(line):
+                if temp_id in self._excluded_ids:
+                    continue
+
+                if temp_id in lifetimes:
+                    lifetimes[temp_id][1] = i
+                else:
+                    lifetimes[temp_id] = [i, i]
+
+        loops = self._find_loops(lines)
+        is_changed = True
+        while is_changed:
+            is_changed = False
+            for start, end in loops:
+                for lifetime in lifetimes.values():
+                    if lifetime[0] < start <= lifetime[1] < end:
+                        lifetime[1] = end
+                        is_changed = True
+
+        return lifetimes, dropped
+
+    def allocate(self, lines):
+        '''
+        Return the renamed lines and the peak count of live temporaries.
+        A list of lines is renamed in place.
+        '''
+
+        if not isinstance(lines, list):
+            lines = list(lines)
+        lifetimes, dropped = self._find_lifetimes(lines)
+
+        # Register names must not clash with the temporaries we keep
+        registers = []
+        next_register = 1
+        free_registers = []
+        active = []
+        names = {}
+        for temp_id, (start, end) in sorted(
+                lifetimes.items(), key=lambda x: (x[1][0], int(x[0]))):
+            for item in list(active):
+                if item[0] < start:
+                    active.remove(item)
+                    free_registers.append(item[1])
+
+            if len(free_registers) > 0:
+                free_registers.sort()
+                register = free_registers.pop(0)
+            else:
+                while str(next_register) in self._excluded_ids:
+                    next_register += 1
+                register = str(next_register)
+                next_register += 1
+                registers.append(register)
+
+            names[temp_id] = self._prefix + register
+            active.append((end, register))
+
+        def rename(match):
+            temp_id = match.group(1)
+            if temp_id not in names:
+                return match.group(0)
+            return match.group(0)[:-len(temp_id)] + names[temp_id]
+
+        count = 0
+        for i, line in enumerate(lines):
+            if i in dropped:
+                continue
+            lines[count] = self._TEMP_RE.sub(rename, line)
+            count += 1
+        del lines[count:]
+
+        return lines, len(registers)
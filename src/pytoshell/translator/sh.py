@@ -1,15 +1,1308 @@
 import ast
+import logging
 import os.path
-from . import base
+import re
+import six
 from .. import _get_data_path
+from . import base
+from . import batch
+from .batch import OPERATORS, COMPARE_OPERATORS, UNARY_OPERATORS
+from .folding import ConstantFolder
+from .inliner import Inliner
+from .linker import ShLibrary
+from .typeinfer import TypeInference
+from .tree import NodeIndex
+
+class Variant(object):
+    '''
+    A shell variable holding a value, with its type tag in a variable named
+    "PYTST" followed by the rest of its name (PYTSVx -> PYTSTVx).
+    '''
+
+    TAG_NORMAL = "PYTSV"
+    TAG_RAW = "PYTSA"
+    TAG_RET = "PYTSR"
+    TAG_TYPE = "PYTST"
+    TAG_FUNCTION = "PYTSF"
+
+    def __init__(self, name, tag=TAG_NORMAL, is_typed=True):
+        self._name = str(name)
+        self._tag = tag
+        # Variants of a statically known type don't keep a type tag
+        self._is_typed = is_typed
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def tag(self):
+        return self._tag
+
+    @property
+    def is_typed(self):
+        return self._is_typed
+
+    @property
+    def id_(self):
+        return self._tag + escape_name(self._name)
+
+    @property
+    def type_id(self):
+        return self.TAG_TYPE + self.id_[4:]
+
+    def get_ref(self, operation=""):
+        # Unquoted parameter expansion, operation is like "#PYTS"
+        return "${%s%s}" % (self.id_, operation)
+
+    @property
+    def value(self):
+        return '"%s"' % self.get_ref()
+
+    @property
+    def type_value(self):
+        return '"${%s}"' % self.type_id
+
+    @property
+    def expression(self):
+        # The variant in an arithmetic expansion
+        return self.id_
+
+class ParameterVariant(Variant):
+    '''
+    A parameter of a function read where it was passed: arguments are pairs
+    of value and type tag, so parameter index is "$((index * 2 - 1))".
+    '''
+
+    def __init__(self, index):
+        super().__init__(index)
+        self._index = index
+
+    @property
+    def id_(self):
+        return str(self._index * 2 - 1)
+
+    @property
+    def type_id(self):
+        return str(self._index * 2)
+
+    @property
+    def expression(self):
+        return self.get_ref()
+
+class RetVariant(Variant):
+    def __init__(self):
+        super().__init__("", Variant.TAG_RET)
+
+def escape_name(name):
+    # Shell names are ASCII letters, digits and "_"
+    if all([ord(c) < 128 for c in name]):
+        return name
+    return "".join([c if ord(c) < 128 else "_%x_" % ord(c) for c in name])
+
+class CommandGenerator(object):
+    # Words sh doesn't need to be quoted
+    _SAFE_RE = re.compile(r'^[\w@%+=:,./-]+$')
+
+    def __init__(self):
+        self._variant_id = 0
+
+    def _new_variant_id(self):
+        self._variant_id += 1
+        return self._variant_id
+
+    def _new_raw_variant(self):
+        return Variant(self._new_variant_id(), Variant.TAG_RAW)
+
+    @classmethod
+    def quote(cls, text):
+        if cls._SAFE_RE.match(text):
+            return text
+        return "'%s'" % text.replace("'", "'\\''")
+
+    @classmethod
+    def set_variant(cls, variant, value, type_="str"):
+        '''
+        Assign the value (a shell word, or a Variant) to variant, type_ is
+        the word of its type tag.
+        '''
+
+        if isinstance(value, Variant):
+            if value.id_ == variant.id_:
+                return []
+            type_ = value.type_value
+            value = value.value
+
+        command = "%s=%s" % (variant.id_, value)
+        if variant.is_typed:
+            command += " %s=%s" % (variant.type_id, type_)
+        return command
+
+    @classmethod
+    def invoke(cls, function, *args):
+        return " ".join((function,) + args)
+
+    @classmethod
+    def get_function(cls, name):
+        return Variant.TAG_FUNCTION + escape_name(name)
+
+    @classmethod
+    def get_method(cls, type_, method):
+        '''
+        The function of method of type_ (a word), dispatched when the type is
+        a parameter expansion.
+        '''
+
+        if type_.startswith('"'):
+            return '"%s%s_%s"' % (Variant.TAG_FUNCTION, type_[1:-1], method)
+        return "%s%s_%s" % (Variant.TAG_FUNCTION, type_, method)
+
+    @classmethod
+    def if_(cls, condition, if_block, else_block=None):
+        lines = ["if %s; then" % condition]
+        lines += if_block
+        if else_block is not None:
+            lines.append("else")
+            lines += else_block
+        lines.append("fi")
+        return lines
+
+    @classmethod
+    def print_(cls, text):
+        return "printf '%%s\\n' %s" % text
+
+    @classmethod
+    def if_tuple(cls, variant, command):
+        # Variants which could hold a tuple keep their type tag
+        return 'if [ %s = tuple ]; then %s; fi' % (variant.type_value, command)
+
+    @classmethod
+    def copy_tuple(cls, variant):
+        # variant is set to a copy of the tuple it holds
+        command = cls.invoke(cls.get_method("tuple", "__copy__"), variant.value)
+        if variant.tag != Variant.TAG_RET:
+            command += "; %s=$%s" % (variant.id_, Variant.TAG_RET)
+        return cls.if_tuple(variant, command)
+
+    @classmethod
+    def free_tuple(cls, variant):
+        return cls.if_tuple(variant, cls.invoke(
+            cls.get_method("tuple", "__del__"), variant.value))
+
+class Source(batch.Source):
+    def create_temp_varaint(self):
+        # Temporaries are just overwritten, the ones of a function are its
+        # locals
+        return self._cg._new_raw_variant()
+
+# Compare operator node class -> ("test" integer operator, "test" string
+# operator), from the "if" operators of the runtime's compare
+_TEST_OPERATORS = {
+    "EQU": ("-eq", "="),
+    "NEQ": ("-ne", "!="),
+    "LSS": ("-lt", None),
+    "LEQ": ("-le", None),
+    "GTR": ("-gt", None),
+    "GEQ": ("-ge", None),
+}
+
+# "if" operator -> arithmetic expansion operator
+_ARITHMETIC_OPERATORS = {
+    "EQU": "==",
+    "NEQ": "!=",
+    "LSS": "<",
+    "LEQ": "<=",
+    "GTR": ">",
+    "GEQ": ">=",
+}
 
 class Translator(base.Translator):
+    '''
+    Translate to a POSIX sh script (plus "local", which dash, bash, busybox
+    ash and mksh all have).
+
+    Nothing the generated script does on its own forks: arithmetic is done by
+    "$(( ))", strings by parameter expansion, python functions are shell
+    functions returning in PYTSR/PYTSTR, and control flow uses the shell's
+    if, while and for.
+    '''
+
     file_extensions = ['sh']
     _module_dir = os.path.splitext(os.path.basename(__file__))[0]
 
-    def generic_visit(self, node):
-        ast.NodeVisitor.generic_visit(self, node)
+    # Width of the integers of "$(( ))" in dash and bash
+    INT_BITS = 64
+
+    INDENT = "    "
+
+    SHEBANG = "#!/bin/sh"
+
+    # Data directories of the site.sh runtime libraries, functions of a later
+    # one replace the ones of the same name
+    _library_modules = ["sh"]
+
+    # Runtime library parsed from them, shared by all translators of this
+    # class in this process
+    _library = None
+
+    # (translator class, node class) -> _parse_xxx method
+    _handlers = {}
+
+    # Types "test" compares as numbers, true when not 0
+    _NUMERIC_TYPES = ("int", "bool")
+
+    # Builtins calling a method of the type of their argument
+    _BUILTIN_METHODS = {
+        "len": "__len__",
+        "str": "__str__",
+        "int": "__int__",
+        "bool": "__bool__",
+    }
+
+    # Assignments and "for" loops setting a variant, in a function body
+    _ASSIGNED_RE = re.compile(r'(?:^|[\s;&|({"])(PYTS(?:V|A|TV|TA)\w*)=')
+    _FOR_RE = re.compile(r'\bfor\s+(PYTS(?:V|A)\w*)\s+in\b')
+
+    def __init__(self):
+        super().__init__()
+        self._ret_variant = RetVariant()
+        self._inline_threshold = Inliner.DEFAULT_THRESHOLD
+        self._reset()
+
+    @property
+    def inline_threshold(self):
+        return self._inline_threshold
+
+    @inline_threshold.setter
+    def inline_threshold(self, value):
+        self._inline_threshold = value
+
+    def _reset(self):
+        self._cg = CommandGenerator()
+        self._types = TypeInference()
+        # Parents of the nodes of the tree being translated
+        self._nodes = None
+        # Parameters of the function being parsed that it never assigns,
+        # they are read from the positional parameters
+        self._parameters = {}
+        # Whether the program makes tuples and the names that could hold
+        # one, a variant owns the tuple it holds
+        self._has_tuples = False
+        self._tuple_names = set()
+        # Locals of the function being parsed that could hold a tuple, it's
+        # freed when the function returns
+        self._tuple_locals = []
+        # Temporaries holding tuples made for the statement being parsed,
+        # they are freed after it
+        self._dropped_variants = []
+
+    def _get_library(self):
+        cls = type(self)
+        if cls.__dict__.get("_library") is None:
+            library = None
+            for module_dir in self._library_modules:
+                site_module_file = open(os.path.join(
+                    _get_data_path(module_dir), "site.sh"), "r")
+                with site_module_file:
+                    module_library = ShLibrary(
+                        [line.rstrip("\n") for line in site_module_file])
+                if library is None:
+                    library = module_library
+                else:
+                    library.update(module_library)
+            cls._library = library
+
+        return cls._library
+
+    @classmethod
+    def _get_handler(cls, node_type):
+        key = (cls, node_type)
+        handler = cls._handlers.get(key)
+        if handler is None:
+            handler = getattr(cls, "_parse_%s" % node_type.__name__, None)
+            if handler is None:
+                raise NotImplementedError(node_type.__name__)
+            cls._handlers[key] = handler
+        return handler
+
+    def _parse_node(self, node, variant=None):
+        source = Source(self._cg)
+
+        if variant is None:
+            variant = self._ret_variant
+
+        self._get_handler(type(node))(self, node, source, variant)
+        return source
+
+    def _add_block(self, source, block_source):
+        # Lines of a nested block, indented. sh doesn't allow empty blocks.
+        source.definitions += block_source.definitions
+        is_empty = True
+        for line in block_source:
+            source.add_initialize(self.INDENT + line if line else line)
+            is_empty = False
+        if is_empty:
+            source.add_initialize(self.INDENT + ":")
+
+    def _add_lines(self, source, lines, indent=""):
+        for line in lines:
+            source.add_initialize(indent + line)
+
+    def _get_constant(self, value):
+        # (word, type) of a constant
+        if isinstance(value, bool):
+            return (str(int(value)), "bool")
+        elif isinstance(value, int):
+            return (str(value), "int")
+        elif isinstance(value, six.string_types):
+            return (self._cg.quote(value), "str")
+        elif isinstance(value, range):
+            return ('"%s %s %s"' % (value.start, value.stop, value.step), "range")
+        elif value is None:
+            return ("''", "NoneType")
+        raise NotImplementedError("%s constant" % type(value).__name__)
+
+    def _parse_Constant(self, node, source, variant):
+        word, type_ = self._get_constant(node.value)
+        source.add_initialize(self._cg.set_variant(variant, word, type_))
+
+    def _get_name_variant(self, name):
+        # The variant a name is read from
+        variant = self._parameters.get(name)
+        if variant is None:
+            variant = Variant(name)
+        return variant
+
+    def _get_target_variant(self, node):
+        return Variant(node.id, is_typed=(
+            self._types.is_typed(node) or node.id in self._tuple_names))
+
+    def _get_value_variant(self, node, source, is_kept=False):
+        # A variant holding the value of node, only evaluated if it isn't a
+        # name already. A tuple node makes is freed after the statement
+        # unless it's kept.
+        if isinstance(node, ast.Name):
+            return self._get_name_variant(node.id)
+
+        temp_variant = source.create_temp_varaint()
+        source.append(self._parse_node(node, temp_variant))
+        if not is_kept and self._is_new_tuple(node):
+            self._dropped_variants.append(temp_variant)
+        return temp_variant
+
+    def _may_be_tuple(self, node):
+        return self._has_tuples and self._types.get_type(node) in (None, "tuple")
+
+    def _is_new_tuple(self, node):
+        # Whether node makes a tuple of its own, functions return a copy of
+        # the tuples they don't make
+        return isinstance(node, ast.Tuple) or (
+            isinstance(node, ast.Call) and self._may_be_tuple(node))
+
+    def _get_owned_variant(self, node, variant, source):
+        '''
+        Return a variant holding the value of node in variant that owns the
+        tuple it could be: a copy of it, unless node made it.
+        '''
+
+        if node is not None and not (self._may_be_tuple(node) and not self._is_new_tuple(node)):
+            return variant
+
+        if variant.tag not in (Variant.TAG_RAW, Variant.TAG_RET):
+            temp_variant = source.create_temp_varaint()
+            type_ = None if node is None else self._types.get_type(node)
+            source.add_initialize(self._cg.set_variant(
+                temp_variant, variant.value, type_ or variant.type_value))
+            variant = temp_variant
+        source.add_initialize(self._cg.copy_tuple(variant))
+        return variant
+
+    def _get_owned_operand(self, node, source):
+        # Words of the value and the type tag of node, owning the tuple it
+        # could be
+        if not self._may_be_tuple(node):
+            return self._get_operand(node, source)
+
+        variant = self._get_owned_variant(
+            node, self._get_value_variant(node, source, True), source)
+        return (variant.value, self._types.get_type(node) or variant.type_value)
+
+    def _add_store(self, source, variant, value_variant):
+        # The tuple variant held is freed once the value is evaluated, the
+        # value could read it
+        source.add_initialize(self._cg.free_tuple(variant))
+        source.add_initialize(self._cg.set_variant(variant, value_variant))
+
+    def _add_dropped_frees(self, source):
+        for dropped_variant in self._dropped_variants:
+            source.add_initialize(self._cg.free_tuple(dropped_variant))
+        self._dropped_variants = []
+
+    def _find_tuple_names(self, node):
+        '''
+        Return names some assignment of the program could set to a tuple.
+        '''
+
+        names = set()
+        if not self._has_tuples:
+            return names
+
+        for sub_node in ast.walk(node):
+            if isinstance(sub_node, ast.Assign):
+                atarget = sub_node.targets[0]
+                if isinstance(atarget, ast.Name) and self._may_be_tuple(sub_node.value):
+                    names.add(atarget.id)
+                elif isinstance(atarget, ast.Tuple):
+                    values = [None] * len(atarget.elts)
+                    if isinstance(sub_node.value, ast.Tuple):
+                        values = sub_node.value.elts
+                    names |= set([x.id for x, value in zip(atarget.elts, values)
+                        if isinstance(x, ast.Name) and (value is None or self._may_be_tuple(value))])
+            elif isinstance(sub_node, ast.For) and isinstance(sub_node.target, ast.Name):
+                if (self._get_range_bounds(sub_node) is None
+                        and self._types.get_type(sub_node.iter) not in ("range", "str")):
+                    names.add(sub_node.target.id)
+            elif isinstance(sub_node, ast.FunctionDef):
+                # Parameters the body sets are copied to a local
+                names |= self._get_assigned_parameters(sub_node) & set(
+                    [x.arg for x in sub_node.args.args])
+        return names
+
+    def _get_operand(self, node, source):
+        '''
+        Return the words of the value and the type tag of node, read where
+        they are used. Constants and names aren't copied.
+        '''
+
+        if isinstance(node, ast.Constant):
+            return self._get_constant(node.value)
+
+        variant = self._get_value_variant(node, source)
+        type_ = self._types.get_type(node)
+        if type_ is None:
+            return (variant.value, variant.type_value)
+        return (variant.value, type_)
+
+    def _parse_Name(self, node, source, variant):
+        name_variant = self._get_name_variant(node.id)
+        type_ = self._types.get_type(node)
+        if type_ is None:
+            type_ = name_variant.type_value
+        source.add_initialize(self._cg.set_variant(variant, name_variant.value, type_))
+
+    def _parse_Tuple(self, node, source, variant):
+        # The value is the list of the variants holding the elements, made
+        # by the runtime with names no other tuple has
+        elements = []
+        for element in node.elts:
+            elements += self._get_operand(element, source)
+
+        source.add_initialize(self._cg.invoke(
+            self._cg.get_method("tuple", "__new__"), *elements))
+        source.add_initialize(self._cg.set_variant(variant, self._ret_variant))
+
+    def _is_builtin_call(self, node, name):
+        return (isinstance(node.func, ast.Name) and node.func.id == name
+            and not self._types.is_bound(name) and len(node.keywords) <= 0)
+
+    def _parse_print(self, node, source):
+        '''
+        Print str and int values by printf directly, return False for other
+        values (str() of them is up to the runtime).
+        '''
+
+        if not self._is_builtin_call(node, "print"):
+            return False
+
+        words = []
+        for argument in node.args:
+            if self._types.get_type(argument) not in ("str", "int"):
+                return False
+
+        for argument in node.args:
+            word = self._get_operand(argument, source)[0]
+            if word.startswith('"') and word.endswith('"'):
+                word = word[1:-1]
+            elif word.startswith("'"):
+                # Single quoted words are closed and reopened inside the
+                # double quotes
+                word = '"%s"' % word
+            words.append(word)
+
+        source.add_initialize(self._cg.print_('"%s"' % " ".join(words)))
+        return True
+
+    def _get_length(self, node, type_, source):
+        # The word of len() of node read directly, None if it takes a call
+        if type_ == "str":
+            return '"${#%s}"' % self._get_value_variant(node, source).id_
+        return None
+
+    def _parse_Call(self, node, source, variant):
+        arguments = []
+
+        if isinstance(node.func, ast.Attribute):
+            value, type_ = self._get_operand(node.func.value, source)
+            function = self._cg.get_method(type_, node.func.attr)
+            arguments += [value, type_]
+        else:
+            name = node.func.id
+            function = self._cg.get_function(name)
+            if (name in self._BUILTIN_METHODS and self._is_builtin_call(node, name)
+                    and len(node.args) == 1):
+                type_ = self._types.get_type(node.args[0])
+                if name == "len":
+                    length = self._get_length(node.args[0], type_, source)
+                    if length is not None:
+                        source.add_initialize(self._cg.set_variant(variant, length, "int"))
+                        return
+                if type_ is not None:
+                    function = self._cg.get_method(type_, self._BUILTIN_METHODS[name])
+
+        for argument in node.args:
+            arguments += self._get_operand(argument, source)
+
+        source.add_initialize(self._cg.invoke(function, *arguments))
+        source.add_initialize(self._cg.set_variant(variant, self._ret_variant))
+
+    def _get_assigned_parameters(self, node):
+        names = set()
+        for sub_node in ast.walk(node):
+            if isinstance(sub_node, ast.Name) and not isinstance(sub_node.ctx, ast.Load):
+                names.add(sub_node.id)
+        return names
+
+    def _get_locals(self, lines):
+        names = []
+        for line in lines:
+            for name in self._ASSIGNED_RE.findall(line) + self._FOR_RE.findall(line):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    @classmethod
+    def _get_function_names(cls, node):
+        # Names the function assigns, not looking into functions it defines
+        names = set()
+        nodes = list(ast.iter_child_nodes(node))
+        while len(nodes) > 0:
+            sub_node = nodes.pop()
+            if isinstance(sub_node, (ast.FunctionDef, ast.ClassDef)):
+                continue
+            if isinstance(sub_node, ast.Name) and not isinstance(sub_node.ctx, ast.Load):
+                names.add(sub_node.id)
+            nodes += list(ast.iter_child_nodes(sub_node))
+        return names
+
+    def _add_local_frees(self, source, kept_name=None):
+        # Tuples of the locals, but the one being returned
+        for local_variant in self._tuple_locals:
+            if local_variant.name != kept_name:
+                source.add_initialize(self._cg.free_tuple(local_variant))
+
+    def _parse_FunctionDef(self, node, source, variant):
+        function_name = node.name
+        parent = self._nodes.get_parent(node)
+        if isinstance(parent, ast.ClassDef):
+            function_name = "%s_%s" % (parent.name, function_name)
+
+        # Parameters the body never assigns are read where they were passed
+        assigned_names = self._get_assigned_parameters(node)
+        parameters = self._parameters
+        tuple_locals = self._tuple_locals
+        self._parameters = {}
+        self._tuple_locals = [Variant(x) for x in sorted(
+            self._get_function_names(node) & self._tuple_names)]
+        copies = Source(self._cg)
+        for i, an_arg in enumerate(node.args.args):
+            parameter_variant = ParameterVariant(i + 1)
+            if an_arg.arg in assigned_names:
+                copies.add_initialize(self._cg.set_variant(Variant(an_arg.arg), parameter_variant))
+                if an_arg.arg in self._tuple_names:
+                    copies.add_initialize(self._cg.copy_tuple(Variant(an_arg.arg)))
+            else:
+                self._parameters[an_arg.arg] = parameter_variant
+
+        body_source = self._parse_node(node.body)
+        # A function without return returns None
+        if not (len(node.body) > 0 and isinstance(node.body[-1], ast.Return)):
+            body_source.add_initialize(self._cg.set_variant(self._ret_variant, "", "NoneType"))
+            self._add_local_frees(body_source)
+        # Locals holding tuples start empty, dash's "local" keeps the value
+        # of the caller's variable
+        local_ids = set([x.id_ for x in self._tuple_locals]
+            + [x.type_id for x in self._tuple_locals])
+        self._parameters = parameters
+        self._tuple_locals = tuple_locals
+
+        body_lines = list(copies) + list(body_source)
+        sub_source = Source(self._cg)
+        sub_source.add_initialize("")
+        sub_source.add_initialize("%s() {" % self._cg.get_function(function_name))
+        names = [x + "=" if x in local_ids else x for x in self._get_locals(body_lines)]
+        if len(names) > 0:
+            sub_source.add_initialize(self.INDENT + "local %s" % " ".join(names))
+        self._add_lines(sub_source, body_lines, self.INDENT)
+        sub_source.add_initialize("}")
+
+        source.add_definition(sub_source)
+        source.definitions += body_source.definitions
+
+    def _is_int(self, node):
+        return self._types.get_type(node) == "int"
+
+    def _get_int_expression(self, node, source):
+        # Integer expressions are calculated by "$(( ))" in one go, other
+        # operands are evaluated to a temporary first.
+        if isinstance(node, ast.Constant) and isinstance(node.value, int):
+            if node.value < 0:
+                return "(%s)" % int(node.value)
+            return str(int(node.value))
+        elif isinstance(node, ast.Name):
+            return self._get_name_variant(node.id).expression
+        elif (isinstance(node, ast.BinOp)
+                and self._is_int(node.left) and self._is_int(node.right)):
+            return "(%s)" % self._get_int_operation(node, source)
+
+        temp_variant = source.create_temp_varaint()
+        source.append(self._parse_node(node, temp_variant))
+        return temp_variant.expression
+
+    def _get_int_operation(self, node, source):
+        return "%s %s %s" % (
+            self._get_int_expression(node.left, source),
+            OPERATORS[type(node.op)][0],
+            self._get_int_expression(node.right, source))
+
+    def _get_int_word(self, node, source):
+        # An int expression as a word
+        if isinstance(node, ast.Constant):
+            return self._get_constant(node.value)[0]
+        elif isinstance(node, ast.Name):
+            return self._get_name_variant(node.id).get_ref()
+        return "$((%s))" % self._get_int_expression(node, source)
+
+    def _parse_BinOp(self, node, source, variant):
+        if type(node.op) not in OPERATORS:
+            raise NotImplementedError(type(node.op).__name__)
+
+        if self._is_int(node.left) and self._is_int(node.right):
+            source.add_initialize(self._cg.set_variant(
+                variant, '"$((%s))"' % self._get_int_operation(node, source), "int"))
+            return
+
+        left_value, left_type = self._get_operand(node.left, source)
+        right_value, right_type = self._get_operand(node.right, source)
+        if isinstance(node.op, ast.Add) and left_type == "str" and right_type == "str":
+            source.add_initialize(self._cg.set_variant(
+                variant, left_value + right_value, "str"))
+            return
+
+        source.add_initialize(self._cg.invoke(
+            self._cg.get_method(left_type, OPERATORS[type(node.op)][1]),
+            left_value, left_type, right_value, right_type))
+        source.add_initialize(self._cg.set_variant(variant, self._ret_variant))
+
+    def _parse_UnaryOp(self, node, source, variant):
+        if isinstance(node.op, ast.Not):
+            self._parse_condition(node, source, variant)
+        else:
+            # Only int and bool have these operators
+            source.add_initialize(self._cg.set_variant(variant, '"$((%s%s))"' % (
+                UNARY_OPERATORS[type(node.op)],
+                self._get_int_expression(node.operand, source)), "int"))
+
+    def _parse_Compare(self, node, source, variant):
+        self._parse_condition(node, source, variant)
+
+    def _get_truth(self, node, source):
+        type_ = self._types.get_type(node)
+        value, type_word = self._get_operand(node, source)
+        if type_ in self._NUMERIC_TYPES:
+            return [self._format_int_test(value, "NEQ", "0")]
+        elif type_ == "str":
+            return ["[ -n %s ]" % value]
+
+        source.add_initialize(self._cg.invoke(
+            self._cg.get_function("bool"), value, type_word))
+        return [self._format_int_test(self._ret_variant.value, "NEQ", "0")]
+
+    @classmethod
+    def _format_int_test(cls, left, operator, right):
+        # A command comparing int words by an "if" operator (EQU, LSS ...)
+        return "[ %s %s %s ]" % (left, _TEST_OPERATORS[operator][0], right)
+
+    @classmethod
+    def _format_str_test(cls, left, operator, right):
+        # Only EQU and NEQ
+        return "[ %s %s %s ]" % (left, _TEST_OPERATORS[operator][1], right)
+
+    @classmethod
+    def _is_simple_condition(cls, lines):
+        return len(lines) == 1 and not re.search(r'&&|\|\||^!', lines[0])
+
+    def _group_condition(self, lines):
+        if self._is_simple_condition(lines):
+            return lines
+        if len(lines) == 1:
+            return ["{ %s; }" % lines[0]]
+        return ["{"] + [self.INDENT + x for x in lines] + ["}"]
+
+    def _join_conditions(self, conditions, operator):
+        if len(conditions) == 1:
+            return conditions[0]
+
+        result = self._group_condition(conditions[0])
+        for condition in conditions[1:]:
+            condition = self._group_condition(condition)
+            result = result[:-1] + ["%s %s %s" % (result[-1], operator, condition[0])]
+            result += condition[1:]
+        return result
+
+    def _get_condition(self, node, source):
+        '''
+        Return the lines of a command list exiting with 0 if node is true.
+
+        What has to be evaluated first is added to source, unless it's
+        evaluated conditionally (operands of "and" and "or" but the first,
+        comparisons of a chain but the first), it's part of the list then.
+        '''
+
+        if isinstance(node, ast.BoolOp):
+            conditions = [self._get_condition(node.values[0], source)]
+            for value in node.values[1:]:
+                value_source = Source(self._cg)
+                lines = self._get_condition(value, value_source)
+                conditions.append(list(value_source) + lines)
+            return self._join_conditions(
+                conditions, "&&" if isinstance(node.op, ast.And) else "||")
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            lines = self._group_condition(self._get_condition(node.operand, source))
+            return ["! " + lines[0]] + lines[1:]
+        elif isinstance(node, ast.Compare):
+            return self._get_compare_condition(node, source)
+        elif isinstance(node, ast.Constant):
+            return ["true" if node.value else "false"]
+
+        return self._get_truth(node, source)
+
+    def _get_compare_kind(self, op, left, right):
+        # "int" or "str" if "test" compares the operands like python does,
+        # None if it's left to the runtime
+        left_type = self._types.get_type(left)
+        right_type = self._types.get_type(right)
+        if left_type in self._NUMERIC_TYPES and right_type in self._NUMERIC_TYPES:
+            return "int"
+
+        if left_type == "str" and right_type == "str" and isinstance(op, (ast.Eq, ast.NotEq)):
+            return "str"
+
+        return None
+
+    def _get_compare_condition(self, node, source):
+        conditions = []
+        left = (node.left,) + self._get_operand(node.left, source)
+        for i, (op, comparator) in enumerate(zip(node.ops, node.comparators)):
+            if type(op) not in COMPARE_OPERATORS:
+                raise NotImplementedError(type(op).__name__)
+
+            # Operands after the first comparison are only evaluated if it's
+            # true
+            target = source
+            if i > 0:
+                target = Source(self._cg)
+            right = (comparator,) + self._get_operand(comparator, target)
+
+            operator = COMPARE_OPERATORS[type(op)][0]
+            kind = self._get_compare_kind(op, left[0], right[0])
+            if kind == "int":
+                lines = [self._format_int_test(left[1], operator, right[1])]
+            elif kind == "str":
+                lines = [self._format_str_test(left[1], operator, right[1])]
+            else:
+                target.add_initialize(self._cg.invoke(
+                    self._cg.get_function("compare"),
+                    left[1], left[2], operator, right[1], right[2]))
+                lines = [self._format_int_test(self._ret_variant.value, "NEQ", "0")]
+
+            if i > 0:
+                lines = list(target) + lines
+            conditions.append(lines)
+            left = right
+
+        return self._join_conditions(conditions, "&&")
+
+    def _parse_condition(self, node, source, variant):
+        if (isinstance(node, ast.Compare) and len(node.ops) == 1
+                and type(node.ops[0]) in COMPARE_OPERATORS
+                and self._get_compare_kind(node.ops[0], node.left, node.comparators[0]) == "int"
+                and all([isinstance(x, (ast.Name, ast.Constant))
+                    for x in [node.left] + node.comparators])):
+            source.add_initialize(self._cg.set_variant(variant, '"$((%s %s %s))"' % (
+                self._get_int_expression(node.left, source),
+                _ARITHMETIC_OPERATORS[COMPARE_OPERATORS[type(node.ops[0])][0]],
+                self._get_int_expression(node.comparators[0], source)), "bool"))
+            return
+
+        lines = self._get_condition(node, source)
+        true_command = self._cg.set_variant(variant, "1", "bool")
+        false_command = self._cg.set_variant(variant, "0", "bool")
+        if len(lines) == 1:
+            source.add_initialize("if %s; then %s; else %s; fi" % (
+                lines[0], true_command, false_command))
+            return
+
+        self._add_condition_head(source, "if", lines, "then")
+        source.add_initialize(self.INDENT + true_command)
+        source.add_initialize("else")
+        source.add_initialize(self.INDENT + false_command)
+        source.add_initialize("fi")
+
+    def _add_condition_head(self, source, keyword, lines, terminator):
+        # "if", "elif" or "while" with its command list
+        if len(lines) == 1:
+            source.add_initialize("%s %s; %s" % (keyword, lines[0], terminator))
+            return
+
+        source.add_initialize(keyword)
+        self._add_lines(source, lines, self.INDENT)
+        source.add_initialize(terminator)
+
+    def _parse_BoolOp(self, node, source, variant):
+        # The result is the operand deciding it, not a bool. Operands are
+        # evaluated to a temporary, the target could be read by later ones.
+        result_variant = source.create_temp_varaint()
+        source.append(self._parse_node(node.values[0], result_variant))
+        self._add_bool_operands(node, 1, result_variant, source)
+        source.add_initialize(self._cg.set_variant(variant, result_variant))
+
+    def _add_bool_operands(self, node, index, result_variant, source):
+        if index >= len(node.values):
+            return
+
+        previous = node.values[index - 1]
+        if self._types.get_type(previous) is None:
+            type_ = result_variant.type_value
+        else:
+            type_ = self._types.get_type(previous)
+        truth_source = Source(self._cg)
+        if type_ in self._NUMERIC_TYPES:
+            condition = self._format_int_test(result_variant.value, "NEQ", "0")
+        elif type_ == "str":
+            condition = "[ -n %s ]" % result_variant.value
+        else:
+            truth_source.add_initialize(self._cg.invoke(
+                self._cg.get_function("bool"), result_variant.value, type_))
+            condition = self._format_int_test(self._ret_variant.value, "NEQ", "0")
+        if isinstance(node.op, ast.Or):
+            condition = "! " + condition
+
+        block_source = self._parse_node(node.values[index], result_variant)
+        self._add_bool_operands(node, index + 1, result_variant, block_source)
+        source.append(truth_source)
+        source.add_initialize("if %s; then" % condition)
+        self._add_block(source, block_source)
+        source.add_initialize("fi")
+
+    def _parse_Return(self, node, source, variant):
+        # A tuple of a local is handed over, other tuples not made for the
+        # return are copied
+        kept_name = None
+        if node.value is None:
+            source.add_initialize(self._cg.set_variant(self._ret_variant, "", "NoneType"))
+        else:
+            source.append(self._parse_node(node.value))
+            if (isinstance(node.value, ast.Name)
+                    and node.value.id in [x.name for x in self._tuple_locals]):
+                kept_name = node.value.id
+            else:
+                self._get_owned_variant(node.value, self._ret_variant, source)
+        self._add_dropped_frees(source)
+        self._add_local_frees(source, kept_name)
+        source.add_initialize("return")
+
+    def _parse_Assign(self, node, source, variant):
+        atarget = node.targets[0]
+        if isinstance(atarget, ast.Name):
+            target_variant = self._get_target_variant(atarget)
+            if atarget.id in self._tuple_names and not isinstance(node.value, ast.Constant):
+                value_variant = source.create_temp_varaint()
+                source.append(self._parse_node(node.value, value_variant))
+                self._add_store(source, target_variant, self._get_owned_variant(
+                    node.value, value_variant, source))
+            else:
+                if atarget.id in self._tuple_names:
+                    source.add_initialize(self._cg.free_tuple(target_variant))
+                source.append(self._parse_node(node.value, target_variant))
+        elif isinstance(atarget, ast.Tuple):
+            # Every value is evaluated before any target is assigned
+            values = []
+            if isinstance(node.value, ast.Tuple):
+                names = [x.id for x in atarget.elts if isinstance(x, ast.Name)]
+                for value in node.value.elts:
+                    if isinstance(value, ast.Name) and value.id in names:
+                        # a, b = b, a
+                        temp_variant = source.create_temp_varaint()
+                        source.append(self._parse_node(value, temp_variant))
+                    else:
+                        temp_variant = self._get_value_variant(value, source, True)
+                    values.append(self._get_owned_variant(value, temp_variant, source))
+            else:
+                tuple_variant = self._get_value_variant(node.value, source)
+                for i in range(len(atarget.elts)):
+                    temp_variant = source.create_temp_varaint()
+                    self._add_tuple_element(source, tuple_variant, i, temp_variant)
+                    if self._has_tuples:
+                        temp_variant = self._get_owned_variant(None, temp_variant, source)
+                    values.append(temp_variant)
+
+            for element, value in zip(atarget.elts, values):
+                target_variant = self._get_target_variant(element)
+                if element.id in self._tuple_names:
+                    self._add_store(source, target_variant, value)
+                else:
+                    source.add_initialize(self._cg.set_variant(target_variant, value))
+        elif isinstance(atarget, ast.Attribute):
+            value_variant = self._get_value_variant(node.value, source, True)
+            object_variant = self._get_value_variant(atarget.value, source)
+            type_ = self._types.get_type(node.value)
+            if type_ is None or value_variant.is_typed:
+                type_ = value_variant.type_value
+            if self._has_tuples:
+                # The tuple the attribute held is freed
+                value_variant = self._get_owned_variant(node.value, value_variant, source)
+                old_variant = source.create_temp_varaint()
+                self._add_attribute_load(source, object_variant, atarget.attr, old_variant)
+                source.add_initialize(self._cg.free_tuple(old_variant))
+            self._add_attribute_store(
+                source, object_variant, atarget.attr, value_variant, type_)
+
+    def _add_tuple_element(self, source, tuple_variant, index, variant):
+        # Element index (an int) of the tuple to variant
+        source.add_initialize(self._cg.invoke(
+            self._cg.get_method("tuple", "__getitem__"),
+            tuple_variant.value, "tuple", str(index), "int"))
+        source.add_initialize(self._cg.set_variant(variant, self._ret_variant))
+
+    def _add_attribute_store(self, source, object_variant, name, value_variant, type_):
+        # Attributes of an instance are variants named after it, type_ is
+        # the word of the type tag
+        if type_.startswith('"'):
+            type_ = "\\" + type_[1:-1]
+        source.add_initialize('eval "%s_%s=\\%s PYTST%s_%s=%s"' % (
+            object_variant.get_ref(), name, value_variant.get_ref(),
+            object_variant.get_ref("#PYTS"), name, type_))
+
+    def _add_attribute_load(self, source, object_variant, name, variant):
+        command = '%s=\\$%s_%s' % (variant.id_, object_variant.get_ref(), name)
+        if variant.is_typed:
+            command += ' %s=\\$PYTST%s_%s' % (
+                variant.type_id, object_variant.get_ref("#PYTS"), name)
+        source.add_initialize('eval "%s"' % command)
+
+    def _parse_Attribute(self, node, source, variant):
+        self._add_attribute_load(
+            source, self._get_value_variant(node.value, source), node.attr, variant)
+
+    def _parse_Expr(self, node, source, variant):
+        if isinstance(node.value, ast.Call) and self._parse_print(node.value, source):
+            return
+        source.append(self._parse_node(node.value))
+        if self._is_new_tuple(node.value):
+            source.add_initialize(self._cg.free_tuple(self._ret_variant))
+
+    def _parse_Pass(self, node, source, variant):
+        # Just pass ...
+        pass
+
+    def _parse_Break(self, node, source, variant):
+        source.add_initialize("break")
+
+    def _parse_If(self, node, source, variant, keyword="if"):
+        lines = self._get_condition(node.test, source)
+        self._add_condition_head(source, keyword, lines, "then")
+        self._add_block(source, self._parse_node(node.body))
+
+        if len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+            # The setup of the condition can't go before "elif"
+            orelse = node.orelse[0]
+            dropped_variants = list(self._dropped_variants)
+            condition_source = Source(self._cg)
+            lines = self._get_condition(orelse.test, condition_source)
+            self._dropped_variants = dropped_variants
+            if len(list(condition_source)) <= 0:
+                self._parse_If(orelse, source, variant, "elif")
+                return
+
+        if len(node.orelse) > 0:
+            source.add_initialize("else")
+            self._add_block(source, self._parse_node(node.orelse))
+        source.add_initialize("fi")
+
+    def _parse_Slice(self, node, source, variant):
+        # "lower upper step", "None" for a missing one
+        bounds = []
+        for bound in (node.lower, node.upper, node.step):
+            if bound is None or (isinstance(bound, ast.Constant) and bound.value is None):
+                bounds.append("None")
+            else:
+                bounds.append(self._get_int_word(bound, source))
+        source.add_initialize(self._cg.set_variant(
+            variant, '"%s"' % " ".join(bounds), "slice"))
+
+    # Longest "?" pattern of a constant str index
+    MAX_PATTERN_LENGTH = 64
+
+    def _get_item(self, node, source):
+        '''
+        Return the words of the value and the type tag of a subscript read
+        directly, None if it takes a call of __getitem__().
+        '''
+
+        index = node.slice
+        if (self._types.get_type(node.value) == "str" and isinstance(index, ast.Constant)
+                and type(index.value) is int and 0 <= index.value < self.MAX_PATTERN_LENGTH):
+            # Cut index characters by a "?" pattern, then all but the first.
+            # A str index out of range would raise an IndexError in python.
+            value_variant = self._get_value_variant(node.value, source)
+            rest_variant = source.create_temp_varaint()
+            source.add_initialize(self._cg.set_variant(
+                rest_variant, '"%s"' % value_variant.get_ref("#" + "?" * index.value), "str"))
+            return ('"%s"' % rest_variant.get_ref('%%"%s"' % rest_variant.get_ref("#?")), "str")
+
+        return None
+
+    def _parse_Subscript(self, node, source, variant):
+        item = self._get_item(node, source)
+        if item is not None:
+            source.add_initialize(self._cg.set_variant(variant, *item))
+            return
+
+        index = node.slice
+        value, type_ = self._get_operand(node.value, source)
+        index_value, index_type = self._get_operand(index, source)
+        source.add_initialize(self._cg.invoke(
+            self._cg.get_method(type_, "__getitem__"), value, type_, index_value, index_type))
+        source.add_initialize(self._cg.set_variant(variant, self._ret_variant))
+
+    def _get_range_bounds(self, node):
+        '''
+        Return (start, stop, step) of a loop over a range() call with a
+        constant step, None for other loops.
+        '''
+
+        aiter = node.iter
+        if isinstance(aiter, ast.Constant) and isinstance(aiter.value, range):
+            value = aiter.value
+            return (ast.Constant(value=value.start), ast.Constant(value=value.stop), value.step)
+
+        if not (isinstance(aiter, ast.Call) and self._is_builtin_call(aiter, "range")
+                and 1 <= len(aiter.args) <= 3):
+            return None
+
+        args = list(aiter.args)
+        if len(args) < 2:
+            args.insert(0, ast.Constant(value=0))
+        if len(args) < 3:
+            args.append(ast.Constant(value=1))
+
+        step = args[2]
+        if not (isinstance(step, ast.Constant) and type(step.value) is int and step.value != 0):
+            return None
+
+        for arg in args[:2]:
+            if not (self._is_int(arg) or (
+                    isinstance(arg, ast.Constant) and type(arg.value) is int)):
+                return None
+
+        return (args[0], args[1], step.value)
+
+    def _parse_counting_for(self, node, source, target_variant, start, stop, step):
+        index_variant = source.create_temp_varaint()
+        source.add_initialize(self._cg.set_variant(
+            Variant(index_variant.name, index_variant.tag, False),
+            self._get_int_word(start, source), "int"))
+        if isinstance(stop, ast.Constant):
+            stop_word = self._get_constant(stop.value)[0]
+        else:
+            stop_variant = source.create_temp_varaint()
+            source.add_initialize(self._cg.set_variant(
+                Variant(stop_variant.name, stop_variant.tag, False),
+                self._get_int_word(stop, source), "int"))
+            stop_word = stop_variant.value
+
+        source.add_initialize('while %s; do' % self._format_int_test(
+            index_variant.value, "LSS" if step > 0 else "GTR", stop_word))
+        body_source = Source(self._cg)
+        body_source.add_initialize(self._cg.set_variant(target_variant, index_variant.value, "int"))
+        body_source.add_initialize("%s=$((%s + %s))" % (
+            index_variant.id_, index_variant.id_, step))
+        body_source.append(self._parse_node(node.body))
+        self._add_block(source, body_source)
+        source.add_initialize("done")
+
+    def _parse_str_for(self, node, source, target_variant):
+        # Characters are cut from the front of a copy of the string
+        rest_variant = source.create_temp_varaint()
+        next_variant = source.create_temp_varaint()
+        source.add_initialize("%s=%s" % (
+            rest_variant.id_, self._get_operand(node.iter, source)[0]))
+        source.add_initialize('while [ -n %s ]; do' % rest_variant.value)
+        body_source = Source(self._cg)
+        body_source.add_initialize("%s=%s" % (
+            next_variant.id_, '"%s"' % rest_variant.get_ref("#?")))
+        body_source.add_initialize(self._cg.set_variant(
+            target_variant, '"%s"' % rest_variant.get_ref('%%%s' % next_variant.value), "str"))
+        body_source.add_initialize("%s=%s" % (rest_variant.id_, next_variant.value))
+        body_source.append(self._parse_node(node.body))
+        self._add_block(source, body_source)
+        source.add_initialize("done")
+
+    def _parse_tuple_for(self, node, source, target_variant):
+        # A tuple is the list of the variants holding its elements
+        tuple_variant = self._get_value_variant(node.iter, source)
+        element_variant = source.create_temp_varaint()
+        source.add_initialize("for %s in %s; do" % (
+            element_variant.id_, tuple_variant.get_ref()))
+        body_source = Source(self._cg)
+        command = "%s=\\$%s" % (target_variant.id_, element_variant.get_ref())
+        if target_variant.is_typed:
+            command += " %s=\\$PYTST%s" % (
+                target_variant.type_id, element_variant.get_ref("#PYTS"))
+        self._add_element_store(node, body_source, target_variant, ['eval "%s"' % command])
+        body_source.append(self._parse_node(node.body))
+        self._add_block(source, body_source)
+        source.add_initialize("done")
+
+    def _add_element_store(self, node, source, target_variant, lines):
+        # The target of the loop node is set to a copy of an element by
+        # lines, the tuple it held is freed
+        is_tuple_name = node.target.id in self._tuple_names
+        if is_tuple_name:
+            source.add_initialize(self._cg.free_tuple(target_variant))
+        self._add_lines(source, lines)
+        if is_tuple_name:
+            source.add_initialize(self._cg.copy_tuple(target_variant))
+
+    def _parse_For(self, node, source, variant):
+        if not isinstance(node.target, ast.Name):
+            raise NotImplementedError("For target %s" % type(node.target).__name__)
+
+        target_variant = self._get_target_variant(node.target)
+        bounds = self._get_range_bounds(node)
+        if bounds is not None:
+            self._parse_counting_for(node, source, target_variant, *bounds)
+            return
+
+        iter_type = self._types.get_type(node.iter)
+        if iter_type == "str":
+            self._parse_str_for(node, source, target_variant)
+            return
+        if iter_type == "tuple":
+            self._parse_tuple_for(node, source, target_variant)
+            return
+
+        iter_variant = source.create_temp_varaint()
+        length_variant = source.create_temp_varaint()
+        index_variant = source.create_temp_varaint()
+        source.append(self._parse_node(node.iter, iter_variant))
+        if self._is_new_tuple(node.iter):
+            self._dropped_variants.append(iter_variant)
+        source.add_initialize(self._cg.invoke(
+            self._cg.get_function("len"), iter_variant.value, iter_variant.type_value))
+        source.add_initialize("%s=%s %s=0" % (
+            length_variant.id_, self._ret_variant.value, index_variant.id_))
+        source.add_initialize('while %s; do' % self._format_int_test(
+            index_variant.value, "LSS", length_variant.value))
+        body_source = Source(self._cg)
+        body_source.add_initialize(self._cg.invoke(
+            self._cg.get_method(iter_variant.type_value, "__getitem__"),
+            iter_variant.value, iter_variant.type_value, index_variant.value, "int"))
+        self._add_element_store(node, body_source, target_variant, [
+            self._cg.set_variant(target_variant, self._ret_variant)])
+        body_source.add_initialize("%s=$((%s + 1))" % (index_variant.id_, index_variant.id_))
+        body_source.append(self._parse_node(node.body))
+        self._add_block(source, body_source)
+        source.add_initialize("done")
+
+    def _parse_While(self, node, source, variant):
+        # The condition is evaluated again before each pass, tuples it makes
+        # are freed after it either way
+        dropped_variants = self._dropped_variants
+        self._dropped_variants = []
+        condition_source = Source(self._cg)
+        lines = self._get_condition(node.test, condition_source)
+        free_lines = [self._cg.free_tuple(x) for x in self._dropped_variants]
+        self._dropped_variants = dropped_variants
+
+        self._add_condition_head(source, "while", list(condition_source) + lines, "do")
+        body_source = Source(self._cg)
+        self._add_lines(body_source, free_lines)
+        body_source.append(self._parse_node(node.body))
+        self._add_block(source, body_source)
+        source.add_initialize("done")
+        self._add_lines(source, free_lines)
+
+    def _parse_Module(self, node, source, variant):
+        source.append(self._parse_node(node.body))
+
+    def _parse_list(self, node, source, variant):
+        for sub_node in node:
+            dropped_variants = self._dropped_variants
+            self._dropped_variants = []
+            source.append(self._parse_node(sub_node))
+            self._add_dropped_frees(source)
+            self._dropped_variants = dropped_variants
+
+    def _parse_ClassDef(self, node, source, variant):
+        # The constructor creates the instance and passes it to __init__
+        constructor = self._cg.get_function(node.name)
+        sub_source = Source(self._cg)
+        sub_source.add_initialize("")
+        sub_source.add_initialize("%s() {" % constructor)
+        sub_source.add_initialize(self.INDENT + self._cg.invoke(
+            self._cg.get_method("object", "__new__"), self._cg.quote(node.name)))
+        if any([isinstance(x, ast.FunctionDef) and x.name == "__init__" for x in node.body]):
+            sub_source.add_initialize(self.INDENT + 'set -- %s %s "$@"' % (
+                self._ret_variant.value, self._cg.quote(node.name)))
+            sub_source.add_initialize(self.INDENT + self._cg.invoke(
+                self._cg.get_method(node.name, "__init__"), '"$@"'))
+            sub_source.add_initialize(self.INDENT + self._cg.set_variant(
+                self._ret_variant, '"$1"', '"$2"'))
+        sub_source.add_initialize("}")
+        source.add_definition(sub_source)
+
+        source.add_initialize(self._cg.set_variant(
+            Variant(node.name), self._cg.quote(node.name), "type"))
+        source.append(self._parse_node(node.body))
+
+    def generate(self, node):
+        self._reset()
+        inliner = Inliner(self.inline_threshold)
+        node = inliner.inline(node)
+        logging.getLogger(__name__).debug("inlined %s calls", inliner.inlined_count)
+        node = ConstantFolder(self.INT_BITS).fold(node)
+        self._types.infer(node)
+        self._nodes = NodeIndex(node)
+        self._has_tuples = any([isinstance(x, ast.Tuple) and isinstance(x.ctx, ast.Load)
+            for x in ast.walk(node)])
+        self._tuple_names = self._find_tuple_names(node)
+
+        source = self._parse_node(node)
+        program_lines = []
+        for sub_source in source.definitions:
+            program_lines += list(sub_source)
+        program_lines.append("")
+        program_lines += list(source)
+
+        lines = [self.SHEBANG]
+        # Only link runtime routines the program could reach, functions
+        # must be defined before the program calls them
+        if not self.is_bootstrap:
+            library = self._get_library()
+            lines += library.prelude
+            for routine in library.reach(program_lines)[0]:
+                lines += routine.lines
 
-    def translate(self, node):
-        print(ast.dump(node))
-        return ""
+        yield from lines
+        yield from program_lines
@@ -0,0 +1,129 @@
+import re
+from .cmdsyntax import get_label, is_label
+from .layout import estimate_line_weights
+from .linker import Routine
+from .peephole import count_commands
+
+class RoutineStats(object):
+    '''
+    Static cost of one routine of a generated script, nothing is executed.
+
+    Calls are split into calls of labels of the program (user functions,
+    methods and loop bodies), calls of runtime routines and dynamic dispatch
+    sites, whose target is only known at run time (":PYTSV%type%.method").
+    weighted_commands weights each command by the estimated iteration count
+    of the loops around it (see estimate_line_weights()).
+    '''
+
+    FIELDS = [
+        "lines",
+        "commands",
+        "weighted_commands",
+        "user_calls",
+        "runtime_calls",
+        "dynamic_calls",
+        "contexts",
+        "temps",
+        "removed_commands",
+    ]
+
+    def __init__(self, name, label=""):
+        self.name = name
+        self.label = label
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def to_dict(self):
+        result = {"name": self.name, "label": self.label}
+        for field in self.FIELDS:
+            result[field] = getattr(self, field)
+        return result
+
+    @classmethod
+    def sum(cls, name, stats_list):
+        total = cls(name)
+        for stats in stats_list:
+            for field in cls.FIELDS:
+                setattr(total, field, getattr(total, field) + getattr(stats, field))
+        return total
+
+_CALL_RE = re.compile(r'\bcall\s+:([^\s&|()"]+)', re.IGNORECASE)
+_EXIT_RE = re.compile(r'^exit\s+/b\b', re.IGNORECASE)
+_SETLOCAL_RE = re.compile(r'(?:^|[&(])\s*setlocal\b', re.IGNORECASE)
+
+def _weight_subroutines(lines, weights):
+    # Loop bodies are subroutines called from the loop line, they run as
+    # often as it does
+    labels = {}
+    for i, line in enumerate(lines):
+        if is_label(line):
+            labels.setdefault(get_label(line), i)
+
+    for i, line in enumerate(lines):
+        for target in _CALL_RE.findall(line):
+            start = labels.get(target.lower())
+            if start is None or start <= i or weights[i] <= 1:
+                continue
+
+            end = start
+            while end + 1 < len(lines) and not _EXIT_RE.match(lines[end]):
+                end += 1
+            for j in range(start, end + 1):
+                weights[j] *= weights[i]
+    return weights
+
+def collect_routine_stats(name, label, lines, program_labels,
+                          temps=0, removed_commands=0):
+    '''
+    Return the RoutineStats of the lines of a routine.
+
+    program_labels are the (lower case) labels defined by the generated
+    program, static calls of other labels are runtime calls.
+    '''
+
+    stats = RoutineStats(name, label)
+    stats.lines = len(lines)
+    stats.temps = temps
+    stats.removed_commands = removed_commands
+
+    weights = _weight_subroutines(lines, estimate_line_weights(lines))
+    for line, weight in zip(lines, weights):
+        line_commands = count_commands([line])
+        stats.commands += line_commands
+        stats.weighted_commands += line_commands * weight
+
+        if line.startswith("::") or is_label(line):
+            continue
+
+        stats.contexts += len(_SETLOCAL_RE.findall(line))
+        stats.dynamic_calls += len(Routine.parse_targets(line)[1])
+        for target in _CALL_RE.findall(line):
+            if ("%" in target) or ("!" in target):
+                continue
+
+            if target.lower() in program_labels:
+                stats.user_calls += 1
+            else:
+                stats.runtime_calls += 1
+
+    return stats
+
+def format_stats(file_path, stats_list):
+    '''
+    Return the lines of a text report of the routines of one script, with
+    their total.
+    '''
+
+    headers = ["routine"] + RoutineStats.FIELDS
+    rows = []
+    for stats in stats_list + [RoutineStats.sum("(total)", stats_list)]:
+        rows.append([stats.name] + [str(getattr(stats, x)) for x in RoutineStats.FIELDS])
+
+    widths = [max([len(x[i]) for x in rows + [headers]]) for i in range(len(headers))]
+
+    lines = [file_path]
+    for row in [headers] + rows:
+        cells = [row[0].ljust(widths[0])]
+        cells += [x.rjust(y) for x, y in zip(row[1:], widths[1:])]
+        lines.append("  " + "  ".join(cells).rstrip())
+    return lines
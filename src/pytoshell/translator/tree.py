@@ -0,0 +1,88 @@
+import ast
+
+class NodeIndex(object):
+    '''
+    Parents and siblings of the nodes of a syntax tree, kept in a table
+    instead of attributes of the nodes.
+
+    The table is built on first use by one walk over every child field (not
+    only "body"), without recursion, so it works at any depth. It only maps
+    a node to its parent, the field holding a node and its siblings are
+    looked up in the parent when asked for. Contexts and operators aren't
+    in the table, python shares one node of each kind between all their
+    parents.
+    '''
+
+    __slots__ = ("_root", "_parents")
+
+    _SHARED_TYPES = (ast.expr_context, ast.operator, ast.boolop, ast.unaryop, ast.cmpop)
+
+    def __init__(self, root):
+        self._root = root
+        self._parents = None
+
+    def _build(self):
+        parents = {self._root: None}
+        nodes = [self._root]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            for child in ast.iter_child_nodes(node):
+                if not isinstance(child, self._SHARED_TYPES):
+                    parents[child] = node
+                    nodes.append(child)
+        return parents
+
+    @property
+    def root(self):
+        return self._root
+
+    def get_parent(self, node):
+        '''
+        Return the parent of node, None for the root or a node not in the
+        tree.
+        '''
+
+        if self._parents is None:
+            self._parents = self._build()
+        return self._parents.get(node)
+
+    def get_field(self, node):
+        '''
+        Return (name of the field of the parent holding node, index of node
+        in it or None if the field holds a single node), (None, None) for
+        the root.
+        '''
+
+        parent = self.get_parent(node)
+        if parent is None:
+            return (None, None)
+
+        for field, value in ast.iter_fields(parent):
+            if value is node:
+                return (field, None)
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    if item is node:
+                        return (field, i)
+        return (None, None)
+
+    def _get_sibling(self, node, offset):
+        field, index = self.get_field(node)
+        if index is None:
+            return None
+
+        siblings = getattr(self.get_parent(node), field)
+        index += offset
+        if 0 <= index < len(siblings):
+            return siblings[index]
+        return None
+
+    def get_prev_sibling(self, node):
+        return self._get_sibling(node, -1)
+
+    def get_next_sibling(self, node):
+        return self._get_sibling(node, 1)
+
+    @classmethod
+    def get_children(cls, node):
+        return list(ast.iter_child_nodes(node))
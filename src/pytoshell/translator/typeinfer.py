@@ -0,0 +1,303 @@
+import ast
+
+class TypeInference(object):
+    '''
+    Flow sensitive type inference over the module and function bodies.
+
+    Types are the type tags of the runtime ("int", "str", ...), None stands
+    for "unknown", in which case the generated script has to look at the tag
+    at runtime.
+
+    A variable only needs its type tag when some read of it has an unknown
+    type. Variables could be seen from other functions (the environment of
+    the caller is inherited by the callee), so any name read in a function
+    without being assigned there keeps its type tag everywhere.
+    '''
+
+    # Builtins of the runtime library and the type they return
+    BUILTIN_TYPES = {
+        "len": "int",
+        "str": "str",
+        "int": "int",
+        "bool": "bool",
+        "range": "range",
+        "type": "type",
+    }
+
+    def __init__(self):
+        # Expression node -> type
+        self._types = {}
+        # Name node -> whether its variable keeps a type tag
+        self._typed_names = {}
+        self._bound_names = set()
+        self._break_envs = []
+
+    def get_type(self, node):
+        return self._types.get(node)
+
+    def is_typed(self, node):
+        return self._typed_names.get(node, True)
+
+    def is_bound(self, name):
+        '''
+        Whether name is bound anywhere in the module, a builtin of the same
+        name is shadowed then.
+        '''
+
+        return name in self._bound_names
+
+    def infer(self, node, exported_names=()):
+        '''
+        Infer types of the module node, exported_names are read by other
+        modules and keep their type tags.
+        '''
+
+        units = [node] + [x for x in ast.walk(node) if isinstance(x, ast.FunctionDef)]
+
+        unit_names = []
+        escaped_names = set(exported_names)
+        self._bound_names = set()
+        for unit in units:
+            stores, bindings, loads = self._collect_bindings(unit)
+            unit_names.append((stores, bindings, loads))
+            escaped_names |= set([x.id for x in loads]) - set(stores.keys()) - bindings
+            self._bound_names |= set(stores.keys()) | bindings
+
+        for unit, (stores, bindings, loads) in zip(units, unit_names):
+            env = {}
+            if isinstance(unit, ast.FunctionDef):
+                for an_arg in unit.args.args:
+                    env[an_arg.arg] = None
+            self._visit_body(unit.body, env)
+
+            typed_names = bindings | escaped_names
+            for load in loads:
+                if self.get_type(load) is None:
+                    typed_names.add(load.id)
+
+            for name, nodes in stores.items():
+                for name_node in nodes:
+                    self._typed_names[name_node] = name in typed_names
+            for load in loads:
+                self._typed_names[load] = load.id in typed_names
+
+        return self
+
+    @classmethod
+    def _iter_unit_nodes(cls, unit):
+        # Nodes of the unit itself, without bodies of nested functions
+        nodes = list(ast.iter_child_nodes(unit))
+        while len(nodes) > 0:
+            node = nodes.pop()
+            yield node
+            if not isinstance(node, ast.FunctionDef):
+                nodes += list(ast.iter_child_nodes(node))
+
+    @classmethod
+    def _collect_bindings(cls, unit):
+        '''
+        Return the name nodes assigned by statements, the names bound any
+        other way and the name nodes read by the unit.
+        '''
+
+        stores = {}
+        bindings = set()
+        loads = []
+        targets = set()
+
+        if isinstance(unit, ast.FunctionDef):
+            bindings |= set([x.arg for x in unit.args.args])
+
+        for node in cls._iter_unit_nodes(unit):
+            if isinstance(node, ast.Assign):
+                targets |= set([x for x in ast.walk(node.targets[0]) if isinstance(x, ast.Name)])
+            elif isinstance(node, ast.For):
+                targets |= set([x for x in ast.walk(node.target) if isinstance(x, ast.Name)])
+            elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                bindings.add(node.name)
+            elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                bindings |= set(node.names)
+            elif isinstance(node, ast.alias):
+                bindings.add((node.asname or node.name).split(".")[0])
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                # Function names aren't read through variables
+                targets.add(node.func)
+
+        for node in cls._iter_unit_nodes(unit):
+            if not isinstance(node, ast.Name):
+                continue
+
+            if isinstance(node.ctx, ast.Load):
+                if node not in targets:
+                    loads.append(node)
+            elif node in targets:
+                stores.setdefault(node.id, []).append(node)
+            else:
+                bindings.add(node.id)
+
+        return stores, bindings, loads
+
+    @classmethod
+    def _merge(cls, *envs):
+        # A name missing from an env isn't assigned on that path yet
+        envs = [x for x in envs if x is not None]
+        if len(envs) <= 0:
+            return None
+
+        result = dict(envs[0])
+        for env in envs[1:]:
+            for name, type_ in env.items():
+                if name not in result:
+                    result[name] = type_
+                elif result[name] != type_:
+                    result[name] = None
+        return result
+
+    def _visit_body(self, statements, env):
+        for statement in statements:
+            if env is None:
+                # Unreachable
+                break
+            env = self._visit_statement(statement, env)
+        return env
+
+    def _assign(self, target, value, env):
+        if isinstance(target, ast.Name):
+            env[target.id] = self._visit_expression(value, env)
+        elif isinstance(target, ast.Tuple) and isinstance(value, ast.Tuple):
+            for atarget, avalue in zip(target.elts, value.elts):
+                self._assign(atarget, avalue, env)
+        else:
+            self._visit_expression(value, env)
+            for name_node in ast.walk(target):
+                if isinstance(name_node, ast.Name):
+                    env[name_node.id] = None
+
+    def _visit_statement(self, node, env):
+        if isinstance(node, ast.Assign):
+            self._assign(node.targets[0], node.value, env)
+        elif isinstance(node, ast.Expr):
+            self._visit_expression(node.value, env)
+        elif isinstance(node, ast.Return):
+            if node.value is not None:
+                self._visit_expression(node.value, env)
+            return None
+        elif isinstance(node, ast.Break):
+            if len(self._break_envs) > 0:
+                self._break_envs[-1].append(dict(env))
+            return None
+        elif isinstance(node, ast.If):
+            self._visit_expression(node.test, env)
+            body_env = self._visit_body(node.body, dict(env))
+            orelse_env = self._visit_body(node.orelse, dict(env))
+            return self._merge(body_env, orelse_env)
+        elif isinstance(node, ast.While):
+            return self._visit_loop(node, env)
+        elif isinstance(node, ast.For):
+            iter_type = self._visit_expression(node.iter, env)
+            return self._visit_loop(node, env, iter_type)
+        elif isinstance(node, ast.ClassDef):
+            env[node.name] = "type"
+            env = self._visit_body(node.body, env)
+        elif isinstance(node, ast.FunctionDef):
+            env[node.name] = None
+        else:
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, ast.expr):
+                    self._visit_expression(child, env)
+        return env
+
+    def _visit_loop(self, node, env, iter_type=None):
+        head_env = dict(env)
+        while True:
+            self._break_envs.append([])
+            body_env = dict(head_env)
+            if isinstance(node, ast.While):
+                self._visit_expression(node.test, body_env)
+            else:
+                element_type = None
+                if iter_type == "range":
+                    element_type = "int"
+                elif iter_type == "str":
+                    element_type = "str"
+                body_env[node.target.id] = element_type
+            body_env = self._visit_body(node.body, body_env)
+            break_envs = self._break_envs.pop()
+
+            new_head_env = self._merge(head_env, body_env)
+            if new_head_env == head_env:
+                break
+            head_env = new_head_env
+
+        return self._merge(head_env, *break_envs)
+
+    def _visit_expression(self, node, env):
+        type_ = None
+        if isinstance(node, ast.Constant):
+            value = node.value
+            if isinstance(value, bool):
+                type_ = "bool"
+            elif isinstance(value, int):
+                type_ = "int"
+            elif isinstance(value, str):
+                type_ = "str"
+            elif isinstance(value, range):
+                type_ = "range"
+        elif isinstance(node, ast.Name):
+            type_ = env.get(node.id)
+        elif isinstance(node, ast.BinOp):
+            left = self._visit_expression(node.left, env)
+            right = self._visit_expression(node.right, env)
+            if left == "int" and right == "int":
+                type_ = "int"
+            elif left == "str" and isinstance(node.op, ast.Add) and right == "str":
+                type_ = "str"
+            elif isinstance(node.op, ast.Mult) and set([left, right]) == set(["int", "str"]):
+                type_ = "str"
+            elif left == "str" and isinstance(node.op, ast.Mod):
+                type_ = "str"
+        elif isinstance(node, ast.UnaryOp):
+            operand = self._visit_expression(node.operand, env)
+            if isinstance(node.op, ast.Not):
+                type_ = "bool"
+            elif operand == "int":
+                type_ = "int"
+        elif isinstance(node, ast.Compare):
+            self._visit_expression(node.left, env)
+            for comparator in node.comparators:
+                self._visit_expression(comparator, env)
+            type_ = "bool"
+        elif isinstance(node, ast.BoolOp):
+            # Evaluates to one of its operands
+            types = set([self._visit_expression(x, env) for x in node.values])
+            if len(types) == 1:
+                type_ = types.pop()
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Attribute):
+                self._visit_expression(node.func.value, env)
+            for argument in node.args:
+                self._visit_expression(argument, env)
+            if isinstance(node.func, ast.Name) and node.func.id not in self._bound_names:
+                type_ = self.BUILTIN_TYPES.get(node.func.id)
+        elif isinstance(node, ast.Tuple):
+            for element in node.elts:
+                self._visit_expression(element, env)
+            type_ = "tuple"
+        elif isinstance(node, ast.Subscript):
+            value_type = self._visit_expression(node.value, env)
+            self._visit_expression(node.slice, env)
+            if value_type == "str":
+                type_ = "str"
+            elif value_type == "range":
+                type_ = "int"
+        elif isinstance(node, ast.Slice):
+            for child in ast.iter_child_nodes(node):
+                self._visit_expression(child, env)
+            type_ = "slice"
+        else:
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, ast.expr):
+                    self._visit_expression(child, env)
+
+        self._types[node] = type_
+        return type_
@@ -0,0 +1,5 @@
+import os.path
+import sys
+
+# Test the tree the tests are in, not an installed pytoshell
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,61 @@
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import textwrap
+import unittest
+from pytoshell import emulator
+from pytoshell.compiler import Compiler
+
+# Shell running the scripts of each type
+SHELLS = {
+    "sh": "dash",
+    "bash": "bash",
+}
+
+def run_python(source):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        exec(compile(source, "<test>", "exec"), {"__name__": "__main__"})
+    return output.getvalue()
+
+def run_batch(source, file_path="<unknown>", **options):
+    script = Compiler("bat", **options).compile_source(source, file_path)
+    return emulator.run(script).output
+
+def run_shell(source, type_="sh", shell=None, **options):
+    script = Compiler(type_, **options).compile_source(source)
+    script_file = tempfile.NamedTemporaryFile("w", suffix=".%s" % type_, delete=False)
+    try:
+        with script_file:
+            script_file.write(script)
+        return subprocess.run(
+            [shell or SHELLS[type_], script_file.name], stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True, timeout=60).stdout
+    finally:
+        os.remove(script_file.name)
+
+class ScriptTestCase(unittest.TestCase):
+    '''
+    Compare the output of generated scripts with the one of CPython. Batch
+    scripts run in the emulator, shell scripts are skipped if their shell
+    isn't installed.
+    '''
+
+    def assertBatchOutput(self, source, **options):
+        source = textwrap.dedent(source)
+        self.assertEqual(run_batch(source, **options), run_python(source))
+
+    def assertShellOutput(self, source, type_="sh", **options):
+        if shutil.which(SHELLS[type_]) is None:
+            self.skipTest("%s isn't installed" % SHELLS[type_])
+        source = textwrap.dedent(source)
+        self.assertEqual(run_shell(source, type_, **options), run_python(source))
+
+    def assertAllOutput(self, source, **options):
+        self.assertBatchOutput(source, **options)
+        for type_ in sorted(SHELLS.keys()):
+            with self.subTest(type_=type_):
+                self.assertShellOutput(source, type_, **options)
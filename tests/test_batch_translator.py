@@ -0,0 +1,52 @@
+import ast
+from pytoshell.compiler import Compiler
+from pytoshell.translator import batch
+from .support import ScriptTestCase
+
+class DispatchTest(ScriptTestCase):
+    def test_constants(self):
+        self.assertBatchOutput('''
+            print(str(True))
+            print(str(False))
+            print(str(3))
+            print("a b")
+            x = None
+            print(str(x is None))
+            ''')
+
+    def test_none(self):
+        source = '''
+            def f(x):
+                if x:
+                    return
+                print("f")
+            r = f(0)
+            print(str(r))
+            print(str(f(1)))
+            print(str(None))
+            print(str(r == None))
+            print(str(r == 0))
+            print(str(r != f(1)))
+            if not r:
+                print("false")
+            print(str(bool(f(0))))
+            '''
+        self.assertBatchOutput(source)
+        # Called, not folded by the inliner
+        self.assertAllOutput(source, inline_threshold=0)
+
+    def test_names_differing_in_case(self):
+        self.assertBatchOutput('''
+            Big = 1
+            big = 2
+            print(str(Big))
+            print(str(big))
+            ''')
+
+    def test_unsupported_node(self):
+        with self.assertRaises(NotImplementedError):
+            Compiler("bat").compile_source("x = [1]\n")
+
+    def test_handler_cached(self):
+        handler = batch.Translator._get_handler(ast.Constant)
+        self.assertIs(batch.Translator._handlers[(batch.Translator, ast.Constant)], handler)
@@ -0,0 +1,47 @@
+from .support import ScriptTestCase
+
+class BatchTupleTest(ScriptTestCase):
+    def test_for_over_ints(self):
+        self.assertBatchOutput('''
+            def show(values):
+                for x in values:
+                    print(x)
+            t = (1, 2, 3)
+            for x in t:
+                print(x)
+            show(t)
+            ''', inline_threshold=0)
+
+    def test_for_over_mixed_with_break(self):
+        self.assertBatchOutput('''
+            for x in ("a", 2, "c", "d", "e"):
+                if x == "d":
+                    break
+                print(x)
+            ''')
+
+    def test_for_over_nested(self):
+        self.assertBatchOutput('''
+            for pair in ((1, "one"), (2, "two")):
+                print(pair[1])
+                print(len(pair))
+            ''')
+
+    def test_index_and_len(self):
+        self.assertBatchOutput('''
+            t = ("a", "b", "c")
+            print(t[0])
+            print(t[-1])
+            print(len(t))
+            ''')
+
+    def test_returned(self):
+        self.assertBatchOutput('''
+            def make(n):
+                return (n, n + 1, (n, "x"))
+            t = make(4)
+            print(t[1])
+            print(t[2][1])
+            for x in make(7)[2]:
+                print(x)
+            ''', inline_threshold=0)
@@ -0,0 +1,90 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pytoshell.compiler import Compiler
+
+RUNNER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "run.py")
+
+def load_runner():
+    spec = importlib.util.spec_from_file_location("benchmarks_run", RUNNER_PATH)
+    runner = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(runner)
+    return runner
+
+runner = load_runner()
+
+class RunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _main(self, *argv):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            return runner.main(list(argv)), output.getvalue()
+
+    def _write_results(self, name, programs):
+        path = os.path.join(self.directory, name)
+        with io.open(path, "w") as results_file:
+            json.dump({
+                "version": runner.FORMAT_VERSION, "type": "bat", "programs": programs,
+            }, results_file)
+        return path
+
+class MeasureTest(RunnerTestCase):
+    def test_tiny_program(self):
+        source = 'x = 2\nprint("x" + str(x * 3))\n'
+        compiler = Compiler("bat")
+        metrics = runner.measure(compiler, runner.load_library("bat"), "tiny", source, 1)
+        script = compiler.compile_source(source)
+        self.assertEqual(metrics["lines"], len(script.split("\n")))
+        self.assertEqual(metrics["bytes"], len(script.encode("utf-8")))
+        self.assertGreater(metrics["routines"], 0)
+        self.assertGreater(metrics["translate_seconds"], 0)
+        # Run by the emulator
+        self.assertGreater(metrics["executed_commands"], 0)
+        self.assertTrue(metrics["output_matches"])
+
+    def test_corpus_program(self):
+        path = os.path.join(self.directory, "results.json")
+        rc, output = self._main("-r", "1", "-o", path, "arithmetic")
+        self.assertEqual(rc, 0)
+        with io.open(path, "r") as results_file:
+            results = json.load(results_file)
+        self.assertEqual(list(results["programs"].keys()), ["arithmetic"])
+        program = results["programs"]["arithmetic"]
+        self.assertEqual(sorted(program.keys()), sorted(runner.METRICS + ["output_matches"]))
+        self.assertTrue(program["output_matches"])
+
+class CompareTest(RunnerTestCase):
+    def _program(self, **metrics):
+        program = dict([(x, 100) for x in runner.METRICS])
+        program.update(metrics)
+        return program
+
+    def test_unchanged(self):
+        old = self._write_results("old.json", {"a": self._program()})
+        new = self._write_results("new.json", {"a": self._program(translate_seconds=110)})
+        rc, output = self._main("compare", old, new)
+        self.assertEqual(rc, 0)
+        self.assertNotIn("REGRESSION", output)
+
+    def test_regressions(self):
+        old = self._write_results("old.json", {"a": self._program(), "b": self._program()})
+        new = self._write_results("new.json", {
+            "a": self._program(lines=101, translate_seconds=200), "b": self._program()})
+        rc, output = self._main("compare", old, new)
+        self.assertEqual(rc, 1)
+        self.assertEqual(output.count("REGRESSION"), 2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            regressions = runner.compare(
+                runner.load_results(old), runner.load_results(new), 150.0)
+        self.assertEqual(regressions, [("a", "lines", 100, 101)])
@@ -0,0 +1,135 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from pytoshell.cache import CompileCache
+from pytoshell.compiler import Compiler
+from pytoshell.console import Application
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, source):
+        path = os.path.join(self.directory, name)
+        with io.open(path, "w") as source_file:
+            source_file.write(source)
+        return path
+
+    def _list_entries(self):
+        entries = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            entries += [os.path.join(root, x) for x in files]
+        return sorted(entries)
+
+class CacheKeyTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = CompileCache(self.cache_dir)
+        self.translator = Compiler("bat")._translator
+
+    def _make_key(self, source=b"x = 1\n", type_="bat", options={"bootstrap": False}):
+        return self.cache.make_key(source, type_, self.translator, options)
+
+    def test_source(self):
+        self.assertEqual(self._make_key(), self._make_key())
+        self.assertNotEqual(self._make_key(), self._make_key(b"x = 2\n"))
+
+    def test_options(self):
+        self.assertNotEqual(self._make_key(), self._make_key(options={"bootstrap": True}))
+        self.assertNotEqual(self._make_key(), self._make_key(type_="cmd"))
+
+    def test_fingerprint(self):
+        key = self._make_key()
+        with mock.patch.dict(CompileCache._fingerprints,
+                             {type(self.translator): "changed"}):
+            self.assertNotEqual(self._make_key(), key)
+        self.assertEqual(self._make_key(), key)
+
+class PutTest(CacheTestCase):
+    def _raise(self, error):
+        def write(afile):
+            afile.write(b"partial")
+            raise error
+        return write
+
+    def test_write_failed(self):
+        cache = CompileCache(self.cache_dir)
+        with self.assertRaises(ValueError):
+            cache._put("aa1", self._raise(ValueError()))
+        # Errors of the file system are only a missed cache entry
+        cache._put("aa1", self._raise(OSError()))
+        self.assertEqual(self._list_entries(), [])
+
+class EvictionTest(CacheTestCase):
+    def test_least_recently_used(self):
+        cache = CompileCache(self.cache_dir, 400)
+        for key in ["aa1", "bb2", "cc3", "dd4"]:
+            cache.put(key, "x" * 100)
+        for i, path in enumerate(self._list_entries()):
+            os.utime(path, (1000 + i, 1000 + i))
+        # Reading an entry makes it the most recently used
+        self.assertEqual(cache.get("aa1"), "x" * 100)
+
+        # Over the bound, evict down to 3/4 of it
+        cache.put("ee5", "x" * 100)
+        self.assertEqual([os.path.basename(x) for x in self._list_entries()],
+                         ["aa1", "dd4", "ee5"])
+
+    def test_under_bound_kept(self):
+        cache = CompileCache(self.cache_dir, 400)
+        for key in ["aa1", "bb2", "cc3", "dd4"]:
+            cache.put(key, "x" * 100)
+        self.assertEqual(len(self._list_entries()), 4)
+
+class CachedCompileTest(CacheTestCase):
+    def _run(self, *argv):
+        return Application(list(argv)).exec_()
+
+    def test_cache_dir(self):
+        path = self._write("a.py", 'print("a")\n')
+        self.assertEqual(self._run("-t", "bat", "--cache-dir", self.cache_dir, path), 0)
+        self.assertEqual(len(self._list_entries()), 1)
+
+    def test_no_cache(self):
+        path = self._write("a.py", 'print("a")\n')
+        self.assertEqual(self._run(
+            "-t", "bat", "--no-cache", "--cache-dir", self.cache_dir, path), 0)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_hit(self):
+        path = self._write("a.py", 'print("a")\n')
+        output_path = os.path.join(self.directory, "a.bat")
+        Compiler("bat", cache=CompileCache(self.cache_dir)).compile_file(path, output_path)
+        with io.open(output_path, "r") as script_file:
+            script = script_file.read()
+        entry_path = self._list_entries()[0]
+
+        # A hit marks the entry as used and leaves an up to date output alone
+        os.utime(entry_path, (1000, 1000))
+        os.utime(output_path, (1000, 1000))
+        Compiler("bat", cache=CompileCache(self.cache_dir)).compile_file(path, output_path)
+        self.assertGreater(os.path.getmtime(entry_path), 1000)
+        self.assertEqual(os.path.getmtime(output_path), 1000)
+
+        os.remove(output_path)
+        Compiler("bat", cache=CompileCache(self.cache_dir)).compile_file(path, output_path)
+        with io.open(output_path, "r") as script_file:
+            self.assertEqual(script_file.read(), script)
+
+    def test_imported_module(self):
+        # Scripts are linked with the modules they import
+        self._write("m.py", "def f():\n    return 1\n")
+        path = self._write("main.py", "import m\nprint(str(m.f()))\n")
+        output_path = os.path.join(self.directory, "main.bat")
+        compiler = Compiler("bat", cache=CompileCache(self.cache_dir))
+        compiler.compile_file(path, output_path)
+        self._write("m.py", "def f():\n    return 2\n")
+        compiler.compile_file(path, output_path)
+        self.assertEqual(len(self._list_entries()), 2)
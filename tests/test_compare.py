@@ -0,0 +1,55 @@
+import textwrap
+from pytoshell.compiler import Compiler
+from .support import ScriptTestCase
+
+class CompareTest(ScriptTestCase):
+    def test_unknown_types(self):
+        self.assertAllOutput('''
+            def check(a, b):
+                if a < b:
+                    print("lt")
+                if a <= b and not a == b:
+                    print("le")
+                if a > b or a == b:
+                    print("ge")
+                if a != b:
+                    print("ne")
+                print(str(a < b))
+            check(1, 2)
+            check(3, 3)
+            check(-5, -7)
+            check("a", "b")
+            check("b", "b")
+            ''', inline_threshold=0)
+
+    def test_chained(self):
+        self.assertAllOutput('''
+            x = 5
+            print(str(1 < x < 10))
+            print(str(1 < x > 10))
+            ''')
+
+    def test_bool_op_value(self):
+        self.assertAllOutput('''
+            a = ""
+            b = "x"
+            print(a or b)
+            print(str(a and b) + ".")
+            ''')
+
+    def test_while(self):
+        self.assertAllOutput('''
+            i = 10
+            while i > 0 and i != 3:
+                i = i - 2
+            print(str(i))
+            ''')
+
+    def test_inline_int_compare(self):
+        script = Compiler("bat").compile_source(textwrap.dedent('''
+            i = 0
+            while i < 3:
+                i = i + 1
+            '''))
+        self.assertRegex(script, r'if %@PYTSVi% (LSS|GEQ) 3 ')
+        self.assertNotIn("call :PYTSVcompare", script)
@@ -0,0 +1,105 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from pytoshell.compiler import Compiler, collect_jobs, compile_files
+from pytoshell.console import Application
+
+class CompileFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Keep the default compile cache out of the home directory
+        environ = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.directory})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    def _write(self, name, source):
+        path = self._path(name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with io.open(path, "w") as source_file:
+            source_file.write(source)
+        return path
+
+    def _read(self, path):
+        with io.open(path, "r") as script_file:
+            return script_file.read()
+
+    def _run(self, *argv):
+        return Application(list(argv)).exec_()
+
+class CollectJobsTest(CompileFilesTestCase):
+    def test_next_to_source(self):
+        path = self._write("a.py", "")
+        self.assertEqual(collect_jobs([path], "bat"), [(path, self._path("a.bat"))])
+
+    def test_directory_layout(self):
+        # Sources of a tree keep their place below the output directory,
+        # sources given directly go to its top
+        self._write(os.path.join("src", "b.py"), "")
+        self._write(os.path.join("src", "pkg", "a.py"), "")
+        self._write(os.path.join("src", "pkg", "notes.txt"), "")
+        single = self._write(os.path.join("other", "c.py"), "")
+        jobs = collect_jobs([self._path("src"), single], "bat", self._path("out"))
+        self.assertEqual([x[1] for x in jobs], [
+            self._path("out", "b.bat"),
+            self._path("out", "pkg", "a.bat"),
+            self._path("out", "c.bat"),
+        ])
+
+    def test_same_output(self):
+        first = self._write(os.path.join("a", "m.py"), "")
+        second = self._write(os.path.join("b", "m.py"), "")
+        with self.assertRaises(ValueError):
+            collect_jobs([first, second], "bat", self._path("out"))
+        # Apart next to their sources
+        self.assertEqual(len(collect_jobs([first, second], "bat")), 2)
+
+class CompileFilesTest(CompileFilesTestCase):
+    def test_output_directory(self):
+        self._write(os.path.join("src", "a.py"), 'print("a")\n')
+        self._write(os.path.join("src", "pkg", "b.py"), 'print("b")\n')
+        self.assertEqual(self._run("-t", "bat", "-o", self._path("out"), self._path("src")), 0)
+        self.assertTrue(os.path.isfile(self._path("out", "a.bat")))
+        self.assertTrue(os.path.isfile(self._path("out", "pkg", "b.bat")))
+
+    def test_same_output_reported(self):
+        first = self._write(os.path.join("a", "m.py"), 'print("a")\n')
+        second = self._write(os.path.join("b", "m.py"), 'print("b")\n')
+        with self.assertLogs(level="ERROR") as logs:
+            self.assertEqual(self._run("-t", "bat", "-o", self._path("out"), first, second), 1)
+        self.assertIn(self._path("out", "m.bat"), logs.output[0])
+        self.assertFalse(os.path.exists(self._path("out")))
+
+    def test_worker_pool(self):
+        paths = [self._write("m%s.py" % i, 'print("%s")\n' % i) for i in range(6)]
+        jobs = collect_jobs(paths, "bat", self._path("out"))
+        results = compile_files(jobs, "bat", processes=3)
+        self.assertEqual([(x.file_path, x.output_path) for x in results], jobs)
+        self.assertTrue(all([x.is_succeeded for x in results]))
+
+        compiler = Compiler("bat")
+        for path, output_path in jobs:
+            with io.open(path, "r") as source_file:
+                script = compiler.compile_source(source_file.read(), path)
+            self.assertEqual(self._read(output_path), script)
+
+    def test_failure_keeps_going(self):
+        self._write(os.path.join("src", "a.py"), 'print("a")\n')
+        self._write(os.path.join("src", "b.py"), "def (\n")
+        self._write(os.path.join("src", "c.py"), 'print("c")\n')
+        for jobs in ("1", "2"):
+            with self.subTest(jobs=jobs):
+                out_dir = self._path("out" + jobs)
+                with self.assertLogs(level="ERROR"):
+                    self.assertEqual(self._run(
+                        "-t", "bat", "-j", jobs, "-o", out_dir, self._path("src")), 1)
+                self.assertEqual(sorted(os.listdir(out_dir)), ["a.bat", "c.bat"])
@@ -0,0 +1,48 @@
+import unittest
+from pytoshell.emulator import EmulatorError, run
+
+class EmulatorTest(unittest.TestCase):
+    def _run(self, *lines):
+        return run("\r\n".join(("@echo off",) + lines)).output
+
+    def test_echo(self):
+        self.assertEqual(self._run("echo a", "echo b"), "a\nb\n")
+
+    def test_echo_trailing_space(self):
+        self.assertEqual(self._run("echo a & echo b ", "(echo c )"), "a \nb \nc \n")
+
+    def test_set_arithmetic(self):
+        self.assertEqual(self._run('set /a "x=7*6"', "echo %x%"), "42\n")
+
+    def test_delayed_expansion(self):
+        self.assertEqual(self._run(
+            "setlocal EnableDelayedExpansion", 'set "x=1"', 'set "x=2" & echo %x% !x!'),
+            "1 2\n")
+
+    def test_if_chain_is_part_of_then(self):
+        self.assertEqual(self._run("if 1==2 (echo a) & echo b"), "")
+        self.assertEqual(self._run("if 1==1 (echo a) & echo b"), "a\nb\n")
+        self.assertEqual(self._run("if 1==2 echo a & echo b"), "")
+
+    def test_if_chain_is_part_of_else(self):
+        self.assertEqual(self._run("if 1==1 (echo a) else (echo b) & echo c"), "a\n")
+        self.assertEqual(self._run("if 1==2 (echo a) else (echo b) & echo c"), "b\nc\n")
+
+    def test_block_ends_if(self):
+        self.assertEqual(self._run("(if 1==2 (echo a)) & echo b"), "b\n")
+
+    def test_for_chain_is_part_of_body(self):
+        self.assertEqual(self._run("for %%i in (1 2) do (echo %%i) & echo x"), "1\nx\n2\nx\n")
+
+    def test_multiline_blocks(self):
+        self.assertEqual(self._run("if 1==1 (", "echo a", ") else (", "echo b", ")", "echo c"),
+                         "a\nc\n")
+
+    def test_call_and_exit(self):
+        self.assertEqual(self._run(
+            "call :f x", "echo %errorlevel%", "exit /b 0", ":f", "echo %1", "exit /b 3"),
+            "x\n3\n")
+
+    def test_missing_label(self):
+        with self.assertRaises(EmulatorError):
+            self._run("goto :nowhere")
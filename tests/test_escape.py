@@ -0,0 +1,76 @@
+import ast
+import textwrap
+import unittest
+from pytoshell.translator.escape import EscapeAnalysis
+from .support import ScriptTestCase
+
+class EscapeAnalysisTest(unittest.TestCase):
+    def _analyze(self, source, is_imported=False):
+        functions = EscapeAnalysis(is_imported).analyze(ast.parse(textwrap.dedent(source)))
+        return sorted([x.name for x in functions])
+
+    def test_scopeless(self):
+        self.assertEqual(self._analyze('''
+            def add(a, b):
+                return a + b
+            def assigns(a):
+                b = a
+                return b
+            '''), ["add"])
+
+    def test_recursion(self):
+        self.assertEqual(self._analyze('''
+            def down(n):
+                return up(n - 1)
+            def up(n):
+                return down(n)
+            def leaf(n):
+                return n
+            '''), ["leaf"])
+
+    def test_methods_reached(self):
+        # len() could call __len__, which calls size() again
+        self.assertEqual(self._analyze('''
+            def size(x):
+                return len(x)
+            class Box:
+                def __len__(self):
+                    return size("ab")
+            '''), [])
+
+    def test_imported(self):
+        # The importer could call back any function of the module
+        source = '''
+            def size(x):
+                return len(x)
+            '''
+        self.assertEqual(self._analyze(source), ["size"])
+        self.assertEqual(self._analyze(source, True), [])
+
+class ScopelessScriptTest(ScriptTestCase):
+    def test_caller_temporaries_kept(self):
+        self.assertBatchOutput('''
+            def add(a, b):
+                return a + b * 2
+            def mul(a, b):
+                return a * b + add(b, a)
+            x = 3
+            print(str(add(x, 1) + mul(x, add(1, 2))))
+            print(str(x))
+            ''', inline_threshold=0)
+
+    def test_builds_tuple(self):
+        self.assertBatchOutput('''
+            def pair(a):
+                return (a, a + 1)
+            t = pair(1)
+            u = pair(5)
+            print(str(t[1]) + str(u[0]))
+            ''', inline_threshold=0)
+
+    def test_many_parameters(self):
+        self.assertBatchOutput('''
+            def total(a, b, c, d, e, f, g, h, i, j):
+                return a + b + c + d + e + f + g + h + i + j
+            print(str(total(1, 2, 3, 4, 5, 6, 7, 8, 9, 10)))
+            ''', inline_threshold=0)
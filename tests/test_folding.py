@@ -0,0 +1,55 @@
+import ast
+import unittest
+from pytoshell.translator.folding import ConstantFolder, format_str, wrap_int
+from .support import ScriptTestCase
+
+class ConstantFolderTest(unittest.TestCase):
+    def _fold(self, expression, int_bits=32, prelude=""):
+        node = ConstantFolder(int_bits).fold(ast.parse(prelude + "x = " + expression))
+        value = node.body[-1].value
+        if isinstance(value, ast.Constant):
+            return value.value
+        return value
+
+    def test_int_arithmetic(self):
+        self.assertEqual(self._fold("1 + 2 * 3 - (4 << 2)"), -9)
+
+    def test_truncated_division(self):
+        self.assertEqual(self._fold("-7 / 2"), -3)
+        self.assertEqual(self._fold("-7 % 2"), -1)
+
+    def test_wrap(self):
+        self.assertEqual(self._fold("2147483647 + 1"), -2147483648)
+        self.assertEqual(self._fold("2147483647 + 1", 64), 2147483648)
+        self.assertEqual(wrap_int(1 << 32), 0)
+
+    def test_left_to_runtime(self):
+        self.assertIsInstance(self._fold("1 / 0"), ast.BinOp)
+        self.assertIsInstance(self._fold("1 << 40"), ast.BinOp)
+        self.assertIsInstance(self._fold('int("010")'), ast.Call)
+        self.assertIsInstance(self._fold('"a" * 10000'), ast.BinOp)
+
+    def test_builtins(self):
+        self.assertEqual(self._fold('len("abc")'), 3)
+        self.assertEqual(self._fold("len((1, 2))"), 2)
+        self.assertEqual(self._fold("str(True)"), "True")
+        self.assertEqual(self._fold('int("-12")'), -12)
+        self.assertEqual(self._fold("range(3)"), range(3))
+
+    def test_shadowed_builtin(self):
+        self.assertIsInstance(self._fold('len("abc")', prelude="len = str\n"), ast.Call)
+
+    def test_strings(self):
+        self.assertEqual(self._fold('"ab" * 2 + "c"'), "ababc")
+        self.assertEqual(self._fold('"n=%s" % 3'), "n=3")
+        self.assertEqual(format_str("%d%%%s!", "x"), "d%x!")
+
+class FoldedScriptTest(ScriptTestCase):
+    def test_same_output(self):
+        self.assertAllOutput('''
+            print(str(6 * 7 - 2))
+            print(str(len("abcd")))
+            print("v=%s" % (1 + 1))
+            for i in range(1, 3):
+                print(str(i))
+            ''')
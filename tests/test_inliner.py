@@ -0,0 +1,86 @@
+import ast
+import textwrap
+import unittest
+from pytoshell.translator.inliner import Inliner
+from .support import ScriptTestCase
+
+class InlinerTest(unittest.TestCase):
+    def _inline(self, source, threshold=Inliner.DEFAULT_THRESHOLD, exported_names=()):
+        inliner = Inliner(threshold)
+        node = inliner.inline(ast.parse(textwrap.dedent(source)), exported_names)
+        names = [x.name for x in node.body if isinstance(x, ast.FunctionDef)]
+        return inliner.inlined_count, names
+
+    def test_inlined_and_removed(self):
+        self.assertEqual(self._inline('''
+            def inc(n):
+                return n + 1
+            x = inc(1)
+            print(str(inc(x)))
+            '''), (2, []))
+
+    def test_disabled(self):
+        self.assertEqual(self._inline('''
+            def inc(n):
+                return n + 1
+            x = inc(1)
+            ''', 0), (0, ["inc"]))
+
+    def test_exported_kept(self):
+        self.assertEqual(self._inline('''
+            def inc(n):
+                return n + 1
+            x = inc(1)
+            ''', exported_names=["inc"]), (1, ["inc"]))
+
+    def test_not_candidates(self):
+        self.assertEqual(self._inline('''
+            def fact(n):
+                if n <= 1:
+                    return 1
+                return n * fact(n - 1)
+            def ping(n):
+                return pong(n)
+            def pong(n):
+                return ping(n)
+            def deflt(n=1):
+                return n
+            def big(n):
+                return n + n + n + n + n + n + n + n + n + n + n + n + n + n
+            print(str(fact(3) + ping(1) + deflt() + big(1)))
+            ''', 8), (0, ["fact", "ping", "pong", "deflt", "big"]))
+
+class InlinedScriptTest(ScriptTestCase):
+    def test_locals_renamed(self):
+        self.assertAllOutput('''
+            def scale(n):
+                x = n * 10
+                return x + 1
+            x = 2
+            y = scale(x)
+            print(str(x) + " " + str(y))
+            ''')
+
+    def test_hoisted_order(self):
+        self.assertAllOutput('''
+            def show(s):
+                print(s)
+                return len(s)
+            total = show("ab") + show("cde")
+            print(str(total))
+            if show("x") > 0:
+                print("yes")
+            for c in range(show("yz")):
+                print(str(c))
+            ''')
+
+    def test_nested_calls(self):
+        self.assertAllOutput('''
+            def inc(n):
+                return n + 1
+            def twice(n):
+                return inc(inc(n))
+            def outer(n):
+                return twice(n) * 2
+            print(str(outer(1)))
+            ''')
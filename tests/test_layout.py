@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+import unittest
+from pytoshell.translator.layout import (
+    LOOP_WEIGHT, HotLayout, estimate_line_weights, load_profile)
+from pytoshell.translator.linker import Routine
+from .support import ScriptTestCase
+
+class LineWeightTest(unittest.TestCase):
+    def test_goto_loop(self):
+        self.assertEqual(estimate_line_weights(
+            ["echo a", ":LOOP", "echo b", "goto LOOP", "echo c"]),
+            [1, LOOP_WEIGHT, LOOP_WEIGHT, LOOP_WEIGHT, 1])
+
+    def test_for_block(self):
+        self.assertEqual(estimate_line_weights(
+            ["for %%i in (a b) do (", "echo %%i", ")", "echo c"]),
+            [LOOP_WEIGHT, LOOP_WEIGHT, LOOP_WEIGHT, 1])
+
+class HotLayoutTest(unittest.TestCase):
+    def _arrange(self, main_lines, profile=None):
+        routines = [
+            Routine("PYTSVa", [":PYTSVa", "goto :eof"]),
+            Routine("PYTSVb", [":PYTSVb", "call :PYTSVc", "goto :eof"]),
+            Routine("PYTSVc", [":PYTSVc", "goto :eof"]),
+        ]
+        order = HotLayout(profile).arrange(Routine("", main_lines), routines)
+        return [x.label for x in order]
+
+    def test_hot_callee_first(self):
+        self.assertEqual(self._arrange(
+            ["call :PYTSVa", ":LOOP", "call :PYTSVb", "goto LOOP"]),
+            ["PYTSVb", "PYTSVc", "PYTSVa"])
+
+    def test_uncalled_keep_order(self):
+        self.assertEqual(self._arrange(["call :PYTSVc"]), ["PYTSVc", "PYTSVa", "PYTSVb"])
+
+    def test_profile(self):
+        self.assertEqual(self._arrange(
+            ["call :PYTSVa", ":LOOP", "call :PYTSVb", "goto LOOP"],
+            {"pytsva": 1000, "pytsvb": 1}),
+            ["PYTSVa", "PYTSVb", "PYTSVc"])
+
+    def test_load_profile(self):
+        profile_file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        try:
+            with profile_file:
+                json.dump({"calls": {":PYTSVa": 3}}, profile_file)
+            self.assertEqual(load_profile(profile_file.name), {"pytsva": 3})
+        finally:
+            os.remove(profile_file.name)
+
+class HotScriptTest(ScriptTestCase):
+    def test_same_output(self):
+        self.assertBatchOutput('''
+            def inc(n):
+                return n + 1
+            def show(n):
+                print(str(n) * 2)
+            i = 0
+            while i < 4:
+                i = inc(i)
+                show(i)
+            ''', layout="hot", inline_threshold=0)
@@ -0,0 +1,70 @@
+import unittest
+from pytoshell.compiler import Compiler
+from pytoshell.translator.linker import Library, ShLibrary
+from .support import ScriptTestCase
+
+LIBRARY = [
+    ":: runtime",
+    ":PYTSVlen",
+    'set "@PYTSR-T=!%1-T!"',
+    "call :PYTSV%@PYTSR-T%.__len__ %1",
+    ":PYTSVstr.__len__",
+    'set "@PYTSR-T=int"',
+    "goto :eof",
+    ":PYTSVtuple.__len__",
+    "goto :eof",
+    ":PYTSVint.__str__",
+    'set "@PYTSR-T=str"',
+    "goto :eof",
+    ":PYTSVunused",
+    "call :PYTSVint.__str__",
+    "goto :eof",
+]
+
+class LibraryTest(unittest.TestCase):
+    def _resolve(self, *lines):
+        return [x.label for x in Library(LIBRARY).resolve(list(lines))]
+
+    def test_comment_prelude_dropped(self):
+        self.assertEqual(Library(LIBRARY).link([]), [])
+
+    def test_static_call(self):
+        self.assertEqual(self._resolve("call :PYTSVint.__str__"), ["PYTSVint.__str__"])
+
+    def test_dynamic_call_resolved_by_types(self):
+        # Only str values reach the dispatch site, tuple.__len__ stays out
+        self.assertEqual(self._resolve('set "x-T=str"', "call :PYTSVlen x"),
+                         ["PYTSVlen", "PYTSVstr.__len__"])
+
+    def test_unknown_call_keeps_everything(self):
+        self.assertEqual(len(self._resolve("call :%x%")), 5)
+
+    def test_sh_library(self):
+        library = ShLibrary([
+            "PYTSFlen() {",
+            '    PYTSF${2}___len__ "$1"',
+            "}",
+            "PYTSFstr___len__() {",
+            "    PYTSTR=int",
+            "}",
+            "PYTSFtuple___len__() {",
+            "    :",
+            "}",
+        ])
+        self.assertEqual([x.label for x in library.resolve(["PYTSFlen 'ab' str"])],
+                         ["PYTSFlen", "PYTSFstr___len__"])
+
+class LinkedScriptTest(ScriptTestCase):
+    def test_unreached_routines_left_out(self):
+        script = Compiler("bat").compile_source('print("a")\n')
+        self.assertNotIn(":PYTSVstr.__mul__", script)
+        self.assertNotIn(":PYTSVtuple.__getitem__", script)
+
+    def test_dynamic_dispatch_linked(self):
+        self.assertAllOutput('''
+            def size(x):
+                return len(x)
+            print(str(size("abc")))
+            print(str(size((1, 2))))
+            print(str("ab" * 3))
+            ''', inline_threshold=0)
@@ -0,0 +1,107 @@
+import ast
+import io
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+from pytoshell.compiler import Compiler
+from pytoshell.translator.modules import (
+    ModuleCache, ModuleUnit, find_module, get_digest, get_imported_names)
+from .support import run_batch
+
+class ModuleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, source):
+        path = os.path.join(self.directory, name)
+        with io.open(path, "w") as module_file:
+            module_file.write(textwrap.dedent(source))
+        return path
+
+class ImportTest(ModuleTestCase):
+    def test_imports(self):
+        self._write("shapes.py", '''
+            def area(w, h):
+                return w * h
+            ''')
+        self._write("helpers.py", '''
+            import shapes
+            count = 2
+            print("helpers loaded")
+            def inc(n):
+                return n + 1
+            def scaled(n):
+                return shapes.area(n, count)
+            ''')
+        path = self._write("main.py", '''
+            import helpers
+            import helpers as h
+            from helpers import inc as plus
+            from shapes import area
+            print(str(helpers.inc(1)))
+            print(str(plus(5) + area(2, 3)))
+            print(str(h.scaled(4)))
+            h.count = 10
+            print(str(helpers.scaled(4)))
+            ''')
+        with io.open(path) as main_file:
+            source = main_file.read()
+        self.assertEqual(run_batch(source, path), "helpers loaded\n2\n12\n8\n40\n")
+
+    def test_circular(self):
+        self._write("a.py", "import b\n")
+        self._write("b.py", "import a\n")
+        path = self._write("main.py", "import a\n")
+        with self.assertRaises(NotImplementedError):
+            Compiler("bat").compile_source("import a\n", path)
+
+    def test_not_local(self):
+        path = self._write("main.py", "import os\n")
+        with self.assertRaises(NotImplementedError):
+            Compiler("bat").compile_source("import os\n", path)
+
+    def test_retranslated_when_changed(self):
+        self._write("m.py", "def f():\n    return 1\n")
+        path = self._write("main.py", "import m\nprint(str(m.f()))\n")
+        compiler = Compiler("bat")
+        script = compiler.compile_source("import m\nprint(str(m.f()))\n", path)
+        self.assertEqual(compiler.compile_source("import m\nprint(str(m.f()))\n", path), script)
+        self._write("m.py", "def f():\n    return 2\n")
+        self.assertNotEqual(
+            compiler.compile_source("import m\nprint(str(m.f()))\n", path), script)
+
+class ModuleCacheTest(ModuleTestCase):
+    def test_get(self):
+        path = self._write("m.py", "x = 1\n")
+        with io.open(path, "rb") as module_file:
+            digest = get_digest(module_file.read())
+        cache = ModuleCache()
+        cache.put(ModuleUnit("m", path, [], False, {path: digest}, []), [self.directory])
+        self.assertIsNotNone(cache.get(path, [self.directory]))
+        self.assertIsNone(cache.get(path, ["elsewhere"]))
+        self._write("m.py", "x = 2\n")
+        self.assertIsNone(cache.get(path, [self.directory]))
+
+    def test_find_module(self):
+        os.mkdir(os.path.join(self.directory, "pkg"))
+        path = self._write(os.path.join("pkg", "__init__.py"), "")
+        self.assertEqual(find_module("pkg", [self.directory]), path)
+        self.assertIsNone(find_module("nothing", [self.directory]))
+
+class ImportedNamesTest(unittest.TestCase):
+    def _get(self, source):
+        return get_imported_names(ast.parse(textwrap.dedent(source)))
+
+    def test_order(self):
+        self.assertEqual(self._get("import b\nfrom a import x\nimport b, c\n"), ["b", "a", "c"])
+
+    def test_unsupported(self):
+        for source in ("from . import a\n", "from a import *\n", "def f():\n    import a\n"):
+            with self.subTest(source=source):
+                with self.assertRaises(NotImplementedError):
+                    self._get(source)
@@ -0,0 +1,77 @@
+import unittest
+from pytoshell.emulator import run
+from pytoshell.translator.peephole import (
+    CopyBackRule, DeadUnsetRule, IfElseJumpRule, InvertJumpRule, JoinRule,
+    JumpToNextRule, Peephole, UnreachableRule, UnusedLabelRule, count_commands)
+from .support import ScriptTestCase
+
+class RuleTest(unittest.TestCase):
+    def _check(self, rule, lines, expected):
+        # The rewrite keeps what the lines print
+        self.assertEqual(rule.apply(lines), expected)
+        self.assertEqual(run("\r\n".join(["@echo off"] + lines)).output,
+                         run("\r\n".join(["@echo off"] + expected)).output)
+
+    def test_if_else_jump(self):
+        self._check(IfElseJumpRule(),
+            ["if 1==1 (", "echo a", ") else (", "goto PYTSL1", ")", ":PYTSL1", "echo b"],
+            ["if 1==1 echo a", ":PYTSL1", "echo b"])
+
+    def test_jump_to_next(self):
+        self._check(JumpToNextRule(),
+            ["goto PYTSL1", ":PYTSL1", "echo a"], [":PYTSL1", "echo a"])
+
+    def test_invert_jump(self):
+        self._check(InvertJumpRule(),
+            ["if 1==2 goto PYTSL1", "goto PYTSL2", ":PYTSL1", "echo a", ":PYTSL2", "echo b"],
+            ["if NOT 1==2 goto PYTSL2", ":PYTSL1", "echo a", ":PYTSL2", "echo b"])
+
+    def test_unreachable(self):
+        self._check(UnreachableRule(),
+            ["goto PYTSL1", "echo a", ":PYTSL1", "echo b"],
+            ["goto PYTSL1", ":PYTSL1", "echo b"])
+
+    def test_unused_label(self):
+        self._check(UnusedLabelRule(), [":PYTSL1", "echo a"], ["echo a"])
+
+    def test_copy_back(self):
+        self._check(CopyBackRule(),
+            ['set "a=1"', 'set "b=%a%"', 'set "a=%b%"', "echo %a%"],
+            ['set "a=1"', 'set "b=%a%"', "echo %a%"])
+
+    def test_dead_unset(self):
+        self.assertEqual(DeadUnsetRule().apply(
+            ['set "@PYTSA1=" & set "@PYTSA1-T="', 'set "@PYTSVx=" & set "@PYTSVx-T="']),
+            ['set "@PYTSVx=" & set "@PYTSVx-T="'])
+
+    def test_join(self):
+        self._check(JoinRule(),
+            ['set "a=1"', 'set "b=2"', "echo %a%", "echo %b%"],
+            ['set "a=1" & set "b=2"', "echo %a%", "echo %b%"])
+
+    def test_unchanged_same_list(self):
+        lines = ["echo a"]
+        for rule in Peephole().rules:
+            self.assertIs(rule.apply(lines), lines)
+
+class PeepholeTest(unittest.TestCase):
+    def test_counts(self):
+        lines, line_count, command_count = Peephole().optimize(
+            ["goto PYTSL1", ":PYTSL1", 'set "a=1"', 'set "b=2"'])
+        self.assertEqual(lines, ['set "a=1" & set "b=2"'])
+        self.assertEqual((line_count, command_count), (3, 1))
+        self.assertEqual(count_commands(["if 1==1 (", "echo a & echo b", ")", ":L"]), 3)
+
+class OptimizedScriptTest(ScriptTestCase):
+    def test_same_output(self):
+        self.assertBatchOutput('''
+            i = 0
+            while i < 6:
+                if i > 4:
+                    break
+                if i == 2:
+                    print("two")
+                else:
+                    print(str(i))
+                i = i + 1
+            ''')
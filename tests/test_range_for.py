@@ -0,0 +1,50 @@
+import textwrap
+from pytoshell.compiler import Compiler
+from .support import ScriptTestCase
+
+class RangeForTest(ScriptTestCase):
+    def test_steps(self):
+        self.assertAllOutput('''
+            for i in range(3):
+                print(str(i))
+            for i in range(10, 0, -3):
+                print(str(i))
+            for i in range(5, 5):
+                print("never")
+            ''')
+
+    def test_in_function(self):
+        self.assertAllOutput('''
+            def count(n):
+                total = 0
+                for i in range(n):
+                    total = total + i
+                return total
+            print(str(count(5)))
+            print(str(count(0)))
+            ''', inline_threshold=0)
+
+    def test_break_keeps_variable(self):
+        self.assertAllOutput('''
+            for i in range(2, 8, 2):
+                if i == 6:
+                    break
+                print(str(i))
+            print(str(i))
+            ''')
+
+    def test_bound_evaluated_once(self):
+        self.assertAllOutput('''
+            n = 3
+            for j in range(n):
+                n = n + 1
+            print(str(n))
+            ''')
+
+    def test_for_l(self):
+        script = Compiler("bat").compile_source(textwrap.dedent('''
+            t = 0
+            for i in range(10):
+                t = t + i
+            '''))
+        self.assertIn("for /l %%", script)
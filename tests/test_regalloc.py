@@ -0,0 +1,74 @@
+import unittest
+from pytoshell.translator.regalloc import TempAllocator
+from .support import ScriptTestCase
+
+class TempAllocatorTest(unittest.TestCase):
+    def test_reuse(self):
+        lines, peak = TempAllocator().allocate([
+            'set "@PYTSA7=1"',
+            'echo %@PYTSA7%',
+            'set "@PYTSA7=" & set "@PYTSA7-T="',
+            'set "@PYTSA9=2"',
+            'echo %@PYTSA9%',
+        ])
+        self.assertEqual(lines, [
+            'set "@PYTSA1=1"', 'echo %@PYTSA1%', 'set "@PYTSA1=2"', 'echo %@PYTSA1%'])
+        self.assertEqual(peak, 1)
+
+    def test_overlapping(self):
+        lines, peak = TempAllocator().allocate([
+            'set "@PYTSA3=1"', 'set "@PYTSA4=2"', 'echo %@PYTSA3% %@PYTSA4%'])
+        self.assertEqual(lines[-1], 'echo %@PYTSA1% %@PYTSA2%')
+        self.assertEqual(peak, 2)
+
+    def test_alive_through_loop(self):
+        # @PYTSA1 is read again by the next iteration, @PYTSA2 can't reuse it
+        lines, peak = TempAllocator().allocate([
+            'set "@PYTSA1=1"',
+            ':LOOP',
+            'echo %@PYTSA1%',
+            'set "@PYTSA2=2"',
+            'goto LOOP',
+        ])
+        self.assertEqual(peak, 2)
+
+    def test_alive_through_for_body(self):
+        # The "for" line reads @PYTSA1 again after every call of the body
+        lines, peak = TempAllocator().allocate([
+            'set "@PYTSA1[0]=a" & set "@PYTSA1=1"',
+            'for /l %%i in (0,1,0) do (set "@PYTSVx=!@PYTSA1[%%i]!" & call :PYTSL1)',
+            'goto :PYTSL2',
+            ':PYTSL1',
+            'set "@PYTSA2=2"',
+            'exit /b %ERRORLEVEL%',
+            ':PYTSL2',
+            'set "@PYTSA3=3"',
+        ])
+        self.assertEqual(lines[4], 'set "@PYTSA2=2"')
+        self.assertEqual(lines[-1], 'set "@PYTSA1=3"')
+        self.assertEqual(peak, 2)
+
+    def test_excluded(self):
+        lines, peak = TempAllocator(excluded_ids=[1]).allocate([
+            'set "@PYTSA1=1"', 'set "@PYTSA5=2"'])
+        self.assertEqual(lines, ['set "@PYTSA1=1"', 'set "@PYTSA2=2"'])
+
+    def test_prefix(self):
+        lines, peak = TempAllocator(prefix="f.").allocate(['set "@PYTSA5=2"'])
+        self.assertEqual(lines, ['set "@PYTSAf.1=2"'])
+
+    def test_in_place(self):
+        lines = ['set "@PYTSA5=1"', 'set "@PYTSA5=" & set "@PYTSA5-T="']
+        self.assertIs(TempAllocator().allocate(lines)[0], lines)
+        self.assertEqual(lines, ['set "@PYTSA1=1"'])
+
+class AllocatedScriptTest(ScriptTestCase):
+    def test_same_output(self):
+        self.assertBatchOutput('''
+            def f(a, b):
+                return (a + b) * (a - b) + len(str(a)) * len(str(b))
+            i = 0
+            while i < 3:
+                print(str(f(i + 10, i)) + str(f(i, 2)))
+                i = i + 1
+            ''', inline_threshold=0)
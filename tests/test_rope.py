@@ -0,0 +1,122 @@
+import io
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+from pytoshell.compiler import Compiler, write_lines
+from pytoshell.translator.batch import CommandGenerator, Rope, Source
+
+class RopeTest(unittest.TestCase):
+    def test_order(self):
+        rope = Rope()
+        rope.append("c")
+        rope.prepend("b")
+        rope.append(["d", "e"])
+        rope.prepend(["a0", "a1"])
+        rope += "f"
+        self.assertEqual(list(rope), ["a0", "a1", "b", "c", "d", "e", "f"])
+
+    def test_nested(self):
+        inner = Rope()
+        inner.append("y")
+        inner.prepend("x")
+        plain = Rope()
+        plain.append("z")
+        outer = Rope()
+        outer.append(inner)
+        outer.prepend(plain)
+        outer.append(plain)
+        outer.prepend("w")
+        self.assertEqual(list(outer), ["w", "z", "x", "y", "z"])
+
+    def test_deep(self):
+        # Deeper than the recursion limit
+        rope = Rope()
+        rope.append("a")
+        for i in range(5000):
+            outer = Rope()
+            outer.prepend("b")
+            outer.append(rope)
+            rope = outer
+        self.assertEqual(len(list(rope)), 5001)
+
+    def test_empty(self):
+        rope = Rope()
+        self.assertFalse(rope)
+        rope.append([])
+        rope.prepend(Rope())
+        self.assertFalse(rope)
+        rope.append("a")
+        self.assertTrue(rope)
+
+class SourceTest(unittest.TestCase):
+    def test_append(self):
+        # Finalizers of appended sources run in reverse order
+        cg = CommandGenerator()
+        source = Source(cg)
+        source.add_initialize("i1")
+        source.add_finalize("f1")
+        for name in ("a", "b"):
+            other = Source(cg)
+            other.add_initialize("i" + name)
+            other.add_finalize("f" + name)
+            source.append(other)
+        source.add_initialize("i2")
+        self.assertEqual(list(source), ["i1", "ia", "ib", "i2", "fb", "fa", "f1"])
+
+    def test_temp_clearup(self):
+        cg = CommandGenerator()
+        source = Source(cg)
+        with source.start_temp_clearup():
+            first = source.create_temp_varaint()
+            other = Source(cg)
+            second = other.create_temp_varaint()
+            source.append(other)
+            source.add_initialize("body")
+        self.assertEqual(list(source), [
+            "body", cg.unset_variant(second), cg.unset_variant(first)])
+
+class WriteLinesTest(unittest.TestCase):
+    SOURCE = textwrap.dedent('''
+        def f(a, b):
+            return a * b + len(str(a))
+        for i in range(3):
+            print(str(f(i, 2)) + " x")
+        ''')
+
+    def _write(self, newline, write_func):
+        script_file = tempfile.NamedTemporaryFile("w", delete=False)
+        script_file.close()
+        try:
+            with io.open(script_file.name, "w", newline=newline) as stream:
+                write_func(stream)
+            with io.open(script_file.name, "rb") as stream:
+                return stream.read()
+        finally:
+            os.remove(script_file.name)
+
+    def test_same_as_joined(self):
+        compiler = Compiler("bat")
+        for newline in (None, "\n", "\r\n"):
+            with self.subTest(newline=newline):
+                streamed = self._write(newline, lambda x: write_lines(
+                    x, compiler.generate_source(self.SOURCE)))
+                joined = self._write(newline, lambda x: x.write(
+                    compiler.compile_source(self.SOURCE)))
+                self.assertEqual(streamed, joined)
+        self.assertIn(b"\r\n", streamed)
+
+    def test_compiled_file(self):
+        compiler = Compiler("bat")
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "a.py")
+            with io.open(path, "w") as source_file:
+                source_file.write(self.SOURCE)
+            compiler.compile_file(path, os.path.join(directory, "a.bat"))
+            with io.open(os.path.join(directory, "a.bat"), "rb") as script_file:
+                self.assertEqual(script_file.read(), self._write(
+                    None, lambda x: x.write(compiler.compile_source(self.SOURCE))))
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,81 @@
+import re
+import textwrap
+from pytoshell.compiler import Compiler
+from .support import SHELLS, ScriptTestCase
+
+class ShTranslatorTest(ScriptTestCase):
+    # Programs run by dash and bash
+    def assertShellOutput(self, source, **options):
+        for type_ in sorted(SHELLS.keys()):
+            with self.subTest(type_=type_):
+                super().assertShellOutput(source, type_, **options)
+
+    def test_objects(self):
+        self.assertShellOutput('''
+            class Counter:
+                def __init__(self, start):
+                    self.value = start
+                    self.name = "c d"
+                def add(self, n):
+                    self.value = self.value + n
+                    return self.value
+            c = Counter(3)
+            c.add(4)
+            print(c.name + " " + str(c.add(1)))
+            ''')
+
+    def test_recursion(self):
+        self.assertShellOutput('''
+            def fib(n):
+                if n < 2:
+                    return n
+                return fib(n - 1) + fib(n - 2)
+            print(str(fib(10)))
+            ''', inline_threshold=0)
+
+    def test_quoting(self):
+        self.assertShellOutput('''
+            s = "it's a \\"quote\\" $HOME `x` * \\\\"
+            print(s)
+            print(s + s[0:4])
+            ''')
+
+    def test_no_fork(self):
+        source = textwrap.dedent('''
+            def f(s, n):
+                return s * n + str(len(s))
+            print(f("ab", 3))
+            ''')
+        for type_ in sorted(SHELLS.keys()):
+            with self.subTest(type_=type_):
+                script = Compiler(type_, inline_threshold=0).compile_source(source)
+                # Arithmetic expansion only, no command substitution
+                self.assertIsNone(re.search(r'\$\((?!\()|`', script))
+
+class BashTranslatorTest(ScriptTestCase):
+    def test_attributes_in_array(self):
+        source = textwrap.dedent('''
+            class P:
+                def __init__(self, x, name):
+                    self.x = x
+                    self.name = name
+                def move(self, n):
+                    self.x = self.x + n
+            p = P(1, "a b")
+            q = P(10, "*")
+            p.move(2)
+            print(p.name + str(p.x) + q.name + str(q.x))
+            ''')
+        script = Compiler("bash").compile_source(source)
+        self.assertIn("PYTSD[", script)
+        self.assertShellOutput(source, "bash")
+
+    def test_tuples_in_array(self):
+        source = textwrap.dedent('''
+            t = (1, ("x", 2), "y z")
+            print(str(len(t)) + t[1][0] + t[2] + str(t[-2][1]))
+            for v in t[1]:
+                print(str(v))
+            ''')
+        self.assertIn("PYTSH[", Compiler("bash").compile_source(source))
+        self.assertShellOutput(source, "bash")
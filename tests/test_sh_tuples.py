@@ -0,0 +1,99 @@
+import shutil
+import subprocess
+import textwrap
+from pytoshell.compiler import Compiler
+from .support import SHELLS, ScriptTestCase
+
+class ShTupleTest(ScriptTestCase):
+    # Tuples of dash and bash scripts
+    def assertShellOutput(self, source, **options):
+        for type_ in sorted(SHELLS.keys()):
+            with self.subTest(type_=type_):
+                super().assertShellOutput(source, type_, **options)
+
+    def _run_after(self, type_, source, command):
+        # Output of command run after the script
+        if shutil.which(SHELLS[type_]) is None:
+            self.skipTest("%s isn't installed" % SHELLS[type_])
+        script = Compiler(type_, inline_threshold=0).compile_source(textwrap.dedent(source))
+        return subprocess.run(
+            [SHELLS[type_], "-c", script + "\n" + command],
+            stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+    def test_returned(self):
+        self.assertShellOutput('''
+            def mk(n):
+                return (n, n + 1)
+            a, b = mk(2)
+            print(str(a))
+            print(str(b))
+            t = mk(5)
+            print(str(t[0]) + " " + str(t[1]))
+            ''', inline_threshold=0)
+
+    def test_returned_local(self):
+        self.assertShellOutput('''
+            def wrap(t):
+                u = (t, len(t))
+                return u
+            def first(t):
+                return t[0]
+            w = wrap((1, "a b", 3))
+            print(first(w)[1])
+            print(str(w[1]))
+            ''', inline_threshold=0)
+
+    def test_built_in_loop(self):
+        self.assertShellOutput('''
+            def pair(n):
+                return (n, n * 2)
+            prev = pair(0)
+            total = 0
+            for i in range(20):
+                t = pair(i)
+                total = total + t[0] + t[1] + prev[1]
+                prev = t
+            print(str(total))
+            print(str(prev[0]))
+            ''', inline_threshold=0)
+
+    def test_recursion(self):
+        self.assertShellOutput('''
+            def f(n):
+                t = (n, n)
+                if n > 0:
+                    r = f(n - 1)
+                    return (t[0] + r[0], r[1])
+                return t
+            r = f(5)
+            print(str(r[0]))
+            print(str(r[1]))
+            ''', inline_threshold=0)
+
+    def test_attribute(self):
+        self.assertShellOutput('''
+            class P:
+                def __init__(self, x):
+                    self.pos = (x, x + 1)
+                def move(self):
+                    self.pos = (self.pos[1], self.pos[0])
+            p = P(3)
+            for i in range(5):
+                p.move()
+            print(str(p.pos[0]))
+            ''', inline_threshold=0)
+
+    def test_freed(self):
+        # Only the slots of the tuples t and prev hold are left
+        source = '''
+            def pair(n):
+                t = (n, (n, n))
+                return t
+            prev = pair(0)
+            for i in range(50):
+                t = pair(i)
+                pair(i)
+                prev = t
+            '''
+        self.assertEqual(self._run_after("sh", source, "set | grep -c '^PYTSH'"), "8\n")
+        self.assertEqual(self._run_after("bash", source, 'echo "${#PYTSH[@]}"'), "12\n")
@@ -0,0 +1,117 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+from pytoshell.console import Application
+from pytoshell.translator.layout import LOOP_WEIGHT
+from pytoshell.translator.stats import RoutineStats, collect_routine_stats, format_stats
+
+class RoutineStatsTest(unittest.TestCase):
+    def test_counts(self):
+        stats = collect_routine_stats("f", "PYTSVf", [
+            ":PYTSVf",
+            "setlocal",
+            ":LOOP",
+            "call :PYTSVg & call :PYTSVstr x",
+            "call :PYTSV%x-T%.__len__ x",
+            "if 1==1 goto LOOP",
+            "endlocal & exit /b",
+        ], set(["pytsvf", "pytsvg"]), 2, 3)
+        self.assertEqual(stats.to_dict(), {
+            "name": "f",
+            "label": "PYTSVf",
+            "lines": 7,
+            "commands": 7,
+            "weighted_commands": 1 + 4 * LOOP_WEIGHT + 2,
+            "user_calls": 1,
+            "runtime_calls": 1,
+            "dynamic_calls": 1,
+            "contexts": 1,
+            "temps": 2,
+            "removed_commands": 3,
+        })
+
+    def test_loop_body_weighted(self):
+        # The body is called by every iteration of the for line
+        stats = collect_routine_stats("<module>", "", [
+            "for /l %%i in (1,1,3) do call :PYTSL1",
+            "exit /b",
+            ":PYTSL1",
+            "echo a & echo b",
+            "exit /b",
+        ], set(["pytsl1"]))
+        self.assertEqual(stats.weighted_commands, LOOP_WEIGHT + 1 + 3 * LOOP_WEIGHT)
+        self.assertEqual(stats.user_calls, 1)
+
+    def test_format(self):
+        first = RoutineStats("<module>")
+        first.lines = 12
+        second = RoutineStats("f", "PYTSVf")
+        second.lines = 3
+        second.temps = 1
+        lines = format_stats("a.py", [first, second])
+        self.assertEqual(lines[0], "a.py")
+        self.assertEqual(lines[1].split(), ["routine"] + RoutineStats.FIELDS)
+        self.assertEqual(lines[2].split(), ["<module>", "12"] + ["0"] * 8)
+        self.assertEqual(lines[4].split(), ["(total)", "15"] + ["0"] * 6 + ["1", "0"])
+        # Columns are aligned
+        self.assertEqual(len(set([len(x) for x in lines[1:]])), 1)
+
+class StatsReportTest(unittest.TestCase):
+    SOURCE = textwrap.dedent('''
+        def inc(n):
+            return n + 1
+        i = 0
+        while i < 3:
+            i = inc(i)
+        print(str(i))
+        ''')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _run(self, *argv):
+        path = os.path.join(self.directory, "a.py")
+        with io.open(path, "w") as source_file:
+            source_file.write(self.SOURCE)
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(Application([
+                "-t", "bat", "--no-cache", "--stats", "--inline-threshold", "0",
+                path] + list(argv)).exec_(), 0)
+        return path, output.getvalue()
+
+    def test_json(self):
+        path, output = self._run("--stats-format", "json")
+        report = json.loads(output)
+        self.assertEqual(list(report.keys()), ["files"])
+        self.assertEqual(len(report["files"]), 1)
+
+        file_report = report["files"][0]
+        self.assertEqual(sorted(file_report.keys()), ["file_path", "routines", "total"])
+        self.assertEqual(file_report["file_path"], path)
+        self.assertEqual([x["name"] for x in file_report["routines"]], ["<module>", "inc"])
+        for routine in file_report["routines"] + [file_report["total"]]:
+            self.assertEqual(sorted(routine.keys()), sorted(["name", "label"] + RoutineStats.FIELDS))
+
+        module, inc = file_report["routines"]
+        self.assertEqual(inc["label"], "PYTSVinc")
+        self.assertEqual(module["user_calls"], 1)
+        self.assertEqual(module["contexts"], 1)
+        self.assertEqual(inc["contexts"], 0)
+        for field in RoutineStats.FIELDS:
+            self.assertEqual(file_report["total"][field], module[field] + inc[field])
+
+    def test_text(self):
+        path, output = self._run()
+        lines = output.splitlines()
+        self.assertEqual(lines[0], path)
+        self.assertEqual([x.split()[0] for x in lines[2:]], ["<module>", "inc", "(total)"])
@@ -0,0 +1,92 @@
+import textwrap
+from pytoshell.compiler import Compiler
+from .support import ScriptTestCase
+
+class StrLengthTest(ScriptTestCase):
+    def test_lengths(self):
+        self.assertAllOutput('''
+            def measure(s):
+                return len(s)
+            print(str(measure("")))
+            print(str(measure("x")))
+            print(str(measure("x" * 300)))
+            print(str(measure("abcdefgh" * 1000)))
+            ''', inline_threshold=0)
+
+    def test_cached_in_loop(self):
+        # The cached length is cleared whenever the variable is assigned
+        self.assertAllOutput('''
+            s = ""
+            n = 0
+            while n < 5:
+                s = s + "ab"
+                print(str(len(s)))
+                n = n + 1
+            for word in ("one", "three", ""):
+                print(str(len(word)))
+            ''')
+
+    def test_cached_routine(self):
+        script = Compiler("bat").compile_source(textwrap.dedent('''
+            s = "abc"
+            i = 0
+            while i < len(s):
+                i = i + 1
+            '''))
+        self.assertIn("call :PYTSVlen.cached", script)
+
+    def test_index(self):
+        self.assertAllOutput('''
+            big = "abcdefgh" * 1000
+            s = "a b c"
+            print(big[4095] + big[-1] + s[-2])
+            i = 0
+            while i < len(s):
+                print("[" + s[i] + "]")
+                i = i + 1
+            ''')
+
+class StrSliceTest(ScriptTestCase):
+    def test_constant_bounds(self):
+        self.assertAllOutput('''
+            s = "abcdefghij"
+            print(s[2:5])
+            print(s[:3])
+            print(s[7:])
+            print(s[-3:])
+            print(s[-8:6])
+            print(s[3:-2])
+            print("[" + s[5:2] + "]")
+            print(s[-100:100])
+            ''')
+
+    def test_steps(self):
+        self.assertAllOutput('''
+            s = "abcdefghij"
+            print(s[::2])
+            print(s[8:1:-2])
+            print(s[::-1])
+            ''')
+
+    def test_substring(self):
+        script = Compiler("bat").compile_source('s = "abcdefghij"\nprint(s[2:5])\n')
+        self.assertIn("!@PYTSVs:~2,3!", script)
+
+    def test_runtime_bounds(self):
+        self.assertAllOutput('''
+            def cut(t, a, b):
+                return t[a:b]
+            print(cut("abcdefghij", 1, -1))
+            print(cut("x y", 0, 2))
+            ''', inline_threshold=0)
+
+class StrMulTest(ScriptTestCase):
+    def test_mul(self):
+        self.assertAllOutput('''
+            n = 3
+            print("ab" * 0 + ".")
+            print("ab" * 5)
+            print("-" * n)
+            print(str(2 * "cd"))
+            print(str(len("xyz" * 1000)))
+            ''')
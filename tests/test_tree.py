@@ -0,0 +1,63 @@
+import ast
+import textwrap
+import unittest
+from pytoshell.translator.tree import NodeIndex
+from .support import SHELLS, ScriptTestCase
+
+class NodeIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.root = ast.parse(textwrap.dedent('''
+            if a:
+                b = 1
+            else:
+                c = 2
+                d = 3
+            '''))
+        self.nodes = NodeIndex(self.root)
+        self.if_ = self.root.body[0]
+
+    def test_parent(self):
+        self.assertIsNone(self.nodes.get_parent(self.root))
+        self.assertIs(self.nodes.get_parent(self.if_), self.root)
+        self.assertIs(self.nodes.get_parent(self.if_.orelse[1]), self.if_)
+        self.assertIs(self.nodes.get_parent(self.if_.test), self.if_)
+        self.assertIsNone(self.nodes.get_parent(ast.Load()))
+
+    def test_field(self):
+        self.assertEqual(self.nodes.get_field(self.if_.orelse[1]), ("orelse", 1))
+        self.assertEqual(self.nodes.get_field(self.if_.test), ("test", None))
+        self.assertEqual(self.nodes.get_field(self.root), (None, None))
+
+    def test_siblings(self):
+        first, second = self.if_.orelse
+        self.assertIs(self.nodes.get_next_sibling(first), second)
+        self.assertIs(self.nodes.get_prev_sibling(second), first)
+        self.assertIsNone(self.nodes.get_prev_sibling(first))
+        self.assertIsNone(self.nodes.get_next_sibling(self.if_.test))
+
+    def test_deep_tree(self):
+        # Deeper than the recursion limit
+        node = ast.Name(id="x", ctx=ast.Load())
+        leaf = node
+        for i in range(5000):
+            node = ast.UnaryOp(op=ast.USub(), operand=node)
+        self.assertIs(NodeIndex(node).get_parent(leaf).operand, leaf)
+
+class MethodScriptTest(ScriptTestCase):
+    def test_methods_named_after_class(self):
+        # A method is told apart from a function by its parent. Batch
+        # scripts can't create objects.
+        source = '''
+            def get(n):
+                return n
+            class Box:
+                def __init__(self, n):
+                    self.n = n
+                def get(self):
+                    return self.n + 1
+            b = Box(2)
+            print(str(get(5) + b.get()))
+            '''
+        for type_ in sorted(SHELLS.keys()):
+            with self.subTest(type_=type_):
+                self.assertShellOutput(source, type_, inline_threshold=0)
@@ -0,0 +1,63 @@
+import textwrap
+from pytoshell.compiler import Compiler
+from .support import ScriptTestCase
+
+class TupleForTest(ScriptTestCase):
+    def test_long_tuple(self):
+        # Longer than the 31 tokens "for /f" could split
+        self.assertAllOutput('''
+            t = (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17,
+                 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32, 33)
+            total = 0
+            for x in t:
+                total = total + x
+            print(str(total))
+            print(str(t[32]))
+            ''')
+
+    def test_elements_with_spaces(self):
+        self.assertAllOutput('''
+            for word in ("a b", "c", " d "):
+                print("[" + word + "]")
+            ''')
+
+    def test_literal_evaluated_first(self):
+        self.assertAllOutput('''
+            n = 1
+            for x in (n, n + 1):
+                n = n * 10
+                print(str(x))
+            print(str(n))
+            ''')
+
+    def test_break_in_function(self):
+        self.assertAllOutput('''
+            def find(t, value):
+                i = 0
+                for x in t:
+                    if x == value:
+                        break
+                    i = i + 1
+                return i
+            t = ("a", "b", "c")
+            print(str(find(t, "b")))
+            print(str(find(t, "z")))
+            ''', inline_threshold=0)
+
+    def test_literal_read_by_every_pass(self):
+        # The body must not reuse the temporary the tuple is stored in
+        self.assertAllOutput('''
+            a = 1
+            for x in (a, 2, 3, 4, 5, 6):
+                y = x + 1
+                print(str((y * 100, 7)[0]))
+                print(str(x))
+            ''')
+
+    def test_no_getitem(self):
+        script = Compiler("bat").compile_source(textwrap.dedent('''
+            t = ("a", "b c")
+            for x in t:
+                print(x)
+            '''))
+        self.assertNotIn("__getitem__", script)
@@ -0,0 +1,81 @@
+import ast
+import textwrap
+import unittest
+from pytoshell.compiler import Compiler
+from pytoshell.translator.typeinfer import TypeInference
+from .support import ScriptTestCase
+
+class TypeInferenceTest(unittest.TestCase):
+    def _infer(self, source):
+        node = ast.parse(textwrap.dedent(source))
+        return node, TypeInference().infer(node)
+
+    def _get_loads(self, node, name):
+        return [x for x in ast.walk(node)
+                if isinstance(x, ast.Name) and x.id == name and isinstance(x.ctx, ast.Load)]
+
+    def test_int_expression(self):
+        node, types = self._infer("a = 1\nb = a * 2 + len('x')\n")
+        self.assertEqual(types.get_type(node.body[1].value), "int")
+        self.assertFalse(types.is_typed(node.body[1].targets[0]))
+
+    def test_if_merge(self):
+        node, types = self._infer('''
+            a = 1
+            if a > 0:
+                a = "x"
+            b = a
+            ''')
+        self.assertIsNone(types.get_type(node.body[-1].value))
+        self.assertTrue(types.is_typed(node.body[-1].value))
+
+    def test_loop_fixed_point(self):
+        node, types = self._infer('''
+            a = 0
+            while a < 3:
+                b = a
+                a = str(a)
+            ''')
+        self.assertIsNone(types.get_type(node.body[1].body[0].value))
+
+    def test_parameter_unknown(self):
+        node, types = self._infer('''
+            def f(n):
+                return n + 1
+            ''')
+        self.assertIsNone(types.get_type(self._get_loads(node, "n")[0]))
+
+    def test_read_by_function_keeps_tag(self):
+        node, types = self._infer('''
+            a = 1
+            def f():
+                return a
+            ''')
+        self.assertTrue(types.is_typed(node.body[0].targets[0]))
+
+    def test_bound(self):
+        node, types = self._infer("def len(x):\n    return 0\n")
+        self.assertTrue(types.is_bound("len"))
+        self.assertFalse(types.is_bound("str"))
+
+class TypedScriptTest(ScriptTestCase):
+    def test_inline_arithmetic(self):
+        source = '''
+            a = 6
+            b = a * 7 - 2
+            print(str(b))
+            '''
+        script = Compiler("bat").compile_source(textwrap.dedent(source))
+        self.assertNotIn("__mul__", script)
+        self.assertAllOutput(source)
+
+    def test_mixed_types(self):
+        self.assertAllOutput('''
+            def twice(x):
+                return x * 2
+            a = 3
+            if a > 2:
+                a = "ab"
+            print(twice(a))
+            print(str(twice(4)))
+            ''', inline_threshold=0)